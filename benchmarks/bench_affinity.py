@@ -0,0 +1,82 @@
+"""
+Candidate lookup: linear passes_affinity scan vs the bitset AffinityIndex.
+
+    python -m benchmarks.bench_affinity --workers 1000,10000 --jobs 2000
+"""
+import argparse
+import random
+import time
+
+from scheduler.utils.affinity import passes_affinity
+from scheduler.utils.affinity_index import AffinityIndex, compile_affinity
+
+OSES = ["linux", "windows", "darwin"]
+TAGS = [f"tag{i}" for i in range(40)]
+DEPLOYMENTS = ["docker", "kubernetes", "vm"]
+USERS = [f"user{i}" for i in range(20)]
+
+
+def make_fleet(rng: random.Random, count: int):
+    return [
+        {
+            "worker_id": f"w{i}",
+            "os": rng.choice(OSES),
+            "tags": rng.sample(TAGS, 4),
+            "allowed_users": rng.sample(USERS, 3) if rng.random() < 0.3 else [],
+            "hostname": f"host-{i}",
+            "subnet": f"10.0.{i % 64}",
+            "deployment_type": rng.choice(DEPLOYMENTS),
+        }
+        for i in range(count)
+    ]
+
+
+def make_jobs(rng: random.Random, count: int):
+    return [
+        {
+            "user": rng.choice(USERS),
+            "affinity": {
+                "os": [rng.choice(OSES)] if rng.random() < 0.8 else [],
+                "tags": rng.sample(TAGS, rng.randint(0, 2)),
+                "deployment_types": [rng.choice(DEPLOYMENTS)] if rng.random() < 0.5 else [],
+            },
+        }
+        for _ in range(count)
+    ]
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--workers", default="1000,10000")
+    parser.add_argument("--jobs", type=int, default=2000)
+    parser.add_argument("--seed", type=int, default=1)
+    args = parser.parse_args()
+    print(f"{'workers':>8} {'scan us/job':>12} {'index us/job':>13} {'build ms':>9} {'speedup':>8}")
+    for count in [int(c) for c in args.workers.split(",")]:
+        rng = random.Random(args.seed)
+        fleet = make_fleet(rng, count)
+        jobs = make_jobs(rng, args.jobs)
+
+        start = time.perf_counter()
+        index = AffinityIndex()
+        for worker in fleet:
+            index.update_worker(worker)
+        build = time.perf_counter() - start
+
+        start = time.perf_counter()
+        scan_hits = sum(len([w for w in fleet if passes_affinity(job, w)]) for job in jobs)
+        scan = time.perf_counter() - start
+
+        start = time.perf_counter()
+        index_hits = sum(len(index.candidates(compile_affinity(job))) for job in jobs)
+        indexed = time.perf_counter() - start
+
+        assert scan_hits == index_hits, "index disagrees with passes_affinity"
+        print(
+            f"{count:>8} {scan / len(jobs) * 1e6:>12.1f} {indexed / len(jobs) * 1e6:>13.1f} "
+            f"{build * 1000:>9.1f} {scan / indexed:>7.1f}x"
+        )
+
+
+if __name__ == "__main__":
+    main()
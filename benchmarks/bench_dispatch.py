@@ -0,0 +1,87 @@
+"""
+Dispatch throughput: batch mode vs single-job mode.
+
+    python -m benchmarks.bench_dispatch --jobs 10000 --workers 200 --rtt-ms 0.2
+
+Runs the real pop/place/push code from scheduler.scheduler against in-process
+Redis/Mongo stand-ins that charge a simulated round trip per command.
+"""
+import argparse
+import os
+import time
+from unittest.mock import patch
+
+os.environ.setdefault("LOG_LEVEL", "WARNING")
+
+from benchmarks.common import FakeDB, FakeRedis  # noqa: E402
+from scheduler import scheduler as sched  # noqa: E402
+from scheduler.worker_registry import WorkerRegistry  # noqa: E402
+
+
+def _seed(r: FakeRedis, db: FakeDB, jobs: int, workers: int, domain: str = "prod"):
+    now = time.time()
+    for i in range(workers):
+        wid = f"w{i}"
+        r.hashes[f"workers:{domain}:{wid}"] = {
+            "os": "linux",
+            "tags": "cpu",
+            "max_concurrency": str(jobs),
+            "current_running": "0",
+            "state": "online",
+        }
+        r.zsets.setdefault(f"worker_heartbeats:{domain}", {})[wid] = now + 3600
+    db.job_definitions.insert_many(
+        [{"_id": f"job-{i}", "domain": domain, "priority": 5, "affinity": {"os": ["linux"]}} for i in range(jobs)]
+    )
+    r.zsets[f"job_queue:{domain}:pending"] = {f"job-{i}": 5.0 for i in range(jobs)}
+    r.sets["hydra:domains"] = {domain}
+
+
+def run(batch_size: int, jobs: int, workers: int, rtt: float) -> dict:
+    r = FakeRedis(rtt)
+    db = FakeDB(rtt)
+    _seed(r, db, jobs, workers)
+    registry = WorkerRegistry()
+    pending_keys = ["job_queue:prod:pending"]
+    dispatched = 0
+    with patch("scheduler.worker_registry.get_redis", return_value=r), patch(
+        "scheduler.utils.reservation.get_redis", return_value=r
+    ), patch("scheduler.utils.reservation._reserve_script", None), patch.object(sched, "worker_registry", registry):
+        registry.reconcile("prod")
+        r.counter.round_trips = 0
+        start = time.perf_counter()
+        while True:
+            popped = sched.pop_pending_batch(r, pending_keys, batch_size, max_wait=0.0, timeout=0)
+            if not popped:
+                break
+            placed, _unplaced = sched.dispatch_batch(r, db, popped, ttl=10)
+            dispatched += len(placed)
+        elapsed = time.perf_counter() - start
+    return {
+        "batch_size": batch_size,
+        "dispatched": dispatched,
+        "seconds": elapsed,
+        "jobs_per_sec": dispatched / elapsed if elapsed else float("inf"),
+        "round_trips": r.counter.round_trips + db.counter.round_trips,
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--jobs", type=int, default=10000)
+    parser.add_argument("--workers", type=int, default=200)
+    parser.add_argument("--rtt-ms", type=float, default=0.2, help="simulated Redis/Mongo round trip")
+    parser.add_argument("--batch-sizes", default="1,10,100,500")
+    args = parser.parse_args()
+    rtt = args.rtt_ms / 1000.0
+    print(f"{'batch':>6} {'jobs':>7} {'seconds':>9} {'jobs/s':>10} {'round trips':>12}")
+    for batch_size in [int(b) for b in args.batch_sizes.split(",")]:
+        res = run(batch_size, args.jobs, args.workers, rtt)
+        print(
+            f"{res['batch_size']:>6} {res['dispatched']:>7} {res['seconds']:>9.3f} "
+            f"{res['jobs_per_sec']:>10.0f} {res['round_trips']:>12}"
+        )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,118 @@
+"""
+Worker execution engines: a thread per job vs. one asyncio event loop.
+
+    python -m benchmarks.bench_engine --jobs 1000 --sleep 1
+
+Starts --jobs lightweight shell jobs at once (print a line, sleep, print a line) the way
+each engine runs them: the thread engine submits _run_with_callbacks to a pool with one
+thread per job (plus its two pipe-drain threads), the asyncio engine gathers
+_run_with_callbacks_async on one loop. Output lines go to a per-job callback standing in
+for the log shipper. Each engine is measured in a fresh interpreter so peak RSS and thread
+counts do not leak between them; child processes are not counted in RSS.
+"""
+import argparse
+import asyncio
+import json
+import resource
+import subprocess
+import sys
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from typing import Dict
+
+from worker.utils.os_exec import _run_with_callbacks, _run_with_callbacks_async, install_child_watcher
+
+
+def _script(sleep: float) -> list:
+    return ["/bin/sh", "-c", f"echo start; sleep {sleep}; echo done"]
+
+
+class ThreadSampler:
+    def __init__(self, interval: float = 0.01):
+        self.interval = interval
+        self.peak = threading.active_count()
+        self._stop = threading.Event()
+        self._thread = threading.Thread(target=self._run, daemon=True)
+
+    def _run(self):
+        while not self._stop.wait(self.interval):
+            self.peak = max(self.peak, threading.active_count())
+
+    def __enter__(self):
+        self._thread.start()
+        return self
+
+    def __exit__(self, *_exc):
+        self._stop.set()
+        self._thread.join()
+
+
+def run_threads(jobs: int, sleep: float) -> Dict:
+    lines = []
+    cmd = _script(sleep)
+    with ThreadSampler() as sampler:
+        started = time.monotonic()
+        with ThreadPoolExecutor(max_workers=jobs) as pool:
+            futures = [pool.submit(_run_with_callbacks, cmd, None, None, None, lines.append) for _ in range(jobs)]
+            failed = sum(f.result()[0] != 0 for f in futures)
+        elapsed = time.monotonic() - started
+    return {"engine": "thread", "seconds": elapsed, "failed": failed, "lines": len(lines), "peak_threads": sampler.peak}
+
+
+def run_asyncio(jobs: int, sleep: float) -> Dict:
+    lines = []
+    cmd = _script(sleep)
+
+    async def main():
+        install_child_watcher(asyncio.get_running_loop())
+        results = await asyncio.gather(*(_run_with_callbacks_async(cmd, None, None, None, lines.append) for _ in range(jobs)))
+        return sum(rc != 0 for rc, _out, _err in results)
+
+    with ThreadSampler() as sampler:
+        started = time.monotonic()
+        failed = asyncio.run(main())
+        elapsed = time.monotonic() - started
+    return {"engine": "asyncio", "seconds": elapsed, "failed": failed, "lines": len(lines), "peak_threads": sampler.peak}
+
+
+def _raise_fd_limit():
+    # Two pipe ends per job stay open in the worker while it runs
+    soft, hard = resource.getrlimit(resource.RLIMIT_NOFILE)
+    if soft != hard:
+        resource.setrlimit(resource.RLIMIT_NOFILE, (hard, hard))
+
+
+def _child(engine: str, jobs: int, sleep: float):
+    _raise_fd_limit()
+    res = (run_threads if engine == "thread" else run_asyncio)(jobs, sleep)
+    res["peak_rss_mb"] = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024.0
+    print(json.dumps(res))
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--jobs", type=int, default=500)
+    parser.add_argument("--sleep", type=float, default=1.0, help="seconds each job sleeps between its two lines")
+    parser.add_argument("--engine", choices=["thread", "asyncio"], help=argparse.SUPPRESS)
+    args = parser.parse_args()
+    if args.engine:
+        _child(args.engine, args.jobs, args.sleep)
+        return
+    print(f"{'engine':>8} {'jobs':>6} {'seconds':>8} {'jobs/s':>8} {'threads':>8} {'RSS MB':>8} {'failed':>7}")
+    for engine in ("thread", "asyncio"):
+        out = subprocess.run(
+            [sys.executable, "-m", "benchmarks.bench_engine", "--engine", engine, "--jobs", str(args.jobs), "--sleep", str(args.sleep)],
+            check=True,
+            stdout=subprocess.PIPE,
+            text=True,
+        )
+        res = json.loads(out.stdout.strip().splitlines()[-1])
+        print(
+            f"{res['engine']:>8} {args.jobs:>6} {res['seconds']:>8.2f} {args.jobs / res['seconds']:>8.0f} "
+            f"{res['peak_threads']:>8} {res['peak_rss_mb']:>8.1f} {res['failed']:>7}"
+        )
+
+
+if __name__ == "__main__":
+    main()
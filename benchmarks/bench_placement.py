@@ -0,0 +1,72 @@
+"""
+Placement strategies: decisions per second and placement quality.
+
+    python -m benchmarks.bench_placement --workers 1000 --jobs 5000
+
+Each strategy places the same stream of jobs onto the same heterogeneous fleet
+(no completions). Quality columns:
+  busy      workers with at least one job (lower = more workers free to scale down)
+  util_std  standard deviation of per-worker utilization (lower = more even spread)
+  cpu_std   standard deviation of jobs per CPU (lower = better CPU weighting)
+"""
+import argparse
+import random
+import statistics
+import time
+
+from scheduler.utils.selectors import STRATEGIES, select_best_worker
+
+
+def make_fleet(rng: random.Random, count: int):
+    fleet = []
+    for i in range(count):
+        cpus = rng.choice([2, 4, 8, 16, 32])
+        fleet.append(
+            {"worker_id": f"w{i}", "cpu_count": cpus, "max_concurrency": cpus * 2, "current_running": 0, "reserved": 0}
+        )
+    return fleet
+
+
+def run(strategy: str, workers: int, jobs: int, seed: int) -> dict:
+    rng = random.Random(seed)
+    fleet = make_fleet(rng, workers)
+    placed = 0
+    elapsed = 0.0
+    for _ in range(jobs):
+        candidates = [w for w in fleet if w["current_running"] < w["max_concurrency"]]
+        start = time.perf_counter()
+        worker = select_best_worker(candidates, strategy)
+        elapsed += time.perf_counter() - start
+        if not worker:
+            break
+        worker["current_running"] += 1
+        placed += 1
+    utilization = [w["current_running"] / w["max_concurrency"] for w in fleet]
+    per_cpu = [w["current_running"] / w["cpu_count"] for w in fleet]
+    return {
+        "strategy": strategy,
+        "placed": placed,
+        "decisions_per_sec": placed / elapsed if elapsed else float("inf"),
+        "busy": sum(1 for w in fleet if w["current_running"]),
+        "util_std": statistics.pstdev(utilization),
+        "cpu_std": statistics.pstdev(per_cpu),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--workers", type=int, default=1000)
+    parser.add_argument("--jobs", type=int, default=5000)
+    parser.add_argument("--seed", type=int, default=1)
+    args = parser.parse_args()
+    print(f"{'strategy':>9} {'placed':>7} {'decisions/s':>12} {'busy':>6} {'util_std':>9} {'cpu_std':>8}")
+    for strategy in STRATEGIES:
+        res = run(strategy, args.workers, args.jobs, args.seed)
+        print(
+            f"{res['strategy']:>9} {res['placed']:>7} {res['decisions_per_sec']:>12.0f} {res['busy']:>6} "
+            f"{res['util_std']:>9.3f} {res['cpu_std']:>8.3f}"
+        )
+
+
+if __name__ == "__main__":
+    main()
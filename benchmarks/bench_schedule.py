@@ -0,0 +1,211 @@
+"""
+Schedule triggers: timer heap vs. polling Mongo every second.
+
+    python -m benchmarks.bench_schedule --jobs 5000 --hours 2 --rtt-ms 0.5
+
+Simulates a fleet of interval and cron schedules on a fake clock. The poll mode
+replays the old loop (one query per domain per second, limit 100, then one
+find_one_and_update per due job); the timer mode drives the real ScheduleTimers
+heap and fire_due_schedules. Each Mongo round trip advances the fake clock by
+--rtt-ms, so firing lateness reflects both the wake-up strategy and DB work.
+"""
+import argparse
+import os
+import random
+from datetime import datetime, timedelta
+from typing import Dict, List
+from unittest.mock import patch
+
+os.environ.setdefault("LOG_LEVEL", "WARNING")
+
+from benchmarks.common import FakeRedis, RoundTripCounter  # noqa: E402
+from scheduler import scheduler as sched  # noqa: E402
+from scheduler.models.job_definition import ScheduleConfig  # noqa: E402
+from scheduler.schedule_timers import ScheduleTimers  # noqa: E402
+from scheduler.utils.schedule import initialize_schedule, plan_schedule_fire  # noqa: E402
+
+
+class FakeClock:
+    def __init__(self, start: datetime, rtt: float):
+        self.now = start
+        self.rtt = timedelta(seconds=rtt)
+
+    def charge(self, hops: int = 1):
+        self.now += self.rtt * hops
+
+
+class Cursor(list):
+    def limit(self, n: int) -> "Cursor":
+        return Cursor(self[:n])
+
+
+class UpdateResult:
+    def __init__(self, matched: int):
+        self.matched_count = matched
+
+
+class ScheduleCollection:
+    """Just enough of a job_definitions collection for the trigger paths; every call charges the clock."""
+
+    def __init__(self, clock: FakeClock, counter: RoundTripCounter):
+        self.clock = clock
+        self.counter = counter
+        self.docs: Dict[str, Dict] = {}
+
+    def _hop(self):
+        self.counter.hop()
+        self.clock.charge()
+
+    @staticmethod
+    def _matches(doc: Dict, query: Dict) -> bool:
+        schedule = doc.get("schedule") or {}
+        ids = (query.get("_id") or {}).get("$in") if isinstance(query.get("_id"), dict) else None
+        if ids is not None and doc["_id"] not in ids:
+            return False
+        if isinstance(query.get("_id"), str) and doc["_id"] != query["_id"]:
+            return False
+        if "domain" in query and doc.get("domain") != query["domain"]:
+            return False
+        if "schedule.enabled" in query and not schedule.get("enabled"):
+            return False
+        due = query.get("schedule.next_run_at")
+        if isinstance(due, dict):
+            if schedule.get("next_run_at") is None:
+                return False
+            if "$lte" in due and schedule["next_run_at"] > due["$lte"]:
+                return False
+        elif due is not None and schedule.get("next_run_at") != due:
+            return False
+        return True
+
+    def find(self, query: Dict, projection=None) -> Cursor:
+        self._hop()
+        return Cursor(doc for doc in self.docs.values() if self._matches(doc, query))
+
+    def find_one(self, query: Dict, projection=None):
+        self._hop()
+        return next((doc for doc in self.docs.values() if self._matches(doc, query)), None)
+
+    def _update(self, query: Dict, update: Dict) -> bool:
+        doc = self.docs.get(query["_id"])
+        if not doc or not self._matches(doc, query):
+            return False
+        doc.update(update["$set"])
+        return True
+
+    def find_one_and_update(self, query: Dict, update: Dict, **_kwargs):
+        self._hop()
+        return self.docs[query["_id"]] if self._update(query, update) else None
+
+    def bulk_write(self, ops, ordered=True) -> UpdateResult:
+        self._hop()
+        return UpdateResult(sum(self._update(op._filter, op._doc) for op in ops))
+
+
+class FakeDB:
+    def __init__(self, clock: FakeClock):
+        self.counter = RoundTripCounter()
+        self.job_definitions = ScheduleCollection(clock, self.counter)
+
+
+def _seed(db: FakeDB, jobs: int, start: datetime, seed: int = 7):
+    rng = random.Random(seed)
+    for i in range(jobs):
+        if i % 2:
+            schedule = ScheduleConfig(mode="interval", interval_seconds=rng.choice([30, 60, 300, 900, 3600]))
+        else:
+            schedule = ScheduleConfig(mode="cron", cron=rng.choice(["* * * * *", "*/5 * * * *", "0 * * * *", "*/15 * * * *"]))
+        schedule = initialize_schedule(schedule, start + timedelta(seconds=rng.uniform(0, 60)), f"job-{i}")
+        db.job_definitions.docs[f"job-{i}"] = {
+            "_id": f"job-{i}",
+            "domain": "prod",
+            "priority": 5,
+            "schedule": schedule.model_dump(by_alias=True),
+        }
+
+
+def _record(lateness: List[float], due: datetime, now: datetime):
+    lateness.append(max((now - due).total_seconds(), 0.0))
+
+
+def run_poll(jobs: int, seconds: int, rtt: float, start: datetime) -> Dict:
+    clock = FakeClock(start, rtt)
+    db = FakeDB(clock)
+    _seed(db, jobs, start)
+    lateness: List[float] = []
+    tick = start
+    end = start + timedelta(seconds=seconds)
+    while tick < end:
+        clock.now = max(clock.now, tick)
+        for job in db.job_definitions.find(
+            {"domain": "prod", "schedule.enabled": True, "schedule.next_run_at": {"$ne": None, "$lte": clock.now}}
+        ).limit(100):
+            schedule_doc = job["schedule"]
+            firing = plan_schedule_fire(ScheduleConfig.model_validate(schedule_doc), clock.now, job["_id"])
+            updated = db.job_definitions.find_one_and_update(
+                {"_id": job["_id"], "schedule.next_run_at": schedule_doc["next_run_at"]},
+                {"$set": {"schedule": firing.schedule.model_dump(by_alias=True)}},
+            )
+            if updated and firing.fire:
+                _record(lateness, schedule_doc["next_run_at"], clock.now)
+        tick += timedelta(seconds=1)
+    return _summary("poll", db, lateness, seconds)
+
+
+def run_timers(jobs: int, seconds: int, rtt: float, start: datetime) -> Dict:
+    clock = FakeClock(start, rtt)
+    db = FakeDB(clock)
+    _seed(db, jobs, start)
+    timers = ScheduleTimers()
+    timers.load(db)
+    r = FakeRedis()
+    lateness: List[float] = []
+    end = start + timedelta(seconds=seconds)
+    with patch.object(sched.event_bus, "publish"):
+        while clock.now < end:
+            due = timers.pop_due(clock.now)
+            if due:
+                sched.fire_due_schedules(r, db, timers, due, fence=1, now=clock.now)
+                for _job, when in due:
+                    _record(lateness, when, clock.now)
+                continue
+            next_due = timers.next_due()
+            if next_due is None:
+                break
+            # "Sleep" exactly until the next due time
+            clock.now = max(clock.now, next_due)
+    return _summary("timers", db, lateness, seconds)
+
+
+def _summary(mode: str, db: FakeDB, lateness: List[float], seconds: int) -> Dict:
+    ordered = sorted(lateness) or [0.0]
+    return {
+        "mode": mode,
+        "fired": len(lateness),
+        "mongo_round_trips": db.counter.round_trips,
+        "round_trips_per_sec": db.counter.round_trips / seconds,
+        "mean_late_ms": 1000 * sum(ordered) / len(ordered),
+        "p99_late_ms": 1000 * ordered[int(0.99 * (len(ordered) - 1))],
+        "max_late_ms": 1000 * ordered[-1],
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--jobs", type=int, default=5000)
+    parser.add_argument("--hours", type=float, default=1.0)
+    parser.add_argument("--rtt-ms", type=float, default=0.5, help="simulated Mongo round trip")
+    args = parser.parse_args()
+    start = datetime(2024, 1, 1)
+    seconds = int(args.hours * 3600)
+    rtt = args.rtt_ms / 1000.0
+    print(f"{'mode':>7} {'fired':>8} {'mongo RTs':>10} {'RT/s':>8} {'mean late ms':>13} {'p99 late ms':>12} {'max late ms':>12}")
+    for res in (run_poll(args.jobs, seconds, rtt, start), run_timers(args.jobs, seconds, rtt, start)):
+        print(
+            f"{res['mode']:>7} {res['fired']:>8} {res['mongo_round_trips']:>10} {res['round_trips_per_sec']:>8.1f} "
+            f"{res['mean_late_ms']:>13.1f} {res['p99_late_ms']:>12.1f} {res['max_late_ms']:>12.1f}"
+        )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,211 @@
+"""
+In-process stand-ins for Redis and MongoDB used by the benchmarks.
+
+Every command (or pipeline/execute) costs one simulated round trip so that the
+benchmarks measure how many network hops a code path needs, not how fast a
+particular Redis box is. Only the commands the benchmarked code paths use are
+implemented.
+"""
+import fnmatch
+import time
+from typing import Dict, List
+
+from scheduler.utils.reservation import RESERVE_SLOT_LUA
+
+
+class RoundTripCounter:
+    def __init__(self, rtt_seconds: float = 0.0):
+        self.rtt_seconds = rtt_seconds
+        self.round_trips = 0
+
+    def hop(self):
+        self.round_trips += 1
+        if self.rtt_seconds:
+            time.sleep(self.rtt_seconds)
+
+
+class FakeScript:
+    def __init__(self, redis: "FakeRedis", impl):
+        self._redis = redis
+        self._impl = impl
+
+    def __call__(self, keys=None, args=None, client=None):
+        client = client or self._redis
+        if isinstance(client, FakePipeline):
+            client._ops.append(("run_script", (self._impl, keys or [], args or []), {}))
+            return client
+        self._redis.counter.hop()
+        return self._impl(self._redis, keys or [], args or [])
+
+
+def _reserve_slot(redis: "FakeRedis", keys, args):
+    worker = redis.hashes.get(keys[0])
+    if not worker or worker.get("state", "online") != "online":
+        return 0
+    used = int(worker.get("current_running", 0)) + int(worker.get("reserved", 0))
+    if used >= int(worker.get("max_concurrency", 1)):
+        return 0
+    worker["reserved"] = str(int(worker.get("reserved", 0)) + 1)
+    redis.lists.setdefault(keys[1], []).append(args[0])
+    return 1
+
+
+# Python equivalents of the Lua scripts the benchmarked code registers
+SCRIPTS = {
+    RESERVE_SLOT_LUA: _reserve_slot,
+}
+
+
+class FakePipeline:
+    def __init__(self, redis: "FakeRedis"):
+        self._redis = redis
+        self._ops: List = []
+
+    def __getattr__(self, name):
+        def _queue(*args, **kwargs):
+            self._ops.append((name, args, kwargs))
+            return self
+
+        return _queue
+
+    def execute(self):
+        self._redis.counter.hop()
+        results = [getattr(self._redis, "_" + name)(*args, **kwargs) for name, args, kwargs in self._ops]
+        self._ops = []
+        return results
+
+
+class FakeRedis:
+    def __init__(self, rtt_seconds: float = 0.0):
+        self.counter = RoundTripCounter(rtt_seconds)
+        self.kv: Dict[str, str] = {}
+        self.hashes: Dict[str, Dict[str, str]] = {}
+        self.zsets: Dict[str, Dict[str, float]] = {}
+        self.lists: Dict[str, List[str]] = {}
+        self.sets: Dict[str, set] = {}
+
+    def __getattr__(self, name):
+        impl = getattr(type(self), "_" + name, None)
+        if impl is None:
+            raise AttributeError(name)
+
+        def _call(*args, **kwargs):
+            self.counter.hop()
+            return impl(self, *args, **kwargs)
+
+        return _call
+
+    def pipeline(self, transaction: bool = True):
+        return FakePipeline(self)
+
+    def register_script(self, lua: str) -> FakeScript:
+        return FakeScript(self, SCRIPTS[lua])
+
+    def _run_script(self, impl, keys, args):
+        return impl(self, keys, args)
+
+    # strings / hashes / sets
+    def _get(self, key):
+        return self.kv.get(key)
+
+    def _set(self, key, value, **_kwargs):
+        self.kv[key] = str(value)
+        return True
+
+    def _hset(self, key, mapping=None, **_kwargs):
+        self.hashes.setdefault(key, {}).update({k: str(v) for k, v in (mapping or {}).items()})
+        return 1
+
+    def _hgetall(self, key):
+        return dict(self.hashes.get(key, {}))
+
+    def _hmget(self, key, keys, *args):
+        h = self.hashes.get(key, {})
+        return [h.get(field) for field in ([keys] if isinstance(keys, str) else list(keys)) + list(args)]
+
+    def _hincrby(self, key, field, amount=1):
+        h = self.hashes.setdefault(key, {})
+        h[field] = str(int(h.get(field, 0)) + amount)
+        return int(h[field])
+
+    def _sadd(self, key, *members):
+        self.sets.setdefault(key, set()).update(members)
+        return len(members)
+
+    def _smembers(self, key):
+        return set(self.sets.get(key, set()))
+
+    def _scan_iter(self, match="*"):
+        keys = list(self.kv) + list(self.hashes) + list(self.zsets) + list(self.lists) + list(self.sets)
+        return [k for k in keys if fnmatch.fnmatchcase(k, match)]
+
+    def _delete(self, *keys):
+        for key in keys:
+            for store in (self.kv, self.hashes, self.zsets, self.lists, self.sets):
+                store.pop(key, None)
+        return len(keys)
+
+    # sorted sets
+    def _zadd(self, key, mapping, **_kwargs):
+        self.zsets.setdefault(key, {}).update({m: float(s) for m, s in mapping.items()})
+        return len(mapping)
+
+    def _zscore(self, key, member):
+        return self.zsets.get(key, {}).get(member)
+
+    def _zcard(self, key):
+        return len(self.zsets.get(key, {}))
+
+    def _zrange(self, key, start, end, withscores=False):
+        items = sorted(self.zsets.get(key, {}).items(), key=lambda kv: (kv[1], kv[0]))
+        items = items[start:] if end == -1 else items[start : end + 1]
+        return items if withscores else [m for m, _ in items]
+
+    def _zpopmax(self, key, count=1):
+        zset = self.zsets.get(key, {})
+        items = sorted(zset.items(), key=lambda kv: (-kv[1], kv[0]))[:count]
+        for member, _score in items:
+            zset.pop(member, None)
+        return items
+
+    def _bzpopmax(self, keys, timeout=0):
+        for key in keys:
+            popped = self._zpopmax(key, 1)
+            if popped:
+                return key, popped[0][0], popped[0][1]
+        return None
+
+    # lists
+    def _rpush(self, key, *values):
+        self.lists.setdefault(key, []).extend(values)
+        return len(self.lists[key])
+
+    def _llen(self, key):
+        return len(self.lists.get(key, []))
+
+
+class FakeCollection:
+    def __init__(self, counter: RoundTripCounter):
+        self.counter = counter
+        self.docs: Dict[str, Dict] = {}
+
+    def insert_many(self, docs: List[Dict]):
+        for doc in docs:
+            self.docs[doc["_id"]] = doc
+
+    def find_one(self, query: Dict):
+        self.counter.hop()
+        return self.docs.get(query.get("_id"))
+
+    def find(self, query: Dict):
+        self.counter.hop()
+        ids = (query.get("_id") or {}).get("$in")
+        if ids is not None:
+            return [self.docs[i] for i in ids if i in self.docs]
+        return list(self.docs.values())
+
+
+class FakeDB:
+    def __init__(self, rtt_seconds: float = 0.0):
+        self.counter = RoundTripCounter(rtt_seconds)
+        self.job_definitions = FakeCollection(self.counter)
@@ -5,6 +5,9 @@ import hashlib
 from ..redis_client import get_redis
 from ..mongo_client import get_db
 from ..examples.templates import TEMPLATES
+from ..coordination import coordinator
+from ..utils.selectors import STRATEGIES
+from ..utils.fairshare import DOMAIN_WEIGHTS_KEY, user_weights_key
 
 router = APIRouter(prefix="/admin", tags=["admin"])
 
@@ -14,6 +17,19 @@ def _require_admin(request: Request):
         raise HTTPException(status_code=403, detail="admin only")
 
 
+def _apply_placement_strategy(r, domain: str, payload: Dict, update: Dict):
+    if "placement_strategy" not in payload:
+        return
+    strategy = payload.get("placement_strategy") or None
+    if strategy and strategy not in STRATEGIES:
+        raise HTTPException(status_code=400, detail=f"placement_strategy must be one of {'|'.join(STRATEGIES)}")
+    update["placement_strategy"] = strategy
+    if strategy:
+        r.set(f"placement_strategy:{domain}", strategy)
+    else:
+        r.delete(f"placement_strategy:{domain}")
+
+
 @router.get("/domains")
 def list_domains(request: Request) -> Dict[str, List[Dict]]:
     _require_admin(request)
@@ -34,6 +50,7 @@ def list_domains(request: Request) -> Dict[str, List[Dict]]:
                 "jobs_count": jobs_count,
                 "runs_count": runs_count,
                 "workers_count": workers_count,
+                "placement_strategy": meta.get(d, {}).get("placement_strategy"),
             }
         )
     return {"domains": result}
@@ -51,12 +68,14 @@ def create_domain(payload: Dict, request: Request):
     token_hash = hashlib.sha256(token.encode()).hexdigest()
     r = get_redis()
     db = get_db()
+    update = {"display_name": display, "description": desc, "token_hash": token_hash}
+    _apply_placement_strategy(r, domain, payload, update)
     r.sadd("hydra:domains", domain)
     r.set(f"token_hash:{domain}", token_hash)
     r.set(f"token_hash:{token_hash}:domain", domain)
     db.domains.update_one(
         {"domain": domain},
-        {"$set": {"display_name": display, "description": desc, "token_hash": token_hash}},
+        {"$set": update},
         upsert=True,
     )
     return {"ok": True, "domain": domain, "token": token}
@@ -73,12 +92,13 @@ def rename_domain(domain: str, payload: Dict, request: Request):
     token = payload.get("token")
     token_hash = hashlib.sha256(token.encode()).hexdigest() if token else None
     db = get_db()
+    r = get_redis()
     update = {"display_name": display, "description": desc}
     if token_hash:
         update["token_hash"] = token_hash
+    _apply_placement_strategy(r, domain, payload, update)
     db.domains.update_one({"domain": domain}, {"$set": update}, upsert=True)
     if token_hash:
-        r = get_redis()
         r.set(f"token_hash:{domain}", token_hash)
         r.set(f"token_hash:{token_hash}:domain", domain)
     return {"ok": True, "domain": domain, "token": token if token else None}
@@ -112,9 +132,57 @@ def delete_domain(domain: str, request: Request):
     if token_hash:
         r.delete(f"token_hash:{token_hash}:domain")
     r.delete(f"token_hash:{domain}")
+    r.delete(f"placement_strategy:{domain}")
+    r.hdel(DOMAIN_WEIGHTS_KEY, domain)
+    r.delete(user_weights_key(domain))
     return {"ok": True}
 
 
+@router.get("/scheduler/replicas")
+def scheduler_replicas(request: Request):
+    """
+    Live scheduler replicas, which of them holds each singleton lease (as seen by this replica),
+    and the hash-ring owner of every domain.
+    """
+    _require_admin(request)
+    r = get_redis()
+    domains = sorted(r.smembers("hydra:domains") or [])
+    return coordinator.describe(domains)
+
+
+@router.put("/fairshare/{domain}")
+def set_fair_share(domain: str, payload: Dict, request: Request):
+    """
+    Set fair-share weights: `weight` for the domain itself and `users` ({user: weight}) within it.
+    A null weight resets that entry to the default of 1.
+    """
+    _require_admin(request)
+    r = get_redis()
+    pipe = r.pipeline(transaction=False)
+    if "weight" in payload:
+        if payload["weight"] is None:
+            pipe.hdel(DOMAIN_WEIGHTS_KEY, domain)
+        else:
+            pipe.hset(DOMAIN_WEIGHTS_KEY, domain, _parse_weight(payload["weight"]))
+    for user, weight in (payload.get("users") or {}).items():
+        if weight is None:
+            pipe.hdel(user_weights_key(domain), user)
+        else:
+            pipe.hset(user_weights_key(domain), user, _parse_weight(weight))
+    pipe.execute()
+    return {"ok": True, "domain": domain, "weight": r.hget(DOMAIN_WEIGHTS_KEY, domain), "users": r.hgetall(user_weights_key(domain))}
+
+
+def _parse_weight(value) -> float:
+    try:
+        weight = float(value)
+    except (TypeError, ValueError):
+        raise HTTPException(status_code=400, detail="weights must be numbers")
+    if weight <= 0:
+        raise HTTPException(status_code=400, detail="weights must be positive")
+    return weight
+
+
 @router.get("/job_templates")
 def list_job_templates(request: Request):
     _require_admin(request)
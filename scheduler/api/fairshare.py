@@ -0,0 +1,17 @@
+from typing import Optional
+
+from fastapi import APIRouter, HTTPException, Request
+
+from ..redis_client import get_redis
+from ..utils.fairshare import fair_share
+
+router = APIRouter(prefix="/fairshare", tags=["fairshare"])
+
+
+@router.get("/")
+def share_usage(request: Request, domain: Optional[str] = None):
+    """Per-user weights, current share, backlog and dispatch counts for the caller's domain."""
+    caller_domain = getattr(request.state, "domain", "prod")
+    if domain and domain != caller_domain and not getattr(request.state, "is_admin", False):
+        raise HTTPException(status_code=403, detail="admin only")
+    return fair_share.usage(get_redis(), domain or caller_domain)
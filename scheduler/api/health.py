@@ -1,5 +1,6 @@
 from fastapi import APIRouter, Request
 from ..redis_client import get_redis
+from ..utils.backlog import waiting_count
 
 router = APIRouter()
 
@@ -10,5 +11,5 @@ def health(request: Request):
     domain = getattr(request.state, "domain", "prod")
     # Return lightweight health stats
     workers_count = len(list(r.scan_iter(f"workers:{domain}:*")))
-    pending = r.zcard(f"job_queue:{domain}:pending")
+    pending = waiting_count(r, domain)
     return {"status": "ok", "workers": workers_count, "pending_jobs": pending}
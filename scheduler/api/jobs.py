@@ -14,6 +14,8 @@ from ..models.job_definition import (
 )
 from ..models.job_run import JobRun
 from ..event_bus import event_bus
+from ..schedule_timers import publish_schedule_change
+from ..utils.backlog import waiting_job_ids, waiting_queue_keys
 from ..utils.schedule import initialize_schedule
 
 
@@ -37,10 +39,10 @@ def _normalize_run_doc(doc: Dict[str, Any]) -> Dict[str, Any]:
     normalized = dict(doc)
     if "_id" in normalized:
         normalized["_id"] = str(normalized["_id"])
-    stdout = (normalized.get("stdout") or "")[:]
-    stderr = (normalized.get("stderr") or "")[:]
-    normalized["stdout_tail"] = stdout[-4096:]
-    normalized["stderr_tail"] = stderr[-4096:]
+    # Chunked runs store their tails; older runs carry the full text
+    for stream in ("stdout", "stderr"):
+        if normalized.get(f"{stream}_tail") is None:
+            normalized[f"{stream}_tail"] = (normalized.get(stream) or "")[-4096:]
     duration = None
     if normalized.get("start_ts") and normalized.get("end_ts"):
         try:
@@ -95,7 +97,7 @@ def _validate_job_definition(job: JobDefinition) -> JobValidationResult:
         errors.append("executor.type must be one of python|shell|batch|external")
 
     try:
-        next_run_at = initialize_schedule(job.schedule, datetime.utcnow()).next_run_at
+        next_run_at = initialize_schedule(job.schedule, datetime.utcnow(), job.id).next_run_at
     except ValueError as exc:
         errors.append(str(exc))
 
@@ -112,7 +114,7 @@ def _attach_schedule(job_def: JobDefinition, force: bool = False) -> JobDefiniti
     if not needs_init:
         return job_def
     try:
-        new_schedule = initialize_schedule(schedule, datetime.utcnow())
+        new_schedule = initialize_schedule(schedule, datetime.utcnow(), job_def.id)
     except ValueError as exc:
         raise HTTPException(status_code=422, detail=[str(exc)])
     return job_def.copy(update={"schedule": new_schedule})
@@ -138,6 +140,8 @@ def submit_job(job: JobCreate, request: Request):
         raise HTTPException(status_code=422, detail=validation.errors)
     job_def = _attach_schedule(job_def, force=True)
     db.job_definitions.insert_one(job_def.to_mongo())
+    if job_def.schedule.mode != "immediate":
+        publish_schedule_change(job_def.id)
     if job_def.schedule.mode == "immediate":
         _enqueue_job(job_def.id, reason="immediate_submit", priority=job_def.priority)
     event_bus.publish(
@@ -206,10 +210,34 @@ def update_job(job_id: str, updates: JobUpdate, request: Request):
         raise HTTPException(status_code=422, detail=validation.errors)
     job_def = _attach_schedule(job_def, force="schedule" in update_doc)
     db.job_definitions.replace_one({"_id": job_id}, job_def.to_mongo())
+    publish_schedule_change(job_id)
     event_bus.publish("job_updated", {"job_id": job_id, "domain": job_def.domain})
     return job_def
 
 
+@router.delete("/jobs/{job_id}")
+def delete_job(job_id: str, request: Request):
+    db = get_db()
+    existing = db.job_definitions.find_one({"_id": job_id})
+    if not existing:
+        raise HTTPException(status_code=404, detail="job not found")
+    domain = getattr(request.state, "domain", "prod")
+    is_admin = getattr(request.state, "is_admin", False)
+    job_domain = existing.get("domain", "prod")
+    if not is_admin and job_domain != domain:
+        raise HTTPException(status_code=403, detail="forbidden")
+    db.job_definitions.delete_one({"_id": job_id})
+    # Run history is kept; only queued (not yet dispatched) runs are dropped, wherever they wait
+    r = get_redis()
+    pipe = r.pipeline(transaction=False)
+    for key in waiting_queue_keys(r, job_domain):
+        pipe.zrem(key, job_id)
+    pipe.execute()
+    publish_schedule_change(job_id, action="deleted")
+    event_bus.publish("job_deleted", {"job_id": job_id, "domain": job_domain})
+    return {"ok": True, "job_id": job_id}
+
+
 @router.post("/jobs/{job_id}/validate", response_model=JobValidationResult)
 def validate_job(job_id: str, request: Request):
     db = get_db()
@@ -272,6 +300,12 @@ def jobs_overview(request: Request):
     is_admin = getattr(request.state, "is_admin", False)
     query = {} if is_admin else {"domain": domain}
     job_docs = list(db.job_definitions.find(query))
+    waiting = set()
+    by_domain: Dict[str, List[str]] = {}
+    for job in job_docs:
+        by_domain.setdefault(job.get("domain", "prod"), []).append(job["_id"])
+    for job_domain, ids in by_domain.items():
+        waiting |= waiting_job_ids(r, job_domain, ids)
     overview = []
     for job in job_docs:
         job_id = job["_id"]
@@ -282,7 +316,7 @@ def jobs_overview(request: Request):
         failed_runs = db.job_runs.count_documents(
             {"job_id": job_id, "status": "failed"}
         )
-        queued = 1 if r.zscore(f"job_queue:{job.get('domain','prod')}:pending", job_id) is not None else 0
+        queued = 1 if job_id in waiting else 0
         recent_runs_cursor = (
             db.job_runs.find({"job_id": job_id})
             .sort("start_ts", -1)
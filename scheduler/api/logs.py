@@ -1,6 +1,7 @@
 import asyncio
 import json
-from typing import Dict, Optional
+import zlib
+from typing import Dict, List, Optional, Tuple
 from bson import ObjectId
 
 from fastapi import APIRouter, HTTPException, Request
@@ -24,46 +25,160 @@ def _find_run(db, run_id: str) -> Optional[Dict]:
         return None
 
 
-@router.get("/runs/{run_id}/stream")
-async def stream_run_logs(run_id: str, request: Request):
-    r = get_redis()
-    db = get_db()
+LOG_READ_COUNT = 500
+LOG_BLOCK_MS = 2000
+TERMINAL_STATUSES = {"success", "failed", "lost"}
+
+
+def log_stream_key(domain: str, run_id: str) -> str:
+    return f"log_stream:{domain}:{run_id}"
+
+
+def _authorized_run(db, run_id: str, request: Request) -> Tuple[Optional[Dict], str]:
     req_domain = getattr(request.state, "domain", None)
     is_admin = getattr(request.state, "is_admin", False)
     run_doc = _find_run(db, run_id)
     run_domain = (run_doc or {}).get("domain", None)
     if not is_admin and req_domain and run_domain and req_domain != run_domain:
         raise HTTPException(status_code=403, detail="forbidden")
-    domain = run_domain or req_domain or "prod"
+    return run_doc, run_domain or req_domain or "prod"
+
+
+def _entry_payload(run_id: str, run_doc: Optional[Dict], entry_id: str, fields: Dict) -> Dict:
+    return {
+        "id": entry_id,
+        "run_id": run_id,
+        "job_id": (run_doc or {}).get("job_id"),
+        "worker_id": (run_doc or {}).get("worker_id"),
+        "ts": float(fields.get("ts", 0) or 0),
+        "text": fields.get("text", ""),
+        "stream": fields.get("stream", "stdout"),
+        **({"dropped": int(fields["dropped"])} if "dropped" in fields else {}),
+    }
+
+
+def _read_entries(r, key: str, offset: str, count: int, block: Optional[int] = None) -> List[Tuple[str, Dict]]:
+    result = r.xread({key: offset}, count=count, block=block) or []
+    return [entry for _key, entries in result for entry in entries]
+
+
+@router.get("/runs/{run_id}/logs")
+def read_run_logs(run_id: str, request: Request, offset: str = "0-0", limit: int = LOG_READ_COUNT) -> Dict:
+    """
+    Replay a run's log stream after `offset` (a stream entry ID; `0-0` is the beginning).
+    Pass the returned `next_offset` back to page forward; `finished` is set once the worker
+    wrote the end marker.
+    """
+    r = get_redis()
+    run_doc, domain = _authorized_run(get_db(), run_id, request)
+    entries = _read_entries(r, log_stream_key(domain, run_id), offset, max(1, min(limit, 5000)))
+    chunks = [_entry_payload(run_id, run_doc, entry_id, fields) for entry_id, fields in entries]
+    return {
+        "run_id": run_id,
+        "chunks": [c for c in chunks if c["stream"] != "end"],
+        "next_offset": chunks[-1]["id"] if chunks else offset,
+        "finished": any(c["stream"] == "end" for c in chunks),
+    }
+
+
+MAX_OUTPUT_READ = 1024 * 1024
+
+
+@router.get("/runs/{run_id}/output")
+def read_run_output(request: Request, run_id: str, stream: str = "stdout", offset: int = 0, length: int = 65536) -> Dict:
+    """
+    Byte range [offset, offset + length) of a run's stdout or stderr, read from the compressed
+    chunks in `job_run_chunks`; only the chunks overlapping the range are fetched. Runs stored
+    before chunking fall back to the text on the run document.
+    """
+    if stream not in {"stdout", "stderr"}:
+        raise HTTPException(status_code=400, detail="stream must be stdout or stderr")
+    if offset < 0 or length <= 0:
+        raise HTTPException(status_code=400, detail="offset must be >= 0 and length > 0")
+    length = min(length, MAX_OUTPUT_READ)
+    db = get_db()
+    run_doc, _domain = _authorized_run(db, run_id, request)
+    if not run_doc:
+        raise HTTPException(status_code=404, detail="run not found")
+    end = offset + length
+    if run_doc.get(f"{stream}_bytes") is None:
+        data = (run_doc.get(stream) or "").encode("utf-8")
+        total = len(data)
+        piece = data[offset:end]
+    else:
+        total = int(run_doc.get(f"{stream}_bytes") or 0)
+        chunks = db.job_run_chunks.find(
+            {"run_id": str(run_doc["_id"]), "stream": stream, "offset": {"$lt": end}},
+            sort=[("seq", 1)],
+        )
+        parts = []
+        position = offset
+        for chunk in chunks:
+            if chunk["offset"] + chunk["size"] <= offset:
+                continue
+            if chunk["offset"] > position:
+                # A chunk the worker failed to store; stop before it rather than splice across
+                break
+            raw = zlib.decompress(chunk["data"])
+            parts.append(raw[max(offset - chunk["offset"], 0) : end - chunk["offset"]])
+            position = min(chunk["offset"] + chunk["size"], end)
+        piece = b"".join(parts)
+        if not piece:
+            # Skip a stored gap so paging carries on after it
+            for gap in run_doc.get("output_gaps") or []:
+                if gap["stream"] == stream and gap["offset"] <= offset < gap["offset"] + gap["size"]:
+                    return _output_page(run_id, stream, offset, gap["offset"] + gap["size"], total, "", missing=True)
+    return _output_page(run_id, stream, offset, offset + len(piece), total, piece.decode("utf-8", errors="replace"))
 
-    history_key = f"log_stream:{domain}:{run_id}:history"
-    channel = f"log_stream:{domain}:{run_id}"
-    pubsub = r.pubsub()
-    pubsub.subscribe(channel)
+
+def _output_page(run_id: str, stream: str, offset: int, next_offset: int, total: int, text: str, missing: bool = False) -> Dict:
+    page = {
+        "run_id": run_id,
+        "stream": stream,
+        "offset": offset,
+        "next_offset": next_offset,
+        "total_bytes": total,
+        "eof": next_offset >= total,
+        "text": text,
+    }
+    if missing:
+        page["missing"] = True
+    return page
+
+
+@router.get("/runs/{run_id}/stream")
+async def stream_run_logs(run_id: str, request: Request, offset: str = "0-0"):
+    """
+    Server-sent log tail: replays the run's stream from `offset` (or the `Last-Event-ID` a
+    reconnecting client sends), then follows it with blocking XREAD until the end marker.
+    """
+    r = get_redis()
+    db = get_db()
+    run_doc, domain = _authorized_run(db, run_id, request)
+    key = log_stream_key(domain, run_id)
+    start = request.headers.get("last-event-id") or offset
 
     async def event_generator():
         loop = asyncio.get_running_loop()
-        try:
-            # replay cached history
-            history = r.lrange(history_key, -200, -1) or []
-            for raw in history:
-                yield {"event": "log_chunk", "data": raw}
-
-            # live stream
-            while True:
-                message = await loop.run_in_executor(None, pubsub.get_message, True, 2.0)
-                if not message or message.get("type") != "message":
-                    continue
-                data = message.get("data")
-                if not data:
-                    continue
-                yield {"event": "log_chunk", "data": data}
-        finally:
-            try:
-                pubsub.unsubscribe(channel)
-                pubsub.close()
-            except Exception:
-                pass
+        last_id = start
+        while True:
+            entries = await loop.run_in_executor(None, _read_entries, r, key, last_id, LOG_READ_COUNT, LOG_BLOCK_MS)
+            if not entries:
+                if await request.is_disconnected():
+                    return
+                # Nothing new: stop once the run is over (its stream may have expired already)
+                current = await loop.run_in_executor(None, _find_run, db, run_id)
+                if (current or {}).get("status") in TERMINAL_STATUSES:
+                    yield {"event": "end", "data": json.dumps({"run_id": run_id})}
+                    return
+                continue
+            for entry_id, fields in entries:
+                last_id = entry_id
+                payload = _entry_payload(run_id, run_doc, entry_id, fields)
+                if payload["stream"] == "end":
+                    yield {"event": "end", "id": entry_id, "data": json.dumps(payload)}
+                    return
+                yield {"event": "log_chunk", "id": entry_id, "data": json.dumps(payload)}
 
     return EventSourceResponse(event_generator())
 
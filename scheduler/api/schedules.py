@@ -0,0 +1,72 @@
+from collections import Counter
+from datetime import datetime, timedelta
+from typing import Dict, List
+
+from fastapi import APIRouter, HTTPException, Request
+
+from ..mongo_client import get_db
+from ..models.job_definition import ScheduleConfig
+from ..schedule_timers import SCHEDULED_QUERY
+from ..utils.schedule import upcoming_fire_times
+
+
+router = APIRouter(prefix="/schedules", tags=["schedules"])
+
+MAX_FORECAST_MINUTES = 24 * 60
+MAX_TICKS_PER_JOB = 10000
+
+
+@router.get("/forecast")
+def schedule_forecast(request: Request, minutes: int = 60, top: int = 5):
+    """
+    Upcoming scheduled fire times across the fleet (or the caller's domain), counted per minute.
+    `hotspots` lists the busiest minutes so pile-ups such as everything at :00 stand out.
+    """
+    if minutes <= 0 or minutes > MAX_FORECAST_MINUTES:
+        raise HTTPException(status_code=400, detail=f"minutes must be between 1 and {MAX_FORECAST_MINUTES}")
+    db = get_db()
+    domain = getattr(request.state, "domain", "prod")
+    is_admin = getattr(request.state, "is_admin", False)
+    query = dict(SCHEDULED_QUERY) if is_admin else {**SCHEDULED_QUERY, "domain": domain}
+    start = datetime.utcnow().replace(second=0, microsecond=0)
+    end = start + timedelta(minutes=minutes)
+
+    counts: Counter = Counter()
+    jobs_by_minute: Dict[datetime, List[str]] = {}
+    truncated = 0
+    jobs = 0
+    for doc in db.job_definitions.find(query, {"schedule": 1}):
+        try:
+            schedule = ScheduleConfig.model_validate(doc.get("schedule") or {})
+        except ValueError:
+            continue
+        ticks = upcoming_fire_times(schedule, start, end, MAX_TICKS_PER_JOB, job_id=doc["_id"])
+        jobs += 1
+        if len(ticks) >= MAX_TICKS_PER_JOB:
+            truncated += 1
+        for tick in ticks:
+            minute = tick.replace(second=0, microsecond=0)
+            counts[minute] += 1
+            bucket = jobs_by_minute.setdefault(minute, [])
+            if len(bucket) < 20 and (not bucket or bucket[-1] != doc["_id"]):
+                bucket.append(doc["_id"])
+
+    buckets = []
+    for i in range(minutes):
+        minute = start + timedelta(minutes=i)
+        buckets.append({"minute": minute.isoformat(), "count": counts.get(minute, 0)})
+    total = sum(counts.values())
+    return {
+        "start": start.isoformat(),
+        "minutes": minutes,
+        "jobs": jobs,
+        "total_runs": total,
+        "mean_per_minute": total / minutes,
+        "peak_per_minute": max(counts.values(), default=0),
+        "truncated_jobs": truncated,
+        "buckets": buckets,
+        "hotspots": [
+            {"minute": minute.isoformat(), "count": count, "sample_jobs": jobs_by_minute.get(minute, [])}
+            for minute, count in counts.most_common(max(top, 0))
+        ],
+    }
@@ -3,6 +3,8 @@ from typing import List
 
 from ..redis_client import get_redis
 from ..models.worker_info import WorkerInfo
+from ..worker_registry import worker_registry, publish_worker_event
+from ..utils.failover import reclaim_worker_backlog
 
 router = APIRouter()
 
@@ -33,6 +35,11 @@ def list_workers(request: Request):
                     allowed_users=(data.get("allowed_users", "") or "").split(",") if data.get("allowed_users") else [],
                     max_concurrency=int(data.get("max_concurrency", 1)),
                     current_running=int(data.get("current_running", 0)),
+                    reserved=int(data.get("reserved", 0) or 0),
+                    stolen_jobs=int(data.get("stolen_jobs", 0) or 0),
+                    venv_cache_hits=int(data.get("venv_cache_hits", 0) or 0),
+                    venv_cache_misses=int(data.get("venv_cache_misses", 0) or 0),
+                    venv_cache_evictions=int(data.get("venv_cache_evictions", 0) or 0),
                     last_heartbeat=hb,
                     status=data.get("status", "online"),
                     state=data.get("state", "online"),
@@ -54,7 +61,8 @@ def list_workers(request: Request):
 def set_worker_state(worker_id: str, state: str, request: Request):
     """
     Set worker state to online|draining|disabled.
-    Draining/disabled will prevent new dispatches; running jobs continue.
+    Draining/disabled will prevent new dispatches; running jobs continue and jobs still
+    queued for the worker go back to pending.
     """
     state = state.lower()
     if state not in {"online", "draining", "disabled"}:
@@ -74,4 +82,15 @@ def set_worker_state(worker_id: str, state: str, request: Request):
         else:
             return {"ok": False, "error": "worker not found"}
     r.hset(key, mapping={"state": state})
-    return {"ok": True, "state": state}
+    publish_worker_event(domain, worker_id, "state", {"state": state})
+    reclaimed = reclaim_worker_backlog(domain, worker_id, state) if state != "online" else 0
+    return {"ok": True, "state": state, "reclaimed": reclaimed}
+
+
+@router.get("/workers/registry/consistency")
+def registry_consistency(request: Request):
+    """
+    Compare the scheduler's in-memory worker registry with the Redis worker hashes.
+    """
+    domain = getattr(request.state, "domain", "prod")
+    return worker_registry.check_consistency(domain)
@@ -0,0 +1,205 @@
+import bisect
+import hashlib
+import os
+import socket
+import threading
+import time
+import uuid
+from typing import Dict, Iterable, List, Optional
+
+from .redis_client import get_redis
+from .utils.logging import setup_logging
+
+
+log = setup_logging("scheduler.coordination")
+
+REPLICAS_KEY = "hydra:scheduler:replicas"
+SINGLETON_LOOPS = ("failover", "schedule_triggers")
+
+# Take or renew a named lease. A fresh acquisition draws a new fencing token from a
+# monotonically increasing counter; renewals keep the token. Returns 0 if someone else holds it.
+ACQUIRE_LEASE_LUA = """
+local current = redis.call('GET', KEYS[1])
+if current then
+    local owner, token = string.match(current, '^(.*):(%d+)$')
+    if owner == ARGV[1] then
+        redis.call('PEXPIRE', KEYS[1], ARGV[2])
+        return tonumber(token)
+    end
+    return 0
+end
+local token = redis.call('INCR', KEYS[2])
+redis.call('SET', KEYS[1], ARGV[1] .. ':' .. token, 'PX', ARGV[2])
+return token
+"""
+
+RELEASE_LEASE_LUA = """
+if redis.call('GET', KEYS[1]) == ARGV[1] then
+    return redis.call('DEL', KEYS[1])
+end
+return 0
+"""
+
+
+def _hash(value: str) -> int:
+    return int(hashlib.md5(value.encode()).hexdigest()[:16], 16)
+
+
+class HashRing:
+    """Consistent hash ring with virtual nodes; adding/removing a replica only moves its share of keys."""
+
+    def __init__(self, nodes: Iterable[str], vnodes: int = 64):
+        self.nodes = sorted(set(nodes))
+        points = sorted((_hash(f"{node}#{i}"), node) for node in self.nodes for i in range(vnodes))
+        self._hashes = [h for h, _ in points]
+        self._owners = [node for _, node in points]
+
+    def node_for(self, key: str) -> Optional[str]:
+        if not self._hashes:
+            return None
+        idx = bisect.bisect(self._hashes, _hash(key)) % len(self._hashes)
+        return self._owners[idx]
+
+
+class LeaderLease:
+    """A Redis lease on one singleton loop, carrying the fencing token of the current term."""
+
+    def __init__(self, name: str, replica_id: str, ttl_seconds: float):
+        self.name = name
+        self.replica_id = replica_id
+        self.ttl_seconds = ttl_seconds
+        self.key = f"hydra:lease:{name}"
+        self.fence_key = f"hydra:lease:{name}:fence"
+        self.token = 0
+        self._renewed_at = 0.0
+
+    @property
+    def value(self) -> str:
+        return f"{self.replica_id}:{self.token}"
+
+    def acquire_or_renew(self, r, script) -> bool:
+        token = int(script(keys=[self.key, self.fence_key], args=[self.replica_id, int(self.ttl_seconds * 1000)], client=r) or 0)
+        if token and token != self.token:
+            log.info("Replica %s took lease %s (fencing token %s)", self.replica_id, self.name, token)
+        elif not token and self.token:
+            log.warning("Replica %s lost lease %s", self.replica_id, self.name)
+        self.token = token
+        self._renewed_at = time.monotonic() if token else 0.0
+        return bool(token)
+
+    def held(self) -> bool:
+        # Stop acting well before Redis would expire the lease if renewals are failing
+        return bool(self.token) and time.monotonic() - self._renewed_at < self.ttl_seconds * 0.8
+
+    def still_valid(self, r) -> bool:
+        """Round-trip check that Redis still records this replica's term (use before destructive work)."""
+        return self.held() and r.get(self.key) == self.value
+
+    def release(self, r, script):
+        if self.token:
+            script(keys=[self.key], args=[self.value], client=r)
+        self.token = 0
+        self._renewed_at = 0.0
+
+
+class Coordinator:
+    """
+    Coordinates scheduler replicas: leases the singleton loops (schedule triggers, failover)
+    and shards dispatch of `hydra:domains` across live replicas with a consistent hash ring.
+    """
+
+    def __init__(self, replica_id: Optional[str] = None):
+        self.replica_id = replica_id or os.getenv(
+            "SCHEDULER_REPLICA_ID", f"{socket.gethostname()}-{os.getpid()}-{uuid.uuid4().hex[:6]}"
+        )
+        self.replica_ttl = float(os.getenv("SCHEDULER_REPLICA_TTL", "10"))
+        lease_ttl = float(os.getenv("SCHEDULER_LEASE_TTL", "10"))
+        self.leases: Dict[str, LeaderLease] = {name: LeaderLease(name, self.replica_id, lease_ttl) for name in SINGLETON_LOOPS}
+        self._ring = HashRing([])
+        self._lock = threading.Lock()
+        self._acquire_script = None
+        self._release_script = None
+
+    def _scripts(self, r):
+        if self._acquire_script is None:
+            self._acquire_script = r.register_script(ACQUIRE_LEASE_LUA)
+            self._release_script = r.register_script(RELEASE_LEASE_LUA)
+        return self._acquire_script, self._release_script
+
+    def replicas(self) -> List[str]:
+        with self._lock:
+            return list(self._ring.nodes)
+
+    def refresh_membership(self, r) -> bool:
+        """Heartbeat this replica, drop dead ones and rebuild the ring; returns True when membership changed."""
+        now = time.time()
+        pipe = r.pipeline(transaction=False)
+        pipe.zadd(REPLICAS_KEY, {self.replica_id: now})
+        pipe.zremrangebyscore(REPLICAS_KEY, "-inf", now - self.replica_ttl)
+        pipe.zrange(REPLICAS_KEY, 0, -1)
+        members = pipe.execute()[2] or []
+        with self._lock:
+            if sorted(set(members)) == self._ring.nodes:
+                return False
+            previous = self._ring.nodes
+            self._ring = HashRing(members)
+        log.info("Scheduler replicas changed %s -> %s; rebalancing domains", previous, sorted(set(members)))
+        return True
+
+    def renew_leases(self, r):
+        acquire, _release = self._scripts(r)
+        for lease in self.leases.values():
+            lease.acquire_or_renew(r, acquire)
+
+    def release_all(self, r):
+        _acquire, release = self._scripts(r)
+        for lease in self.leases.values():
+            lease.release(r, release)
+        r.zrem(REPLICAS_KEY, self.replica_id)
+
+    def is_leader(self, name: str) -> bool:
+        return self.leases[name].held()
+
+    def verify_leader(self, r, name: str) -> bool:
+        return self.leases[name].still_valid(r)
+
+    def fencing_token(self, name: str) -> int:
+        return self.leases[name].token if self.leases[name].held() else 0
+
+    def owns_domain(self, domain: str) -> bool:
+        with self._lock:
+            owner = self._ring.node_for(domain)
+        # Before the first membership refresh, act as the only replica
+        return owner is None or owner == self.replica_id
+
+    def owned_domains(self, domains: Iterable[str]) -> List[str]:
+        return [d for d in domains if self.owns_domain(d)]
+
+    def describe(self, domains: Iterable[str]) -> Dict:
+        with self._lock:
+            ring = self._ring
+        return {
+            "replica_id": self.replica_id,
+            "replicas": ring.nodes,
+            "leases": {name: {"held": lease.held(), "fencing_token": lease.token} for name, lease in self.leases.items()},
+            "domain_owners": {d: ring.node_for(d) for d in domains},
+        }
+
+
+def coordination_loop(stop_event: threading.Event, interval: float = 2.0):
+    r = get_redis()
+    log.info("Coordination loop started (replica %s)", coordinator.replica_id)
+    while not stop_event.is_set():
+        try:
+            coordinator.refresh_membership(r)
+            coordinator.renew_leases(r)
+        except Exception as e:
+            log.exception("Error in coordination loop: %s", e)
+        stop_event.wait(interval)
+    try:
+        coordinator.release_all(r)
+    except Exception:
+        pass
+
+
+coordinator = Coordinator()
@@ -13,7 +13,10 @@ from .api.history import router as history_router
 from .api.logs import router as logs_router
 from .api.admin import router as admin_router
 from .api.ai import router as ai_router
-from .scheduler import scheduling_loop, failover_loop, schedule_trigger_loop
+from .api.fairshare import router as fairshare_router
+from .api.schedules import router as schedules_router
+from .scheduler import scheduling_loop, failover_loop, schedule_trigger_loop, worker_registry_loop
+from .coordination import coordination_loop
 from .utils.logging import setup_logging
 from .utils.auth import enforce_api_key
 from .redis_client import get_redis
@@ -42,6 +45,8 @@ app.include_router(history_router)
 app.include_router(logs_router)
 app.include_router(admin_router)
 app.include_router(ai_router)
+app.include_router(fairshare_router)
+app.include_router(schedules_router)
 app.middleware("http")(enforce_api_key)
 
 stop_event = threading.Event()
@@ -59,6 +64,8 @@ def _ensure_domains_seeded():
         r.sadd("hydra:domains", domain)
         r.set(f"token_hash:{domain}", token_hash)
         r.set(f"token_hash:{token_hash}:domain", domain)
+        if doc.get("placement_strategy"):
+            r.set(f"placement_strategy:{domain}", doc["placement_strategy"])
     # Optional seeding (used by dev compose)
     if db.domains.count_documents({}) == 0:
         token = secrets.token_hex(24)
@@ -70,6 +77,14 @@ def _ensure_domains_seeded():
         log.warning("Seeded default prod domain with token: %s", token)
 
 
+def _ensure_indexes():
+    db = get_db()
+    try:
+        db.job_run_chunks.create_index([("run_id", 1), ("stream", 1), ("seq", 1)], unique=True)
+    except Exception as exc:
+        log.warning("Could not create job_run_chunks index: %s", exc)
+
+
 def _ensure_admin_token():
     global os
     from . import utils
@@ -90,10 +105,15 @@ def _ensure_admin_token():
 def on_startup():
     _ensure_admin_token()
     _ensure_domains_seeded()
+    _ensure_indexes()
     log.info("Starting scheduler background threads")
     app.state.scheduler_thread = threading.Thread(target=scheduling_loop, args=(stop_event,), daemon=True)
     app.state.failover_thread = threading.Thread(target=failover_loop, args=(stop_event,), daemon=True)
     app.state.schedule_thread = threading.Thread(target=schedule_trigger_loop, args=(stop_event,), daemon=True)
+    app.state.registry_thread = threading.Thread(target=worker_registry_loop, args=(stop_event,), daemon=True)
+    app.state.coordination_thread = threading.Thread(target=coordination_loop, args=(stop_event,), daemon=True)
+    app.state.coordination_thread.start()
+    app.state.registry_thread.start()
     app.state.scheduler_thread.start()
     app.state.failover_thread.start()
     app.state.schedule_thread.start()
@@ -106,9 +126,15 @@ def on_shutdown():
     th1 = getattr(app.state, "scheduler_thread", None)
     th2 = getattr(app.state, "failover_thread", None)
     th3 = getattr(app.state, "schedule_thread", None)
+    th4 = getattr(app.state, "registry_thread", None)
+    th5 = getattr(app.state, "coordination_thread", None)
     if th1:
         th1.join(timeout=2)
     if th2:
         th2.join(timeout=2)
     if th3:
         th3.join(timeout=2)
+    if th4:
+        th4.join(timeout=2)
+    if th5:
+        th5.join(timeout=2)
@@ -15,6 +15,7 @@ class PythonEnvironment(BaseModel):
     venv_path: Optional[str] = None
     requirements: List[str] = Field(default_factory=list)
     requirements_file: Optional[str] = None
+    preload: List[str] = Field(default_factory=list)  # modules a warm interpreter imports up front
 
 
 class PythonExecutor(ExecutorBase):
@@ -22,12 +23,15 @@ class PythonExecutor(ExecutorBase):
     code: str
     interpreter: str = "python3"
     environment: PythonEnvironment = Field(default_factory=PythonEnvironment)
+    warm: bool = False  # run as a fork of the worker's pre-started interpreter for this environment
 
 
 class ShellExecutor(ExecutorBase):
     type: Literal["shell"] = "shell"
     script: str
     shell: str = "bash"
+    # bash only: `login` sources the profile every run, `non_login` skips it, `persistent` reuses a pooled shell
+    shell_mode: Literal["login", "non_login", "persistent"] = "login"
 
 
 class BatchExecutor(ExecutorBase):
@@ -2,9 +2,9 @@ from datetime import datetime
 from typing import List, Optional, Literal
 from pydantic import BaseModel, Field, model_validator
 import uuid
-from croniter import croniter
 
 from .executor import ExecutorConfig, ShellExecutor
+from ..utils.cron_cache import is_valid_cron
 
 
 class Affinity(BaseModel):
@@ -16,6 +16,9 @@ class Affinity(BaseModel):
     deployment_types: List[str] = Field(default_factory=list)
 
 
+MisfirePolicy = Literal["fire_once", "fire_all", "skip"]
+
+
 class ScheduleConfig(BaseModel):
     mode: Literal["immediate", "cron", "interval"] = "immediate"
     cron: Optional[str] = None
@@ -25,13 +28,20 @@ class ScheduleConfig(BaseModel):
     next_run_at: Optional[datetime] = None
     timezone: str = "UTC"
     enabled: bool = True
+    # What to do with ticks missed by more than misfire_grace_seconds (scheduler outage, backlog)
+    misfire_policy: MisfirePolicy = "fire_once"
+    misfire_grace_seconds: int = Field(default=60, ge=0)
+    # fire_all only replays ticks newer than this many seconds (None = no limit)
+    max_catchup_seconds: Optional[int] = Field(default=3600, gt=0)
+    # Stable per-job delay in [0, jitter_seconds] (hashed from the job ID) to spread shared cadences
+    jitter_seconds: int = Field(default=0, ge=0, le=86400)
 
     @model_validator(mode="after")
     def validate_schedule_config(self):
         if self.mode == "cron":
             if not self.cron:
                 raise ValueError("cron expression is required when mode='cron'")
-            if not croniter.is_valid(self.cron):
+            if not is_valid_cron(self.cron):
                 raise ValueError(f"Invalid cron expression: {self.cron}")
         return self
 
@@ -48,11 +58,17 @@ class SourceConfig(BaseModel):
     protocol: Literal["git"] = "git"
     url: str
     ref: str = "main"
+    path: Optional[str] = None
+    sparse: bool = False  # check out only `path` (worktree from the worker's mirror cache)
+
+
+PlacementStrategy = Literal["spread", "binpack", "weighted", "p2c"]
 
 
 class JobDefinition(BaseModel):
     id: str = Field(default_factory=lambda: uuid.uuid4().hex, alias="_id")
     name: str
+    user: str = "default"
     domain: str = "prod"
     source: Optional[SourceConfig] = None
     affinity: Affinity
@@ -60,6 +76,7 @@ class JobDefinition(BaseModel):
     retries: int = 0
     timeout: int = 0
     priority: int = 5
+    placement_strategy: Optional[PlacementStrategy] = None
     schedule: ScheduleConfig = Field(default_factory=ScheduleConfig)
     completion: CompletionCriteria = Field(default_factory=CompletionCriteria)
     created_at: datetime = Field(default_factory=datetime.utcnow)
@@ -77,6 +94,7 @@ class JobDefinition(BaseModel):
 
 class JobCreate(BaseModel):
     name: str
+    user: str = "default"
     domain: str = "prod"
     source: Optional[SourceConfig] = None
     affinity: Affinity
@@ -84,12 +102,14 @@ class JobCreate(BaseModel):
     retries: int = 0
     timeout: int = 0
     priority: int = 5
+    placement_strategy: Optional[PlacementStrategy] = None
     schedule: ScheduleConfig = Field(default_factory=ScheduleConfig)
     completion: CompletionCriteria = Field(default_factory=CompletionCriteria)
 
 
 class JobUpdate(BaseModel):
     name: Optional[str] = None
+    user: Optional[str] = None
     domain: Optional[str] = None
     source: Optional[SourceConfig] = None
     affinity: Optional[Affinity] = None
@@ -97,6 +117,7 @@ class JobUpdate(BaseModel):
     retries: Optional[int] = None
     timeout: Optional[int] = None
     priority: Optional[int] = None
+    placement_strategy: Optional[PlacementStrategy] = None
     schedule: Optional[ScheduleConfig] = None
     completion: Optional[CompletionCriteria] = None
 
@@ -1,5 +1,5 @@
 from datetime import datetime
-from typing import Optional
+from typing import Dict, List, Optional
 from pydantic import BaseModel, Field
 
 
@@ -18,12 +18,22 @@ class JobRun(BaseModel):
     stderr: str = ""
     stdout_tail: Optional[str] = None
     stderr_tail: Optional[str] = None
+    stdout_bytes: Optional[int] = None
+    stderr_bytes: Optional[int] = None
+    output_chunks: Optional[int] = None
+    output_truncated: Optional[bool] = None
+    output_failed_chunks: Optional[int] = None
+    output_gaps: Optional[List[Dict]] = None  # {stream, offset, size} of chunks that could not be stored
     slot: Optional[int] = None
     attempt: Optional[int] = None
     retries_remaining: Optional[int] = None
     schedule_tick: Optional[str] = None
     schedule_mode: Optional[str] = None
     executor_type: Optional[str] = None
+    source_commit: Optional[str] = None
+    python_start_mode: Optional[str] = None  # warm | cold, for `warm` python jobs
+    python_startup_ms: Optional[float] = None
+    python_cold_startup_ms: Optional[float] = None
     queue_latency_ms: Optional[float] = None
     completion_reason: Optional[str] = None
     duration: Optional[float] = None
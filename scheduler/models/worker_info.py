@@ -10,6 +10,11 @@ class WorkerInfo(BaseModel):
     allowed_users: List[str]
     max_concurrency: int
     current_running: int
+    reserved: int = 0
+    stolen_jobs: int = 0
+    venv_cache_hits: int = 0
+    venv_cache_misses: int = 0
+    venv_cache_evictions: int = 0
     last_heartbeat: Optional[float] = None
     status: str = "online"
     state: str = "online"
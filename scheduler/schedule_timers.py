@@ -0,0 +1,123 @@
+import heapq
+import json
+import threading
+from datetime import datetime
+from typing import Dict, List, Optional, Tuple
+
+from .redis_client import get_redis
+from .utils.logging import setup_logging
+
+
+log = setup_logging("scheduler.schedule_timers")
+
+SCHEDULE_EVENTS_CHANNEL = "schedule_events"
+
+SCHEDULED_QUERY = {
+    "schedule.mode": {"$in": ["cron", "interval"]},
+    "schedule.enabled": True,
+    "schedule.next_run_at": {"$ne": None},
+}
+
+
+def publish_schedule_change(job_id: str, action: str = "upsert"):
+    """Tell the schedule trigger loop (whichever replica leads it) that a job's schedule changed."""
+    r = get_redis()
+    r.publish(SCHEDULE_EVENTS_CHANNEL, json.dumps({"job_id": job_id, "action": action}))
+
+
+class ScheduleTimers:
+    """
+    Min-heap of schedule due times, loaded from Mongo when a replica takes the trigger lease
+    and kept current from `schedule_events` notifications. Each timer caches the job's
+    schedule, domain and priority so firing needs no read. Entries are invalidated lazily:
+    a heap entry only counts while it matches the job's latest due time.
+    """
+
+    PROJECTION = {"schedule": 1, "domain": 1, "priority": 1}
+
+    def __init__(self):
+        self._heap: List[Tuple[datetime, str]] = []
+        self._due: Dict[str, datetime] = {}
+        self._docs: Dict[str, Dict] = {}
+        self._lock = threading.Lock()
+
+    def __len__(self) -> int:
+        with self._lock:
+            return len(self._due)
+
+    def load(self, db) -> int:
+        docs = {doc["_id"]: doc for doc in db.job_definitions.find(SCHEDULED_QUERY, self.PROJECTION)}
+        with self._lock:
+            self._docs = docs
+            self._due = {job_id: doc["schedule"]["next_run_at"] for job_id, doc in docs.items()}
+            self._heap = [(when, job_id) for job_id, when in self._due.items()]
+            heapq.heapify(self._heap)
+        log.info("Loaded %d schedule timers", len(docs))
+        return len(docs)
+
+    def track(self, doc: Dict, due: Optional[datetime] = None):
+        """Arm (or re-arm) the timer for a job doc; `due` overrides the stored next_run_at."""
+        job_id = doc["_id"]
+        due = due or (doc.get("schedule") or {}).get("next_run_at")
+        if due is None:
+            self.remove(job_id)
+            return
+        with self._lock:
+            self._docs[job_id] = doc
+            if self._due.get(job_id) == due:
+                return
+            self._due[job_id] = due
+            heapq.heappush(self._heap, (due, job_id))
+            # Rebuild once stale entries dominate so edits cannot grow the heap unbounded
+            if len(self._heap) > 2 * len(self._due) + 64:
+                self._heap = [(when, jid) for jid, when in self._due.items()]
+                heapq.heapify(self._heap)
+
+    def remove(self, job_id: str):
+        with self._lock:
+            self._due.pop(job_id, None)
+            self._docs.pop(job_id, None)
+
+    def refresh_job(self, db, job_id: str):
+        """Re-read one job after a change notification."""
+        doc = db.job_definitions.find_one({"_id": job_id, **SCHEDULED_QUERY}, self.PROJECTION)
+        if doc:
+            self.track(doc)
+        else:
+            self.remove(job_id)
+
+    def _drop_stale(self):
+        while self._heap and self._due.get(self._heap[0][1]) != self._heap[0][0]:
+            heapq.heappop(self._heap)
+
+    def next_due(self) -> Optional[datetime]:
+        with self._lock:
+            self._drop_stale()
+            return self._heap[0][0] if self._heap else None
+
+    def pop_due(self, now: datetime, limit: int = 500) -> List[Tuple[Dict, datetime]]:
+        """Disarm and return up to `limit` (cached job doc, due) pairs that are due at `now`."""
+        due: List[Tuple[Dict, datetime]] = []
+        with self._lock:
+            while len(due) < limit:
+                self._drop_stale()
+                if not self._heap or self._heap[0][0] > now:
+                    break
+                when, job_id = heapq.heappop(self._heap)
+                self._due.pop(job_id, None)
+                due.append((self._docs.pop(job_id), when))
+        return due
+
+    def rearm(self, due: List[Tuple[Dict, datetime]]):
+        """Put back timers from pop_due whose firing failed, unless they were re-armed since."""
+        with self._lock:
+            for doc, when in due:
+                job_id = doc["_id"]
+                if job_id in self._due:
+                    continue
+                self._docs[job_id] = doc
+                self._due[job_id] = when
+                heapq.heappush(self._heap, (when, job_id))
+
+
+schedule_timers = ScheduleTimers()
@@ -1,163 +1,409 @@
+import json
 import os
 import threading
 import time
 import hashlib
-from datetime import datetime
-from typing import Dict, List
+from datetime import datetime, timedelta
+from typing import Dict, List, Tuple
 
-from pymongo import ReturnDocument
+from bson import ObjectId
+from pymongo import UpdateOne
 
 from .redis_client import get_redis
 from .mongo_client import get_db
-from .utils.affinity import passes_affinity
+from .utils.affinity_index import compile_affinity, signature_matches
 from .utils.selectors import select_best_worker
-from .utils.failover import failover_once
+from .utils.reservation import reserve_slot
+from .utils.envelope import build_envelope, job_attempts_key
+from .utils.parking import park_job, wake_parked
+from .utils.fairshare import fair_share
+from .utils.failover import QUEUE_AUDIT_SECONDS, audit_worker_queues, collect_dead_workers, failover_once
 from .utils.logging import setup_logging
 from .event_bus import event_bus
 from .models.job_definition import ScheduleConfig
-from .utils.schedule import advance_schedule
+from .utils.schedule import plan_schedule_fire
+from .worker_registry import worker_registry, WORKER_EVENTS_PATTERN
+from .schedule_timers import SCHEDULE_EVENTS_CHANNEL, ScheduleTimers, schedule_timers
+from .coordination import coordinator
 
 
 log = setup_logging("scheduler")
 
+REGISTRY_RECONCILE_SECONDS = float(os.getenv("SCHEDULER_REGISTRY_RECONCILE_SECONDS", "30"))
+PARKED_SWEEP_SECONDS = float(os.getenv("SCHEDULER_PARKED_SWEEP_SECONDS", "5"))
+PLACEMENT_STRATEGY = os.getenv("SCHEDULER_PLACEMENT_STRATEGY", "spread")
+DISPATCH_BATCH_SIZE = max(int(os.getenv("SCHEDULER_DISPATCH_BATCH_SIZE", "1")), 1)
+DISPATCH_MAX_WAIT = float(os.getenv("SCHEDULER_DISPATCH_MAX_WAIT_MS", "0")) / 1000.0
+FAIR_SHARE_ENABLED = os.getenv("SCHEDULER_FAIR_SHARE", "0").lower() in {"1", "true", "yes"}
+FAIR_SHARE_INGRESS = max(int(os.getenv("SCHEDULER_FAIR_SHARE_INGRESS", "1000")), 1)
+FAIR_SHARE_POLL_SECONDS = float(os.getenv("SCHEDULER_FAIR_SHARE_POLL_MS", "50")) / 1000.0
+SCHEDULE_RESYNC_SECONDS = float(os.getenv("SCHEDULER_SCHEDULE_RESYNC_SECONDS", "300"))
+SCHEDULE_MAX_SLEEP = float(os.getenv("SCHEDULER_SCHEDULE_MAX_SLEEP_SECONDS", "5"))
+SCHEDULE_REPLAY_SPACING = timedelta(seconds=1)
+WORKER_GC_INTERVAL = float(os.getenv("SCHEDULER_WORKER_GC_INTERVAL_SECONDS", "60"))
+
 
 def list_online_workers(ttl_seconds: int, domain: str) -> List[Dict]:
+    """Online workers with free slots, served from the in-memory registry."""
+    if worker_registry.needs_reconcile(domain, REGISTRY_RECONCILE_SECONDS):
+        worker_registry.reconcile(domain)
+    return worker_registry.online_workers(domain, ttl_seconds)
+
+
+def _can_take_work(worker: Dict, ttl_seconds: int) -> bool:
+    return (
+        worker.get("state", "online") == "online"
+        and time.time() - worker.get("last_heartbeat", 0) <= ttl_seconds
+        and worker["current_running"] + worker.get("reserved", 0) < worker["max_concurrency"]
+    )
+
+
+def worker_registry_loop(stop_event: threading.Event):
+    """
+    Keep the worker registry current from worker notifications plus periodic reconciliation,
+    and wake parked jobs when a worker that could run them registers, frees a slot or
+    returns to the online state.
+    """
     r = get_redis()
-    now = time.time()
-    workers: List[Dict] = []
-    for key in r.scan_iter(f"workers:{domain}:*"):
-        parts = key.split(":")
-        worker_id = parts[2] if len(parts) > 2 else parts[-1]
-        data = r.hgetall(key)
-        hb = r.zscore(f"worker_heartbeats:{domain}", worker_id) or 0
-        # Determine online by TTL
-        online = (now - hb) <= ttl_seconds
-        if not online:
+    ttl = int(os.getenv("SCHEDULER_HEARTBEAT_TTL", "10"))
+    pubsub = r.pubsub(ignore_subscribe_messages=True)
+    pubsub.psubscribe(WORKER_EVENTS_PATTERN)
+    log.info("Worker registry loop started (reconcile every %ss)", REGISTRY_RECONCILE_SECONDS)
+    last_check = 0.0
+    last_sweep = 0.0
+    try:
+        while not stop_event.is_set():
+            try:
+                message = pubsub.get_message(timeout=1.0)
+                if message and message.get("type") == "pmessage":
+                    event = json.loads(message["data"])
+                    updated = worker_registry.apply_event(event)
+                    if updated is None and event.get("type") != "removed":
+                        updated = worker_registry.refresh_worker(event["domain"], event["worker_id"])
+                    if updated and event.get("type") in {"register", "running", "state"} and _can_take_work(updated, ttl):
+                        moved = wake_parked(r, event["domain"], [updated])
+                        if moved:
+                            log.info("Woke %d parked job(s) for worker %s", moved, updated["worker_id"])
+                if time.time() - last_check < 1.0:
+                    continue
+                last_check = time.time()
+                domains = set(r.smembers("hydra:domains") or []) | set(worker_registry.domains())
+                for domain in domains:
+                    if worker_registry.needs_reconcile(domain, REGISTRY_RECONCILE_SECONDS):
+                        worker_registry.reconcile(domain)
+                if time.time() - last_sweep >= PARKED_SWEEP_SECONDS:
+                    # Safety net for notifications missed while a job was being parked
+                    last_sweep = time.time()
+                    for domain in domains:
+                        wake_parked(r, domain, worker_registry.online_workers(domain, ttl))
+            except Exception as e:
+                log.exception("Error in worker registry loop: %s", e)
+                time.sleep(1)
+    finally:
+        try:
+            pubsub.close()
+        except Exception:
+            pass
+
+
+def pop_pending_batch(r, pending_keys: List[str], batch_size: int, max_wait: float, timeout: int = 2) -> List[Tuple[str, str, float]]:
+    """Block for the first pending job, then drain up to batch_size jobs (waiting at most max_wait seconds)."""
+    popped = r.bzpopmax(pending_keys, timeout=timeout)
+    if not popped:
+        return []
+    batch = [tuple(popped)]
+    deadline = time.time() + max_wait
+    while len(batch) < batch_size:
+        for key in pending_keys:
+            remaining = batch_size - len(batch)
+            if remaining <= 0:
+                break
+            for job_id, score in r.zpopmax(key, remaining) or []:
+                batch.append((key, job_id, score))
+        left = deadline - time.time()
+        if len(batch) >= batch_size or left <= 0:
+            break
+        time.sleep(min(0.01, left))
+    return batch
+
+
+def dispatch_batch(r, db, popped: List[Tuple[str, str, float]], ttl: int) -> Tuple[List[Dict], List[Dict]]:
+    """
+    Place a batch of popped job IDs against one snapshot of worker capacity.
+    Definitions are fetched with a single $in query and every slot reservation + queue push
+    goes out in one pipeline; the reservation script re-checks capacity atomically so
+    concurrent replicas (or a stale snapshot) cannot overcommit a worker. Workers receive a
+    dispatch envelope (definition snapshot, run ID, attempt), not a bare job ID.
+    Returns (dispatched, unplaced) lists of {job_id, domain, worker_id?, run_id?, job?}.
+    """
+    job_ids = [job_id for _key, job_id, _score in popped]
+    jobs = {doc["_id"]: doc for doc in db.job_definitions.find({"_id": {"$in": job_ids}})}
+    by_domain: Dict[str, List[str]] = {}
+    for key, job_id, _score in popped:
+        if job_id in jobs:
+            by_domain.setdefault(jobs[job_id].get("domain", key.split(":")[1] if ":" in key else "prod"), []).append(job_id)
+    # Dispatches since each job's last committed run (bumped by failover requeues)
+    attempts: Dict[str, int] = {}
+    for domain, ids in by_domain.items():
+        attempts.update(zip(ids, (int(n or 0) for n in r.hmget(job_attempts_key(domain), ids))))
+    snapshots: Dict[str, Dict[str, Dict]] = {}
+    attempted: List[Dict] = []
+    unplaced: List[Dict] = []
+    pipe = r.pipeline(transaction=False)
+    for key, job_id, _score in popped:
+        job = jobs.get(job_id)
+        if not job:
+            log.error("Received job_id %s with no definition; skipping", job_id)
             continue
-        expected_hash = r.get(f"token_hash:{domain}")
-        worker_hash = data.get("domain_token_hash")
-        if expected_hash and worker_hash and worker_hash != expected_hash:
+        domain = job.get("domain", key.split(":")[1] if ":" in key else "prod")
+        if domain not in snapshots:
+            snapshots[domain] = {w["worker_id"]: w for w in list_online_workers(ttl, domain)}
+        snapshot = snapshots[domain]
+        signature = compile_affinity(job)
+        if worker_registry.has_index(domain):
+            matching = [snapshot[wid] for wid in worker_registry.candidate_ids(domain, signature) if wid in snapshot]
+        else:
+            matching = [w for w in snapshot.values() if signature_matches(signature, w)]
+        candidates = [w for w in matching if w["current_running"] + w.get("reserved", 0) < w["max_concurrency"]]
+        strategy = job.get("placement_strategy") or worker_registry.placement_strategy(domain) or PLACEMENT_STRATEGY
+        worker = select_best_worker(candidates, strategy)
+        if not worker:
+            unplaced.append({"job_id": job_id, "domain": domain, "job": job})
             continue
-        worker = {
-            "worker_id": worker_id,
-            "os": data.get("os", ""),
-            "tags": (data.get("tags", "") or "").split(",") if data.get("tags") else [],
-            "allowed_users": (data.get("allowed_users", "") or "").split(",") if data.get("allowed_users") else [],
-            "max_concurrency": int(data.get("max_concurrency", 1)),
-            "current_running": int(data.get("current_running", 0)),
-            "hostname": data.get("hostname", ""),
-            "ip": data.get("ip", ""),
-            "subnet": data.get("subnet", ""),
-            "deployment_type": data.get("deployment_type", ""),
-            "state": data.get("state", "online"),
-        }
-        # Only accept workers with available slots
-        if worker["state"] != "online":
+        # Consume the slot in the snapshot so later jobs in the batch see the reduced capacity
+        worker["reserved"] = worker.get("reserved", 0) + 1
+        wid = worker["worker_id"]
+        run_id = str(ObjectId())
+        reserve_slot(pipe, domain, wid, build_envelope(job, attempts.get(job_id, 0) + 1, run_id))
+        attempted.append({"job_id": job_id, "domain": domain, "worker_id": wid, "run_id": run_id, "job": job})
+    results = pipe.execute() if attempted else []
+    dispatched: List[Dict] = []
+    for item, reserved in zip(attempted, results):
+        if not reserved:
+            # Lost the race for the slot (another replica, or the worker changed state)
+            unplaced.append({"job_id": item["job_id"], "domain": item["domain"], "job": item["job"]})
             continue
-        if worker["current_running"] < worker["max_concurrency"]:
-            workers.append(worker)
-    return workers
+        worker_registry.adjust_reserved(item["domain"], item["worker_id"], +1)
+        dispatched.append(
+            {"job_id": item["job_id"], "domain": item["domain"], "worker_id": item["worker_id"], "run_id": item["run_id"]}
+        )
+    for item in dispatched:
+        # Mark a pending run exists (worker updates on start)
+        event_bus.publish("job_dispatched", item)
+        log.info("Dispatched job %s to worker %s", item["job_id"], item["worker_id"])
+    return dispatched, unplaced
 
 
 def scheduling_loop(stop_event: threading.Event):
     r = get_redis()
     db = get_db()
     ttl = int(os.getenv("SCHEDULER_HEARTBEAT_TTL", "10"))
-    log.info("Scheduling loop started (heartbeat TTL=%ss)", ttl)
+    log.info(
+        "Scheduling loop started (heartbeat TTL=%ss, batch size=%s, max wait=%ss)",
+        ttl,
+        DISPATCH_BATCH_SIZE,
+        DISPATCH_MAX_WAIT,
+    )
     while not stop_event.is_set():
         try:
-            domains = list(r.smembers("hydra:domains") or []) or ["prod"]
+            all_domains = list(r.smembers("hydra:domains") or []) or ["prod"]
+            # Each replica dispatches only the domains the hash ring assigns to it
+            domains = coordinator.owned_domains(all_domains)
+            if not domains:
+                stop_event.wait(1)
+                continue
             pending_keys = [f"job_queue:{d}:pending" for d in domains]
-            popped = r.bzpopmax(pending_keys, timeout=2)
+            if FAIR_SHARE_ENABLED:
+                # Move arrivals into per-tenant sub-queues, then pick the batch by weighted share
+                fair_share.route(r, db, pending_keys, FAIR_SHARE_INGRESS)
+                popped = fair_share.select(r, domains, DISPATCH_BATCH_SIZE)
+                if not popped:
+                    # Arrivals are read rather than popped, so there is no blocking pop to wait in
+                    stop_event.wait(FAIR_SHARE_POLL_SECONDS)
+            else:
+                popped = pop_pending_batch(r, pending_keys, DISPATCH_BATCH_SIZE, DISPATCH_MAX_WAIT)
             if not popped:
                 continue
-            key, job_id, _score = popped
-            domain = key.split(":")[1] if ":" in key else "prod"
-            job = db.job_definitions.find_one({"_id": job_id})
-            if not job:
-                log.error("Received job_id %s with no definition; skipping", job_id)
-                continue
-            domain = job.get("domain", domain)
-            candidates = [
-                w
-                for w in list_online_workers(ttl, domain)
-                if passes_affinity(job, w)
-            ]
-            worker = select_best_worker(candidates)
-            if not worker:
-                # No worker matches; requeue and backoff
-                log.warning("No eligible worker for job %s; requeuing", job_id)
-                r.zadd(f"job_queue:{domain}:pending", {job_id: float(job.get("priority", 5))})
-                event_bus.publish("job_pending", {"job_id": job_id, "reason": "no_worker", "domain": domain})
-                time.sleep(1)
-                continue
-            wid = worker["worker_id"]
-            r.rpush(f"job_queue:{domain}:{wid}", job_id)
-            # Mark a pending run exists (worker updates on start)
-            event_bus.publish("job_dispatched", {"job_id": job_id, "worker_id": wid, "domain": domain})
-            log.info("Dispatched job %s to worker %s", job_id, wid)
+            _dispatched, unplaced = dispatch_batch(r, db, popped, ttl)
+            for item in unplaced:
+                # No worker can take it right now; park it until a matching worker registers,
+                # frees capacity or comes back online (see worker_registry_loop)
+                job_id, domain, job = item["job_id"], item["domain"], item["job"]
+                sig_id = park_job(r, domain, job_id, compile_affinity(job), float(job.get("priority", 5)))
+                log.warning("No eligible worker for job %s; parked under %s", job_id, sig_id)
+                event_bus.publish(
+                    "job_pending", {"job_id": job_id, "reason": "no_worker", "parked": sig_id, "domain": domain}
+                )
         except Exception as e:
             log.exception("Error in scheduling loop: %s", e)
             time.sleep(1)
 
 
 def failover_loop(stop_event: threading.Event):
+    r = get_redis()
     ttl = int(os.getenv("SCHEDULER_HEARTBEAT_TTL", "10"))
     log.info("Failover loop started (TTL=%ss)", ttl)
+    last_gc = 0.0
+    last_audit = 0.0
     while not stop_event.is_set():
         try:
-            failover_once(ttl)
+            # Singleton: only the replica holding the failover lease sweeps
+            if coordinator.verify_leader(r, "failover"):
+                failover_once(ttl)
+                if time.time() - last_gc >= WORKER_GC_INTERVAL:
+                    collect_dead_workers()
+                    last_gc = time.time()
+                if time.time() - last_audit >= QUEUE_AUDIT_SECONDS:
+                    audit_worker_queues()
+                    last_audit = time.time()
         except Exception as e:
             log.exception("Error in failover loop: %s", e)
         time.sleep(2)
 
 
+def fire_due_schedules(r, db, timers: ScheduleTimers, due: List[Tuple[Dict, datetime]], fence: int, now: datetime) -> int:
+    """
+    Fire a batch of due schedules from the timers' cached docs: apply the misfire policy, persist
+    every advanced next_run_at in one bulk write and enqueue the runs in one pipeline.
+    """
+    if not due:
+        return 0
+    planned = []
+    ops = []
+    for job, _when in due:
+        schedule_doc = job.get("schedule") or {}
+        next_run_at = schedule_doc.get("next_run_at")
+        if not next_run_at:
+            continue
+        schedule = ScheduleConfig.model_validate(schedule_doc)
+        firing = plan_schedule_fire(schedule, now, job["_id"])
+        ops.append(
+            UpdateOne(
+                {
+                    "_id": job["_id"],
+                    # Also rejects the write when the cached schedule is out of date
+                    "schedule.next_run_at": next_run_at,
+                    # A deposed leader with an older token can no longer advance schedules
+                    "$or": [{"schedule_fence": {"$exists": False}}, {"schedule_fence": {"$lte": fence}}],
+                },
+                {"$set": {"schedule": firing.schedule.model_dump(by_alias=True), "schedule_fence": fence}},
+            )
+        )
+        planned.append((job, schedule, next_run_at, firing))
+    if not ops:
+        return 0
+
+    try:
+        result = db.job_definitions.bulk_write(ops, ordered=False)
+    except Exception:
+        # pop_due disarmed these; without the write nothing advanced, so they are still due
+        timers.rearm(due)
+        raise
+    if result.matched_count < len(ops):
+        # Some jobs changed underneath us (API edit or a newer leader); only fire the ones we advanced
+        current = {
+            doc["_id"]: doc
+            for doc in db.job_definitions.find(
+                {"_id": {"$in": [job["_id"] for job, *_ in planned]}}, {"schedule.next_run_at": 1, "schedule_fence": 1}
+            )
+        }
+        applied = []
+        for entry in planned:
+            doc = current.get(entry[0]["_id"]) or {}
+            if doc.get("schedule_fence") == fence and (doc.get("schedule") or {}).get("next_run_at") == entry[3].schedule.next_run_at:
+                applied.append(entry)
+            else:
+                timers.refresh_job(db, entry[0]["_id"])
+        planned = applied
+
+    fired = 0
+    pipe = r.pipeline(transaction=False)
+    for job, schedule, next_run_at, firing in planned:
+        advanced = firing.schedule
+        domain = job.get("domain", "prod")
+        if advanced.enabled and advanced.next_run_at:
+            # fire_all replays come back at most once per SCHEDULE_REPLAY_SPACING
+            timers.track(
+                {**job, "schedule": advanced.model_dump(by_alias=True)},
+                max(advanced.next_run_at, now + SCHEDULE_REPLAY_SPACING),
+            )
+        if firing.misfired:
+            log.info(
+                "Job %s missed its %s tick by %.0fs (policy %s, fired=%s)",
+                job["_id"], next_run_at, firing.late_seconds, schedule.misfire_policy, firing.fire,
+            )
+        if not firing.fire:
+            event_bus.publish(
+                "job_schedule_skipped",
+                {
+                    "job_id": job["_id"],
+                    "missed_at": next_run_at.isoformat(),
+                    "next_run_at": advanced.next_run_at.isoformat() if advanced.next_run_at else None,
+                    "domain": domain,
+                },
+            )
+            continue
+        pipe.zadd(f"job_queue:{domain}:pending", {job["_id"]: int(job.get("priority", 5))})
+        fired += 1
+        event_bus.publish(
+            "job_scheduled",
+            {
+                "job_id": job["_id"],
+                "mode": schedule.mode,
+                "misfired": firing.misfired,
+                "next_run_at": advanced.next_run_at.isoformat() if advanced.next_run_at else None,
+                "domain": domain,
+            },
+        )
+    pipe.execute()
+    return fired
+
+
 def schedule_trigger_loop(stop_event: threading.Event):
     r = get_redis()
     db = get_db()
+    pubsub = r.pubsub(ignore_subscribe_messages=True)
+    pubsub.subscribe(SCHEDULE_EVENTS_CHANNEL)
+    loaded_fence = 0
+    loaded_at = 0.0
     log.info("Schedule trigger loop started")
     while not stop_event.is_set():
         try:
+            # Singleton: only the lease holder fires schedules; its fencing token guards the writes
+            fence = coordinator.fencing_token("schedule_triggers")
+            if not fence:
+                loaded_fence = 0
+                # Keep draining notifications; the timers are reloaded on taking the lease
+                pubsub.get_message(timeout=1.0)
+                continue
+            if fence != loaded_fence or time.time() - loaded_at >= SCHEDULE_RESYNC_SECONDS:
+                # Full resync on taking the lease and periodically, since pub/sub can drop messages
+                schedule_timers.load(db)
+                loaded_fence = fence
+                loaded_at = time.time()
             now = datetime.utcnow()
-            domains = list(r.smembers("hydra:domains") or []) or ["prod"]
-            for domain in domains:
-                due_jobs = db.job_definitions.find(
-                    {
-                        "domain": domain,
-                        "schedule.mode": {"$in": ["cron", "interval"]},
-                        "schedule.enabled": True,
-                        "schedule.next_run_at": {"$ne": None, "$lte": now},
-                    }
-                ).limit(100)
-                for job in due_jobs:
-                    schedule_doc = job.get("schedule") or {}
-                    next_run_at = schedule_doc.get("next_run_at")
-                    if not next_run_at:
-                        continue
-                    schedule = ScheduleConfig.model_validate(schedule_doc)
-                    advanced = advance_schedule(schedule)
-                    updated = db.job_definitions.find_one_and_update(
-                        {
-                            "_id": job["_id"],
-                            "schedule.next_run_at": next_run_at,
-                        },
-                        {"$set": {"schedule": advanced.model_dump(by_alias=True)}},
-                        return_document=ReturnDocument.AFTER,
-                    )
-                    if not updated:
-                        continue
-                    priority = int(job.get("priority", 5))
-                    r.zadd(f"job_queue:{domain}:pending", {job["_id"]: priority})
-                    event_bus.publish(
-                        "job_scheduled",
-                        {
-                            "job_id": job["_id"],
-                            "mode": schedule.mode,
-                            "next_run_at": advanced.next_run_at.isoformat() if advanced.next_run_at else None,
-                            "domain": domain,
-                        },
-                    )
+            due = schedule_timers.pop_due(now)
+            if due:
+                fire_due_schedules(r, db, schedule_timers, due, fence, now)
+                continue
+            next_due = schedule_timers.next_due()
+            wait = SCHEDULE_MAX_SLEEP
+            if next_due is not None:
+                wait = min(max((next_due - datetime.utcnow()).total_seconds(), 0.0), SCHEDULE_MAX_SLEEP)
+            # Sleep until the next tick, waking early for schedule changes
+            message = pubsub.get_message(timeout=wait)
+            while message:
+                try:
+                    event = json.loads(message.get("data") or "{}")
+                except (TypeError, ValueError):
+                    event = {}
+                if event.get("job_id"):
+                    schedule_timers.refresh_job(db, event["job_id"])
+                message = pubsub.get_message(timeout=0)
         except Exception as exc:
             log.exception("Error in schedule trigger loop: %s", exc)
             time.sleep(1)
-        time.sleep(1)
+    try:
+        pubsub.close()
+    except Exception:
+        pass
@@ -0,0 +1,198 @@
+from functools import lru_cache
+from typing import Dict, FrozenSet, Iterable, List, NamedTuple, Optional, Tuple
+
+
+class AffinitySignature(NamedTuple):
+    """Normalized job affinity; matches exactly what passes_affinity accepts."""
+
+    os: FrozenSet[str]
+    tags: FrozenSet[str]
+    user: str
+    hostnames: FrozenSet[str]
+    subnets: FrozenSet[str]
+    deployment_types: FrozenSet[str]
+
+
+@lru_cache(maxsize=4096)
+def _compile(
+    oses: Tuple[str, ...],
+    tags: Tuple[str, ...],
+    user: str,
+    hostnames: Tuple[str, ...],
+    subnets: Tuple[str, ...],
+    deployment_types: Tuple[str, ...],
+) -> AffinitySignature:
+    return AffinitySignature(
+        os=frozenset(o.lower() for o in oses),
+        tags=frozenset(t.lower() for t in tags),
+        user=user,
+        hostnames=frozenset(h.lower() for h in hostnames),
+        subnets=frozenset(subnets),
+        deployment_types=frozenset(t.lower() for t in deployment_types),
+    )
+
+
+def compile_affinity(job: Dict) -> AffinitySignature:
+    affinity = job.get("affinity") or {}
+    return _compile(
+        tuple(affinity.get("os") or ()),
+        tuple(affinity.get("tags") or ()),
+        job.get("user", "") or "",
+        tuple(affinity.get("hostnames") or ()),
+        tuple(affinity.get("subnets") or ()),
+        tuple(affinity.get("deployment_types") or ()),
+    )
+
+
+def signature_matches(signature: AffinitySignature, worker: Dict) -> bool:
+    """Check a single worker against a compiled signature (no per-call set rebuilding of the job side)."""
+    if signature.os and (worker.get("os") or "").lower() not in signature.os:
+        return False
+    if signature.tags and not signature.tags.issubset({t.lower() for t in worker.get("tags") or []}):
+        return False
+    allowed = worker.get("allowed_users") or []
+    if allowed and signature.user not in allowed:
+        return False
+    if signature.hostnames and (worker.get("hostname") or "").lower() not in signature.hostnames:
+        return False
+    if signature.subnets and (worker.get("subnet") or "") not in signature.subnets:
+        return False
+    if signature.deployment_types and (worker.get("deployment_type") or "").lower() not in signature.deployment_types:
+        return False
+    return True
+
+
+def _worker_key(worker: Dict) -> Tuple:
+    return (
+        (worker.get("os") or "").lower(),
+        frozenset(t.lower() for t in worker.get("tags") or []),
+        frozenset(worker.get("allowed_users") or []),
+        (worker.get("hostname") or "").lower(),
+        worker.get("subnet") or "",
+        (worker.get("deployment_type") or "").lower(),
+    )
+
+
+class AffinityIndex:
+    """
+    Bitset index over a domain's workers. Each worker owns one bit; os, tag, hostname,
+    subnet, deployment type and allowed user values map to the bitset of workers having
+    them, so candidate lookup is a handful of integer ANDs instead of a scan.
+    Not thread-safe on its own; WorkerRegistry guards it with its lock.
+    """
+
+    def __init__(self):
+        self._bits: Dict[str, int] = {}
+        self._ids: List[Optional[str]] = []
+        self._free: List[int] = []
+        self._keys: Dict[str, Tuple] = {}
+        self._all = 0
+        self._open_users = 0
+        self._os: Dict[str, int] = {}
+        self._tags: Dict[str, int] = {}
+        self._users: Dict[str, int] = {}
+        self._hosts: Dict[str, int] = {}
+        self._subnets: Dict[str, int] = {}
+        self._deploy: Dict[str, int] = {}
+
+    def __len__(self) -> int:
+        return len(self._bits)
+
+    @staticmethod
+    def _set(bucket: Dict[str, int], value: str, bit: int):
+        bucket[value] = bucket.get(value, 0) | bit
+
+    @staticmethod
+    def _clear(bucket: Dict[str, int], value: str, bit: int):
+        remaining = bucket.get(value, 0) & ~bit
+        if remaining:
+            bucket[value] = remaining
+        else:
+            bucket.pop(value, None)
+
+    def _apply(self, key: Tuple, bit: int, add: bool):
+        op = self._set if add else self._clear
+        os_name, tags, users, host, subnet, deploy = key
+        op(self._os, os_name, bit)
+        for tag in tags:
+            op(self._tags, tag, bit)
+        if users:
+            for user in users:
+                op(self._users, user, bit)
+        elif add:
+            self._open_users |= bit
+        else:
+            self._open_users &= ~bit
+        op(self._hosts, host, bit)
+        op(self._subnets, subnet, bit)
+        op(self._deploy, deploy, bit)
+
+    def update_worker(self, worker: Dict) -> bool:
+        """Index (or re-index) a worker; returns False when its affinity metadata is unchanged."""
+        worker_id = worker["worker_id"]
+        key = _worker_key(worker)
+        old_key = self._keys.get(worker_id)
+        if old_key == key:
+            return False
+        if old_key is not None:
+            bit = 1 << self._bits[worker_id]
+            self._apply(old_key, bit, add=False)
+        else:
+            position = self._free.pop() if self._free else len(self._ids)
+            if position == len(self._ids):
+                self._ids.append(worker_id)
+            else:
+                self._ids[position] = worker_id
+            self._bits[worker_id] = position
+            bit = 1 << position
+            self._all |= bit
+        self._keys[worker_id] = key
+        self._apply(key, bit, add=True)
+        return True
+
+    def remove_worker(self, worker_id: str):
+        position = self._bits.pop(worker_id, None)
+        if position is None:
+            return
+        bit = 1 << position
+        self._apply(self._keys.pop(worker_id), bit, add=False)
+        self._all &= ~bit
+        self._ids[position] = None
+        self._free.append(position)
+
+    def worker_ids(self) -> Iterable[str]:
+        return list(self._bits.keys())
+
+    @staticmethod
+    def _union(bucket: Dict[str, int], values: FrozenSet[str]) -> int:
+        mask = 0
+        for value in values:
+            mask |= bucket.get(value, 0)
+        return mask
+
+    def match_mask(self, signature: AffinitySignature) -> int:
+        mask = self._all
+        if signature.os:
+            mask &= self._union(self._os, signature.os)
+        for tag in signature.tags:
+            if not mask:
+                return 0
+            mask &= self._tags.get(tag, 0)
+        mask &= self._open_users | self._users.get(signature.user, 0)
+        if signature.hostnames:
+            mask &= self._union(self._hosts, signature.hostnames)
+        if signature.subnets:
+            mask &= self._union(self._subnets, signature.subnets)
+        if signature.deployment_types:
+            mask &= self._union(self._deploy, signature.deployment_types)
+        return mask
+
+    def candidates(self, signature: AffinitySignature) -> List[str]:
+        """Worker IDs whose metadata satisfies the signature."""
+        mask = self.match_mask(signature)
+        result: List[str] = []
+        while mask:
+            low = mask & -mask
+            result.append(self._ids[low.bit_length() - 1])
+            mask ^= low
+        return result
@@ -0,0 +1,38 @@
+from typing import Iterable, List
+
+from .fairshare import tenant_queue_key, tenants_key
+from .parking import parked_queue_keys
+
+
+def waiting_queue_keys(r, domain: str) -> List[str]:
+    """
+    Every sorted set that holds a domain's jobs waiting for dispatch: the pending queue, the
+    fair-share sub-queues it is routed into and the parked queues of jobs no worker can take yet.
+    """
+    tenants = sorted(r.smembers(tenants_key(domain)) or [])
+    return [
+        f"job_queue:{domain}:pending",
+        *(tenant_queue_key(domain, tenant) for tenant in tenants),
+        *parked_queue_keys(r, domain),
+    ]
+
+
+def waiting_count(r, domain: str) -> int:
+    keys = waiting_queue_keys(r, domain)
+    pipe = r.pipeline(transaction=False)
+    for key in keys:
+        pipe.zcard(key)
+    return sum(int(n or 0) for n in pipe.execute())
+
+
+def waiting_job_ids(r, domain: str, job_ids: Iterable[str]) -> set:
+    """The subset of `job_ids` queued in any of the domain's waiting queues."""
+    job_ids = list(job_ids)
+    keys = waiting_queue_keys(r, domain)
+    pipe = r.pipeline(transaction=False)
+    for key in keys:
+        pipe.zmscore(key, job_ids)
+    waiting = set()
+    for scores in pipe.execute() if job_ids else []:
+        waiting.update(job_id for job_id, score in zip(job_ids, scores or []) if score is not None)
+    return waiting
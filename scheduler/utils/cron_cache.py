@@ -0,0 +1,162 @@
+import hashlib
+import os
+import re
+import threading
+from bisect import bisect_right
+from datetime import datetime, timezone as dt_timezone
+from functools import lru_cache
+from typing import List, Optional
+from zoneinfo import ZoneInfo, ZoneInfoNotFoundError
+
+from croniter import croniter
+
+from .logging import setup_logging
+
+
+log = setup_logging("scheduler.cron_cache")
+
+CRON_CACHE_SIZE = int(os.getenv("SCHEDULER_CRON_CACHE_SIZE", "4096"))
+CRON_WINDOW = max(int(os.getenv("SCHEDULER_CRON_WINDOW", "64")), 1)
+
+
+# (low, high) for minute, hour, day of month, month, day of week and the optional seconds field.
+# Hashed days of month stop at 28 so every month has the chosen day.
+_HASH_RANGES = ((0, 59), (0, 23), (1, 28), (1, 12), (0, 6), (0, 59))
+_HASH_TOKEN = re.compile(r"^H(?:\((\d+)-(\d+)\))?(?:/(\d+))?$")
+
+
+def stable_hash(key: str, salt: str = "") -> int:
+    return int(hashlib.sha1(f"{key}:{salt}".encode()).hexdigest()[:12], 16)
+
+
+def _resolve_hash_token(token: str, position: int, key: str) -> str:
+    match = _HASH_TOKEN.match(token)
+    if not match:
+        raise ValueError(f"Invalid H field: {token}")
+    low, high = _HASH_RANGES[position]
+    if match.group(1) is not None:
+        low, high = int(match.group(1)), int(match.group(2))
+        if low > high:
+            raise ValueError(f"Invalid H range: {token}")
+    step = int(match.group(3)) if match.group(3) else None
+    if step is not None and step <= 0:
+        raise ValueError(f"Invalid H step: {token}")
+    value = stable_hash(key, str(position))
+    if step is None:
+        return str(low + value % (high - low + 1))
+    return f"{low + value % step}-{high}/{step}"
+
+
+@lru_cache(maxsize=CRON_CACHE_SIZE)
+def resolve_hash_fields(expr: str, key: str) -> str:
+    """
+    Replace Jenkins-style `H` fields (`H`, `H/15`, `H(0-29)`, `H(0-29)/10`) with values
+    derived from a stable hash of `key` (the job ID), so jobs sharing an expression spread
+    out while each job keeps the same slot forever.
+    """
+    if "H" not in expr:
+        return expr
+    fields = expr.split()
+    for position, field in enumerate(fields[: len(_HASH_RANGES)]):
+        if "H" in field:
+            fields[position] = ",".join(
+                _resolve_hash_token(part, position, key) if "H" in part else part for part in field.split(",")
+            )
+    return " ".join(fields)
+
+
+@lru_cache(maxsize=CRON_CACHE_SIZE)
+def is_valid_cron(expr: str) -> bool:
+    try:
+        return croniter.is_valid(resolve_hash_fields(expr, ""))
+    except ValueError:
+        return False
+
+
+def _zone(name: Optional[str]):
+    if not name or name.upper() == "UTC":
+        return None
+    try:
+        return ZoneInfo(name)
+    except (ZoneInfoNotFoundError, ValueError):
+        log.warning("Unknown schedule timezone %r; using UTC", name)
+        return None
+
+
+class CompiledCron:
+    """
+    A parsed cron expression bound to a timezone. Fire times go in and out as naive UTC
+    (the form stored in Mongo); the expression is evaluated on the zone's wall clock.
+    The last computed window of ticks is kept, so the many jobs sharing an expression
+    (and the same job on successive advances) are answered with a bisect.
+    """
+
+    def __init__(self, expr: str, timezone: str = "UTC", window: int = CRON_WINDOW):
+        self.expr = expr
+        self.timezone = timezone
+        self._zone = _zone(timezone)
+        self._iter = croniter(expr, datetime(2000, 1, 1))
+        self._window_size = window
+        self._window_from: Optional[datetime] = None
+        self._window: List[datetime] = []
+        self._lock = threading.Lock()
+
+    def _to_local(self, when: datetime) -> datetime:
+        if self._zone is None:
+            return when
+        return when.replace(tzinfo=dt_timezone.utc).astimezone(self._zone).replace(tzinfo=None)
+
+    def _to_utc(self, local: datetime) -> datetime:
+        if self._zone is None:
+            return local
+        return local.replace(tzinfo=self._zone).astimezone(dt_timezone.utc).replace(tzinfo=None)
+
+    def _compute(self, when: datetime, count: int) -> List[datetime]:
+        # Iterate on the naive wall clock (croniter's own tz handling is unreliable across DST);
+        # ticks that land in a skipped hour can map backwards in UTC, so keep the sequence increasing
+        self._iter.set_current(self._to_local(when), force=True)
+        ticks: List[datetime] = []
+        last = when
+        while len(ticks) < count:
+            tick = self._to_utc(self._iter.get_next(datetime))
+            if tick > last:
+                ticks.append(tick)
+                last = tick
+        return ticks
+
+    def next_n(self, when: datetime, count: int) -> List[datetime]:
+        """The next `count` fire times strictly after `when`."""
+        with self._lock:
+            window = self._window
+            if self._window_from is not None and self._window_from <= when and window and when < window[-1]:
+                start = bisect_right(window, when)
+                if len(window) - start >= count:
+                    return window[start : start + count]
+            ticks = self._compute(when, max(count, self._window_size))
+            self._window_from = when
+            self._window = ticks
+            return ticks[:count]
+
+    def next_after(self, when: datetime) -> datetime:
+        return self.next_n(when, 1)[0]
+
+    def between(self, start: datetime, end: datetime, limit: int) -> List[datetime]:
+        """Fire times in (start, end], at most `limit`; leaves the cached window alone."""
+        with self._lock:
+            self._iter.set_current(self._to_local(start), force=True)
+            ticks: List[datetime] = []
+            last = start
+            while len(ticks) < limit:
+                tick = self._to_utc(self._iter.get_next(datetime))
+                if tick > end:
+                    break
+                if tick > last:
+                    ticks.append(tick)
+                    last = tick
+            return ticks
+
+
+@lru_cache(maxsize=CRON_CACHE_SIZE)
+def compile_cron(expr: str, timezone: str = "UTC") -> CompiledCron:
+    """Compiled schedule for (cron, timezone), shared and LRU-evicted across all jobs."""
+    return CompiledCron(expr, timezone or "UTC")
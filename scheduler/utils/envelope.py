@@ -0,0 +1,62 @@
+import json
+import time
+from datetime import datetime
+from typing import Dict, Optional
+
+from bson import ObjectId
+
+
+ENVELOPE_VERSION = 1
+
+# Definition fields the worker has no use for; `schedule` is cut down to what run docs record
+_DROPPED_FIELDS = ("schedule", "updated_at")
+
+
+def _encode(value):
+    if isinstance(value, datetime):
+        return value.isoformat()
+    if isinstance(value, ObjectId):
+        return str(value)
+    raise TypeError(f"Cannot encode {type(value).__name__} in a dispatch envelope")
+
+
+def job_snapshot(job: Dict) -> Dict:
+    snapshot = {k: v for k, v in job.items() if k not in _DROPPED_FIELDS}
+    schedule = job.get("schedule") or {}
+    snapshot["schedule"] = {"mode": schedule.get("mode", "immediate"), "next_run_at": schedule.get("next_run_at")}
+    return snapshot
+
+
+def build_envelope(job: Dict, attempt: int = 1, run_id: Optional[str] = None, dispatched_at: Optional[float] = None) -> str:
+    """
+    The item pushed onto a worker queue: a versioned, self-contained dispatch record carrying
+    the definition as it was when dispatched, so the worker neither re-reads Mongo nor runs
+    a later edit. `attempt` counts dispatches since the job's last committed run.
+    """
+    return json.dumps(
+        {
+            "v": ENVELOPE_VERSION,
+            "job_id": job["_id"],
+            "run_id": run_id or str(ObjectId()),
+            "dispatched_at": dispatched_at if dispatched_at is not None else time.time(),
+            "attempt": attempt,
+            "job": job_snapshot(job),
+        },
+        separators=(",", ":"),
+        default=_encode,
+    )
+
+
+def parse_queue_item(item: str) -> Dict:
+    """Decode a worker queue item: an envelope, or a bare job ID queued by an older scheduler."""
+    if item.startswith("{"):
+        try:
+            envelope = json.loads(item)
+            return {"job_id": envelope["job_id"], "job": envelope.get("job"), "attempt": envelope.get("attempt", 1)}
+        except (ValueError, KeyError):
+            pass
+    return {"job_id": item, "job": None, "attempt": 1}
+
+
+def job_attempts_key(domain: str) -> str:
+    return f"job_attempts:{domain}"
@@ -1,47 +1,293 @@
+import os
 import time
-from typing import List
+from datetime import datetime
+from typing import Dict, Iterable, List, Optional, Tuple
 
+from bson import ObjectId
+from bson.errors import InvalidId
+
+from ..mongo_client import get_db
+from .envelope import job_attempts_key, parse_queue_item
 from ..redis_client import get_redis
 from .logging import setup_logging
 from ..event_bus import event_bus
+from ..worker_registry import publish_worker_event
 
 
 log = setup_logging("scheduler.failover")
 
+# Workers silent for this long are forgotten entirely (hash, heartbeat entry, queues)
+WORKER_GC_SECONDS = float(os.getenv("SCHEDULER_WORKER_GC_SECONDS", "86400"))
+QUEUE_AUDIT_SECONDS = float(os.getenv("SCHEDULER_QUEUE_AUDIT_SECONDS", "60"))
+GC_BATCH = 100
+LEASE_BATCH = 500
+
+# Move a worker's queued-but-unstarted jobs (and, with a fifth key, the ones it popped into
+# its processing list but has not started) back to pending. Items are removed one by one with
+# LREM so a job the worker takes concurrently goes to exactly one place; every job that moved
+# gives its reservation back and counts as another dispatch attempt. ARGV holds
+# (queue item, job_id, priority) triples - items are dispatch envelopes or bare job IDs.
+RECLAIM_BACKLOG_LUA = """
+local moved = 0
+for i = 1, #ARGV, 3 do
+    local removed = redis.call('LREM', KEYS[1], 0, ARGV[i])
+    if KEYS[5] then
+        removed = removed + redis.call('LREM', KEYS[5], 0, ARGV[i])
+    end
+    if removed > 0 then
+        redis.call('ZADD', KEYS[2], ARGV[i + 2], ARGV[i + 1])
+        redis.call('HINCRBY', KEYS[4], ARGV[i + 1], 1)
+        moved = moved + removed
+    end
+end
+if moved > 0 and redis.call('EXISTS', KEYS[3]) == 1 then
+    local reserved = tonumber(redis.call('HGET', KEYS[3], 'reserved') or '0') or 0
+    redis.call('HSET', KEYS[3], 'reserved', math.max(reserved - moved, 0))
+end
+return moved
+"""
+
+_reclaim_script = None
+
+# Claim one expired run lease: only the sweep that removes it gets its data, and a lease the
+# worker renewed in the meantime is left alone. Key names mirror worker/utils/leases.py.
+EXPIRE_RUN_LEASE_LUA = """
+local score = redis.call('ZSCORE', KEYS[2], ARGV[1])
+if not score or tonumber(score) > tonumber(ARGV[2]) then
+    return nil
+end
+local lease = redis.call('HGETALL', KEYS[1])
+redis.call('DEL', KEYS[1])
+redis.call('ZREM', KEYS[2], ARGV[1])
+return lease
+"""
+
+_expire_script = None
+
+
+def failover_cursor_key(domain: str) -> str:
+    return f"failover:{domain}:cursor"
+
+
+def _domains(r) -> List[str]:
+    return sorted(r.smembers("hydra:domains") or []) or ["prod"]
+
+
+def _offline_by_domain(r, ttl_seconds: int, now: float) -> Tuple[float, Dict[str, List[str]]]:
+    cutoff = now - ttl_seconds
+    domains = _domains(r)
+    pipe = r.pipeline(transaction=False)
+    for domain in domains:
+        pipe.get(failover_cursor_key(domain))
+    cursors = pipe.execute()
+    pipe = r.pipeline(transaction=False)
+    for domain, cursor in zip(domains, cursors):
+        low = f"({cursor}" if cursor is not None else "-inf"
+        pipe.zrangebyscore(f"worker_heartbeats:{domain}", low, cutoff)
+    return cutoff, {domain: list(worker_ids or []) for domain, worker_ids in zip(domains, pipe.execute())}
+
+
+def find_offline_workers(ttl_seconds: int, now: Optional[float] = None) -> List[str]:
+    """
+    Workers whose heartbeat expired since the previous sweep. Each domain keeps a cursor
+    (the expiry cutoff of its last sweep) in Redis, so a dead worker is reported exactly
+    once - even across failover-leader changes - and a sweep only touches new expiries.
+    Read-only: the cursor is moved by failover_once once the workers have been reclaimed.
+    """
+    now = now if now is not None else time.time()
+    _cutoff, by_domain = _offline_by_domain(get_redis(), ttl_seconds, now)
+    return [f"{domain}:{worker_id}" for domain, worker_ids in by_domain.items() for worker_id in worker_ids]
+
+
+def job_priorities(job_ids: Iterable[str]) -> Dict[str, int]:
+    """Pending-queue score for each job: its own priority, falling back to the default of 5."""
+    job_ids = list(job_ids)
+    priorities = {job_id: 5 for job_id in job_ids}
+    if job_ids:
+        for doc in get_db().job_definitions.find({"_id": {"$in": job_ids}}, {"priority": 1}):
+            priorities[doc["_id"]] = int(doc.get("priority", 5))
+    return priorities
+
+
+def _mark_run_lost(run_id: Optional[str], now: datetime) -> bool:
+    """Close a run whose lease expired; False when the run already finished (nothing to requeue)."""
+    if not run_id:
+        return True
+    try:
+        oid = ObjectId(run_id)
+    except InvalidId:
+        return True
+    res = get_db().job_runs.update_one(
+        {"_id": oid, "status": "running"},
+        {"$set": {"status": "lost", "end_ts": now, "completion_reason": "run lease expired"}},
+    )
+    return res.matched_count > 0
+
+
+def expire_run_leases(now: Optional[float] = None) -> List[Dict]:
+    """
+    Detect runs whose lease was not renewed in time, per run rather than per worker: a worker
+    that is alive but wedged on one job loses just that job. The run is marked lost and the job
+    requeued at its original priority; the stale holder's fencing token no longer matches, so
+    record_run_end refuses its late result.
+    """
+    global _expire_script
+    r = get_redis()
+    now = now if now is not None else time.time()
+    if _expire_script is None:
+        _expire_script = r.register_script(EXPIRE_RUN_LEASE_LUA)
+    expired = []
+    for domain in _domains(r):
+        leases_key = f"run_leases:{domain}"
+        for member in r.zrangebyscore(leases_key, "-inf", now, start=0, num=LEASE_BATCH) or []:
+            job_id, _, fence = member.rpartition(":")
+            raw = _expire_script(keys=[f"run_lease:{domain}:{job_id}:{fence}", leases_key], args=[member, now])
+            if raw is None:
+                continue
+            lease = dict(zip(raw[::2], raw[1::2]))
+            worker_id = lease.get("worker_id", "")
+            requeue = _mark_run_lost(lease.get("run_id"), datetime.utcfromtimestamp(now))
+            pipe = r.pipeline(transaction=False)
+            if requeue:
+                pipe.zadd(f"job_queue:{domain}:pending", {job_id: int(lease.get("priority") or 5)})
+                pipe.hincrby(job_attempts_key(domain), job_id, 1)
+            pipe.delete(f"job_running:{domain}:{job_id}")
+            if worker_id:
+                pipe.srem(f"worker_running_set:{domain}:{worker_id}", job_id)
+            pipe.execute()
+            if requeue:
+                log.warning("Run lease for job %s (fence %s) on worker %s expired; requeued", job_id, fence, worker_id)
+                event_bus.publish(
+                    "job_requeued",
+                    {"job_id": job_id, "worker_id": worker_id, "domain": domain, "fence": int(fence), "reason": "lease_expired"},
+                )
+            expired.append({"domain": domain, "job_id": job_id, "fence": int(fence), "requeued": requeue})
+    return expired
+
+
+def reclaim_worker_backlog(domain: str, worker_id: str, reason: str = "offline", in_flight: bool = False) -> int:
+    """
+    Return jobs waiting in job_queue:<domain>:<worker_id> to pending at their own priority.
+    `in_flight` also takes back jobs the worker popped but never started (its processing list);
+    only use it for workers that are gone, since a live worker starts those any moment.
+    """
+    global _reclaim_script
+    r = get_redis()
+    keys = [
+        f"job_queue:{domain}:{worker_id}",
+        f"job_queue:{domain}:pending",
+        f"workers:{domain}:{worker_id}",
+        job_attempts_key(domain),
+    ]
+    if in_flight:
+        keys.append(f"job_processing:{domain}:{worker_id}")
+    pipe = r.pipeline(transaction=False)
+    for key in keys[:1] + keys[4:]:
+        pipe.lrange(key, 0, -1)
+    backlog = {item: parse_queue_item(item) for items in pipe.execute() for item in items or []}
+    if not backlog:
+        return 0
+    if _reclaim_script is None:
+        _reclaim_script = r.register_script(RECLAIM_BACKLOG_LUA)
+    # Envelopes carry the priority they were dispatched with; bare IDs are looked up
+    priorities = job_priorities({parsed["job_id"] for parsed in backlog.values() if not parsed["job"]})
+    args = []
+    for item, parsed in backlog.items():
+        job_id = parsed["job_id"]
+        priority = (parsed["job"] or {}).get("priority", priorities.get(job_id, 5))
+        args.extend([item, job_id, priority])
+    moved = int(_reclaim_script(keys=keys, args=args) or 0)
+    if moved:
+        log.warning("Reclaimed %d queued job(s) from %s worker %s", moved, reason, worker_id)
+        event_bus.publish(
+            "worker_backlog_reclaimed", {"worker_id": worker_id, "domain": domain, "jobs": moved, "reason": reason}
+        )
+    return moved
+
 
-def find_offline_workers(ttl_seconds: int) -> List[str]:
+def audit_worker_queues() -> Dict[str, int]:
+    """
+    Find per-worker queues nobody will drain - the worker hash is gone, marked offline, or no
+    longer accepting work - and reclaim them. Catches backlogs left behind by crashes between
+    sweeps, state changes made straight in Redis, and workers restarted under a new ID.
+    """
     r = get_redis()
-    now = time.time()
-    offline = []
-    # Get all workers with heartbeat older than TTL per domain
-    for key in r.scan_iter("worker_heartbeats:*"):
-        domain = key.split(":")[1]
-        heartbeats = r.zrange(key, 0, -1, withscores=True)
-        for worker_id, ts in heartbeats:
-            if now - ts > ttl_seconds:
-                offline.append(f"{domain}:{worker_id}")
-    return offline
+    reclaimed: Dict[str, int] = {}
+    for domain in _domains(r):
+        worker_ids = set()
+        for prefix in (f"job_queue:{domain}:", f"job_processing:{domain}:"):
+            worker_ids.update(key[len(prefix) :] for key in r.scan_iter(match=f"{prefix}*", _type="list"))
+        if not worker_ids:
+            continue
+        worker_ids = sorted(worker_ids)
+        pipe = r.pipeline(transaction=False)
+        for worker_id in worker_ids:
+            pipe.hmget(f"workers:{domain}:{worker_id}", "status", "state")
+        for worker_id, (status, state) in zip(worker_ids, pipe.execute()):
+            if status is None and state is None:
+                reason = "orphaned"
+            elif status == "offline":
+                reason = "offline"
+            elif (state or "online") != "online":
+                reason = state
+            else:
+                continue
+            moved = reclaim_worker_backlog(domain, worker_id, reason, in_flight=reason in {"orphaned", "offline"})
+            if moved:
+                reclaimed[f"{domain}:{worker_id}"] = moved
+    return reclaimed
 
 
 def requeue_jobs_for_worker(domain_and_worker: str):
+    """
+    Mark an offline worker, reclaim its queued and popped-but-unstarted jobs and reset its
+    counters. Its runs are recovered by expire_run_leases as their leases lapse, which also
+    covers jobs started by a worker that is still heartbeating.
+    """
     r = get_redis()
     domain, worker_id = domain_and_worker.split(":", 1)
-    set_key = f"worker_running_set:{domain}:{worker_id}"
-    job_ids = r.smembers(set_key) or []
-    if job_ids:
-        log.warning("Requeuing %d job(s) from offline worker %s", len(job_ids), worker_id)
-    for job_id in job_ids:
-        # Clean running markers and requeue
-        r.delete(f"job_running:{domain}:{job_id}")
-        r.zadd(f"job_queue:{domain}:pending", {job_id: 5})
-        r.srem(set_key, job_id)
-        event_bus.publish("job_requeued", {"job_id": job_id, "worker_id": worker_id, "domain": domain})
-        # Optionally update last run doc to pending again (leave as is; worker will update when rerun)
-    # Reset current_running counter to 0
-    r.hset(f"workers:{domain}:{worker_id}", mapping={"current_running": 0, "status": "offline"})
-
-
-def failover_once(ttl_seconds: int):
-    offline_workers = find_offline_workers(ttl_seconds)
-    for wid in offline_workers:
-        requeue_jobs_for_worker(wid)
+    reclaim_worker_backlog(domain, worker_id, in_flight=True)
+    running = r.scard(f"worker_running_set:{domain}:{worker_id}") or 0
+    if running:
+        log.warning("Offline worker %s held %d run(s); they are requeued when their leases expire", worker_id, running)
+    r.hset(f"workers:{domain}:{worker_id}", mapping={"current_running": 0, "reserved": 0, "status": "offline"})
+    publish_worker_event(domain, worker_id, "offline", {"current_running": 0, "reserved": 0})
+    event_bus.publish("worker_offline", {"worker_id": worker_id, "domain": domain, "running": running})
+
+
+def collect_dead_workers(now: Optional[float] = None, gc_seconds: float = WORKER_GC_SECONDS) -> List[str]:
+    """Delete workers that have been silent for gc_seconds; jobs left in their queue go back to pending."""
+    r = get_redis()
+    now = now if now is not None else time.time()
+    collected = []
+    for domain in _domains(r):
+        heartbeats_key = f"worker_heartbeats:{domain}"
+        for worker_id in r.zrangebyscore(heartbeats_key, "-inf", now - gc_seconds, start=0, num=GC_BATCH) or []:
+            reclaim_worker_backlog(domain, worker_id, "removed", in_flight=True)
+            pipe = r.pipeline(transaction=False)
+            pipe.delete(
+                f"workers:{domain}:{worker_id}",
+                f"worker_running_set:{domain}:{worker_id}",
+                f"job_queue:{domain}:{worker_id}",
+                f"job_processing:{domain}:{worker_id}",
+            )
+            pipe.zrem(heartbeats_key, worker_id)
+            pipe.execute()
+            publish_worker_event(domain, worker_id, "removed")
+            collected.append(f"{domain}:{worker_id}")
+    if collected:
+        log.info("Garbage-collected %d long-dead worker(s): %s", len(collected), ", ".join(collected))
+    return collected
+
+
+def failover_once(ttl_seconds: int, now: Optional[float] = None):
+    r = get_redis()
+    now = now if now is not None else time.time()
+    cutoff, by_domain = _offline_by_domain(r, ttl_seconds, now)
+    for domain, worker_ids in by_domain.items():
+        for worker_id in worker_ids:
+            requeue_jobs_for_worker(f"{domain}:{worker_id}")
+        # Only after the domain's workers are reclaimed: if this sweep dies part-way, the next
+        # one sees the same expiries again instead of skipping past them
+        r.set(failover_cursor_key(domain), cutoff)
+    expire_run_leases()
@@ -0,0 +1,270 @@
+import threading
+from typing import Dict, List, Tuple
+
+from .logging import setup_logging
+
+
+log = setup_logging("scheduler.fairshare")
+
+DEFAULT_TENANT = "default"
+MIN_WEIGHT = 0.01
+
+
+def tenants_key(domain: str) -> str:
+    return f"job_queue:{domain}:tenants"
+
+
+def tenant_queue_key(domain: str, tenant: str) -> str:
+    return f"job_queue:{domain}:tenant:{tenant}"
+
+
+def user_weights_key(domain: str) -> str:
+    return f"fairshare:{domain}:weights"
+
+
+def dispatched_key(domain: str) -> str:
+    return f"fairshare:{domain}:dispatched"
+
+
+DOMAIN_WEIGHTS_KEY = "fairshare:domains"
+
+# Forget a tenant only if its sub-queue is really empty (route() may have refilled it)
+FORGET_TENANT_LUA = """
+if redis.call('ZCARD', KEYS[1]) == 0 then
+    return redis.call('SREM', KEYS[2], ARGV[1])
+end
+return 0
+"""
+
+# Move jobs from a pending queue (KEYS[1]) into their tenant sub-queues. ARGV holds
+# (job_id, tenant) pairs, KEYS[2i], KEYS[2i+1] the matching sub-queue and tenants set; a job
+# keeps the score it has in pending at the time of the move and is skipped if it left pending
+ROUTE_PENDING_LUA = """
+local moved = 0
+for i = 1, #ARGV, 2 do
+    local score = redis.call('ZSCORE', KEYS[1], ARGV[i])
+    if score then
+        redis.call('ZREM', KEYS[1], ARGV[i])
+        redis.call('ZADD', KEYS[i + 1], score, ARGV[i])
+        redis.call('SADD', KEYS[i + 2], ARGV[i + 1])
+        moved = moved + 1
+    end
+end
+return moved
+"""
+
+
+def tenant_for(job: Dict) -> str:
+    return job.get("user") or DEFAULT_TENANT
+
+
+def _weight(weights: Dict[str, float], name: str) -> float:
+    try:
+        return max(float(weights.get(name, 1.0)), MIN_WEIGHT)
+    except (TypeError, ValueError):
+        return 1.0
+
+
+def allocate(
+    backlogs: Dict[str, int],
+    weights: Dict[str, float],
+    deficits: Dict[str, float],
+    quota: int,
+    cursor: int = 0,
+) -> Tuple[Dict[str, int], int]:
+    """
+    Deficit round robin: split `quota` dispatch slots among backlogged queues in proportion to
+    their weights. `deficits` carries each queue's unspent credit between calls (mutated in place)
+    and `cursor` is where the previous call stopped; returns (slots per queue, next cursor).
+    """
+    names = sorted(n for n, size in backlogs.items() if size > 0)
+    alloc: Dict[str, int] = {n: 0 for n in names}
+    for name in list(deficits):
+        if name not in alloc:
+            # Queues that drained lose their credit, as in classic DRR
+            deficits.pop(name, None)
+    if not names or quota <= 0:
+        return alloc, cursor
+    position = cursor % len(names)
+    while quota > 0:
+        progressed = False
+        for step in range(len(names)):
+            name = names[(position + step) % len(names)]
+            remaining = backlogs[name] - alloc[name]
+            if remaining <= 0:
+                continue
+            progressed = True
+            deficits[name] = deficits.get(name, 0.0) + _weight(weights, name)
+            take = min(int(deficits[name]), remaining, quota)
+            alloc[name] += take
+            deficits[name] -= take
+            quota -= take
+            if backlogs[name] - alloc[name] <= 0:
+                deficits[name] = 0.0
+            if quota <= 0:
+                position = (position + step + 1) % len(names)
+                break
+        if not progressed:
+            break
+    return alloc, position
+
+
+class FairShareScheduler:
+    """
+    Weighted fair queueing across domains and, within a domain, across users (tenants).
+    Jobs still arrive on `job_queue:{domain}:pending`; route() moves them into per-tenant
+    sub-queues and select() pops the next batch with two-level deficit round robin so
+    dispatch interleaves tenants in proportion to their configured shares.
+    """
+
+    def __init__(self):
+        self._domain_deficits: Dict[str, float] = {}
+        self._domain_cursor = 0
+        self._tenant_deficits: Dict[str, Dict[str, float]] = {}
+        self._tenant_cursors: Dict[str, int] = {}
+        self._forget_script = None
+        self._route_script = None
+        self._lock = threading.Lock()
+
+    def backlogs(self, r, domains: List[str]) -> Dict[str, Dict[str, int]]:
+        pipe = r.pipeline(transaction=False)
+        for domain in domains:
+            pipe.smembers(tenants_key(domain))
+        tenant_sets = pipe.execute()
+        pipe = r.pipeline(transaction=False)
+        order: List[Tuple[str, str]] = []
+        for domain, tenants in zip(domains, tenant_sets):
+            for tenant in tenants or []:
+                order.append((domain, tenant))
+                pipe.zcard(tenant_queue_key(domain, tenant))
+        sizes = pipe.execute() if order else []
+        result: Dict[str, Dict[str, int]] = {d: {} for d in domains}
+        for (domain, tenant), size in zip(order, sizes):
+            result[domain][tenant] = int(size or 0)
+        return result
+
+    def route(self, r, db, pending_keys: List[str], limit: int) -> int:
+        """
+        Move up to `limit` jobs per pending queue into their tenant sub-queues (keeping priority).
+        Arrivals are only read here and moved by one script per queue, so a failed definition
+        lookup or Redis error leaves them in pending for the next pass. A job whose definition
+        is gone goes to the default sub-queue, where dispatch reports it as it would without
+        fair share. Returns the number of jobs moved.
+        """
+        pipe = r.pipeline(transaction=False)
+        for key in pending_keys:
+            pipe.zrevrange(key, 0, limit - 1)
+        peeked = [(key, job_ids) for key, job_ids in zip(pending_keys, pipe.execute()) if job_ids]
+        if not peeked:
+            return 0
+        job_ids = [job_id for _key, ids in peeked for job_id in ids]
+        jobs = {doc["_id"]: doc for doc in db.job_definitions.find({"_id": {"$in": job_ids}}, {"user": 1, "domain": 1})}
+        if self._route_script is None:
+            self._route_script = r.register_script(ROUTE_PENDING_LUA)
+        moved = 0
+        for key, ids in peeked:
+            pending_domain = key.split(":")[1] if ":" in key else "prod"
+            keys, args = [key], []
+            for job_id in ids:
+                job = jobs.get(job_id)
+                if job:
+                    domain, tenant = job.get("domain", pending_domain), tenant_for(job)
+                else:
+                    log.warning("Pending job %s has no definition; routing it to the default sub-queue", job_id)
+                    domain, tenant = pending_domain, DEFAULT_TENANT
+                keys.extend([tenant_queue_key(domain, tenant), tenants_key(domain)])
+                args.extend([job_id, tenant])
+            moved += int(self._route_script(keys=keys, args=args) or 0)
+        return moved
+
+    def select(self, r, domains: List[str], batch_size: int) -> List[Tuple[str, str, float]]:
+        """Pop up to batch_size jobs across domains/tenants according to their shares."""
+        backlogs = self.backlogs(r, domains)
+        pipe = r.pipeline(transaction=False)
+        pipe.hgetall(DOMAIN_WEIGHTS_KEY)
+        for domain in domains:
+            pipe.hgetall(user_weights_key(domain))
+        weight_docs = pipe.execute()
+        domain_weights = weight_docs[0] or {}
+        user_weights = {d: w or {} for d, w in zip(domains, weight_docs[1:])}
+
+        with self._lock:
+            domain_alloc, self._domain_cursor = allocate(
+                {d: sum(t.values()) for d, t in backlogs.items()},
+                domain_weights,
+                self._domain_deficits,
+                batch_size,
+                self._domain_cursor,
+            )
+            plan: List[Tuple[str, str, int]] = []
+            for domain, slots in domain_alloc.items():
+                if not slots:
+                    continue
+                tenant_alloc, cursor = allocate(
+                    backlogs[domain],
+                    user_weights[domain],
+                    self._tenant_deficits.setdefault(domain, {}),
+                    slots,
+                    self._tenant_cursors.get(domain, 0),
+                )
+                self._tenant_cursors[domain] = cursor
+                plan.extend((domain, tenant, n) for tenant, n in tenant_alloc.items() if n)
+        if not plan:
+            return []
+
+        pipe = r.pipeline(transaction=False)
+        for domain, tenant, n in plan:
+            pipe.zpopmax(tenant_queue_key(domain, tenant), n)
+        results = pipe.execute()
+        if self._forget_script is None:
+            self._forget_script = r.register_script(FORGET_TENANT_LUA)
+        popped: List[Tuple[str, str, float]] = []
+        pipe = r.pipeline(transaction=False)
+        for (domain, tenant, _n), items in zip(plan, results):
+            key = tenant_queue_key(domain, tenant)
+            for job_id, score in items or []:
+                popped.append((key, job_id, score))
+            if items:
+                pipe.hincrby(dispatched_key(domain), tenant, len(items))
+            if backlogs[domain][tenant] <= len(items or []):
+                self._forget_script(keys=[key, tenants_key(domain)], args=[tenant], client=pipe)
+        pipe.execute()
+        return popped
+
+    def deficits(self, domain: str) -> Dict[str, float]:
+        with self._lock:
+            return dict(self._tenant_deficits.get(domain, {}))
+
+    def usage(self, r, domain: str) -> Dict:
+        """Configured share vs. observed dispatch share for every tenant of a domain."""
+        backlog = self.backlogs(r, [domain])[domain]
+        pipe = r.pipeline(transaction=False)
+        pipe.hgetall(user_weights_key(domain))
+        pipe.hgetall(dispatched_key(domain))
+        pipe.hget(DOMAIN_WEIGHTS_KEY, domain)
+        weights, dispatched, domain_weight = pipe.execute()
+        weights = weights or {}
+        dispatched = {t: int(n) for t, n in (dispatched or {}).items()}
+        deficits = self.deficits(domain)
+        tenants = sorted(set(backlog) | set(weights) | set(dispatched))
+        active_weight = sum(_weight(weights, t) for t in tenants if backlog.get(t))
+        total_dispatched = sum(dispatched.values())
+        return {
+            "domain": domain,
+            "weight": _weight({domain: domain_weight} if domain_weight else {}, domain),
+            "tenants": [
+                {
+                    "user": t,
+                    "weight": _weight(weights, t),
+                    "share": round(_weight(weights, t) / active_weight, 4) if backlog.get(t) else 0.0,
+                    "backlog": backlog.get(t, 0),
+                    "dispatched": dispatched.get(t, 0),
+                    "dispatched_share": round(dispatched.get(t, 0) / total_dispatched, 4) if total_dispatched else 0.0,
+                    "deficit": round(deficits.get(t, 0.0), 4),
+                }
+                for t in tenants
+            ],
+        }
+
+
+fair_share = FairShareScheduler()
@@ -0,0 +1,92 @@
+import hashlib
+import json
+from typing import Dict, List
+
+from .affinity_index import AffinitySignature, signature_matches
+
+
+# Move every job parked under one affinity signature back into the pending zset, keeping
+# the higher score if a job is somehow in both, and forget the signature.
+WAKE_PARKED_LUA = """
+local moved = redis.call('ZCARD', KEYS[2])
+if moved > 0 then
+    redis.call('ZUNIONSTORE', KEYS[1], 2, KEYS[1], KEYS[2], 'AGGREGATE', 'MAX')
+end
+redis.call('DEL', KEYS[2])
+redis.call('HDEL', KEYS[3], ARGV[1])
+return moved
+"""
+
+_wake_script = None
+
+
+def parked_signatures_key(domain: str) -> str:
+    return f"job_queue:{domain}:parked"
+
+
+def parked_queue_key(domain: str, signature_id: str) -> str:
+    return f"job_queue:{domain}:parked:{signature_id}"
+
+
+def _signature_doc(signature: AffinitySignature) -> Dict:
+    return {field: sorted(value) if isinstance(value, frozenset) else value for field, value in signature._asdict().items()}
+
+
+def signature_id(signature: AffinitySignature) -> str:
+    raw = json.dumps(_signature_doc(signature), sort_keys=True)
+    return hashlib.sha1(raw.encode()).hexdigest()[:16]
+
+
+def _signature_from_doc(doc: Dict) -> AffinitySignature:
+    return AffinitySignature(
+        **{field: value if field == "user" else frozenset(value) for field, value in doc.items()}
+    )
+
+
+def park_job(r, domain: str, job_id: str, signature: AffinitySignature, priority: float) -> str:
+    """Park an unplaceable job under its affinity signature; returns the signature id."""
+    sig_id = signature_id(signature)
+    # MULTI/EXEC so a concurrent wake never sees the job without its signature entry
+    pipe = r.pipeline(transaction=True)
+    pipe.hset(parked_signatures_key(domain), sig_id, json.dumps(_signature_doc(signature)))
+    pipe.zadd(parked_queue_key(domain, sig_id), {job_id: priority})
+    pipe.execute()
+    return sig_id
+
+
+def parked_queue_keys(r, domain: str) -> List[str]:
+    return [parked_queue_key(domain, sig_id) for sig_id in sorted(r.hkeys(parked_signatures_key(domain)) or [])]
+
+
+def load_parked_signatures(r, domain: str) -> Dict[str, AffinitySignature]:
+    raw = r.hgetall(parked_signatures_key(domain)) or {}
+    return {sig_id: _signature_from_doc(json.loads(doc)) for sig_id, doc in raw.items()}
+
+
+def wake_parked(r, domain: str, workers: List[Dict]) -> int:
+    """
+    Return parked jobs to the pending queue for every signature that at least one of
+    `workers` can satisfy. Callers pass only workers that are online with a free slot.
+    Returns the number of jobs moved.
+    """
+    global _wake_script
+    if not workers:
+        return 0
+    signatures = load_parked_signatures(r, domain)
+    if not signatures:
+        return 0
+    if _wake_script is None:
+        _wake_script = r.register_script(WAKE_PARKED_LUA)
+    moved = 0
+    for sig_id, signature in signatures.items():
+        if not any(signature_matches(signature, w) for w in workers):
+            continue
+        moved += int(
+            _wake_script(
+                keys=[f"job_queue:{domain}:pending", parked_queue_key(domain, sig_id), parked_signatures_key(domain)],
+                args=[sig_id],
+                client=r,
+            )
+            or 0
+        )
+    return moved
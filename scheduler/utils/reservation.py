@@ -0,0 +1,49 @@
+from typing import Any
+
+from ..redis_client import get_redis
+
+
+# Check capacity and reserve a slot on the worker in one server-side step, then hand the
+# job to the worker queue. `reserved` counts jobs dispatched but not yet started; the
+# worker converts a reservation into `current_running` when it pops the job.
+RESERVE_SLOT_LUA = """
+if redis.call('EXISTS', KEYS[1]) == 0 then
+    return 0
+end
+local state = redis.call('HGET', KEYS[1], 'state') or 'online'
+if state ~= 'online' then
+    return 0
+end
+local max_concurrency = tonumber(redis.call('HGET', KEYS[1], 'max_concurrency') or '1') or 1
+local running = tonumber(redis.call('HGET', KEYS[1], 'current_running') or '0') or 0
+local reserved = tonumber(redis.call('HGET', KEYS[1], 'reserved') or '0') or 0
+if running + reserved >= max_concurrency then
+    return 0
+end
+redis.call('HINCRBY', KEYS[1], 'reserved', 1)
+redis.call('RPUSH', KEYS[2], ARGV[1])
+return 1
+"""
+
+_reserve_script = None
+
+
+def _get_reserve_script():
+    global _reserve_script
+    if _reserve_script is None:
+        _reserve_script = get_redis().register_script(RESERVE_SLOT_LUA)
+    return _reserve_script
+
+
+def reserve_slot(client: Any, domain: str, worker_id: str, payload: str):
+    """
+    Atomically reserve a slot on worker_id and push payload to its queue.
+    `client` may be the Redis client or a pipeline; the script returns 1 when reserved, 0 when the
+    worker is full, not online, or gone.
+    """
+    script = _get_reserve_script()
+    return script(
+        keys=[f"workers:{domain}:{worker_id}", f"job_queue:{domain}:{worker_id}"],
+        args=[payload],
+        client=client,
+    )
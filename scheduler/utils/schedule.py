@@ -1,9 +1,8 @@
 from datetime import datetime, timedelta
-from typing import Optional
-
-from croniter import croniter
+from typing import List, NamedTuple, Optional
 
 from ..models.job_definition import ScheduleConfig
+from .cron_cache import CompiledCron, compile_cron, resolve_hash_fields, stable_hash
 
 
 def _clamp_to_window(candidate: Optional[datetime], schedule: ScheduleConfig) -> Optional[datetime]:
@@ -14,7 +13,26 @@ def _clamp_to_window(candidate: Optional[datetime], schedule: ScheduleConfig) ->
     return candidate
 
 
-def initialize_schedule(schedule: ScheduleConfig, now: datetime) -> ScheduleConfig:
+def _jitter(schedule: ScheduleConfig, job_id: Optional[str]) -> timedelta:
+    """Stable per-job offset in [0, jitter_seconds] so jobs sharing a cadence do not fire together."""
+    if not schedule.jitter_seconds:
+        return timedelta(0)
+    return timedelta(seconds=stable_hash(job_id or "", "jitter") % (schedule.jitter_seconds + 1))
+
+
+def _compiled(schedule: ScheduleConfig, job_id: Optional[str]) -> CompiledCron:
+    if not schedule.cron:
+        raise ValueError("cron schedule requires cron expression")
+    return compile_cron(resolve_hash_fields(schedule.cron, job_id or ""), schedule.timezone)
+
+
+def _cron_next_after(schedule: ScheduleConfig, job_id: Optional[str], when: datetime) -> datetime:
+    # Jitter shifts the whole tick sequence, so work in un-jittered time and shift back
+    offset = _jitter(schedule, job_id)
+    return _compiled(schedule, job_id).next_after(when - offset) + offset
+
+
+def initialize_schedule(schedule: ScheduleConfig, now: datetime, job_id: Optional[str] = None) -> ScheduleConfig:
     """Ensure schedule.next_run_at is set for cron/interval modes."""
     if not schedule.enabled or schedule.mode == "immediate":
         return schedule.copy(update={"next_run_at": None})
@@ -22,20 +40,19 @@ def initialize_schedule(schedule: ScheduleConfig, now: datetime) -> ScheduleConf
     if schedule.mode == "cron":
         base = schedule.start_at or now
         base = max(base, now)
-        if not schedule.cron:
-            raise ValueError("cron schedule requires cron expression")
-        next_run = croniter(schedule.cron, base).get_next(datetime)
+        next_run = _cron_next_after(schedule, job_id, base)
     else:  # interval
         if not schedule.interval_seconds or schedule.interval_seconds <= 0:
             raise ValueError("interval schedule requires positive interval_seconds")
         start = schedule.start_at or now
-        next_run = start if start > now else now
+        # Later ticks stay aligned to this first one, so the jitter carries forward
+        next_run = (start if start > now else now) + _jitter(schedule, job_id)
 
     next_run = _clamp_to_window(next_run, schedule)
     return schedule.copy(update={"next_run_at": next_run})
 
 
-def advance_schedule(schedule: ScheduleConfig) -> ScheduleConfig:
+def advance_schedule(schedule: ScheduleConfig, job_id: Optional[str] = None) -> ScheduleConfig:
     """Advance schedule.next_run_at after a run dispatch."""
     if not schedule.enabled or schedule.mode == "immediate":
         return schedule.copy(update={"next_run_at": None})
@@ -43,9 +60,7 @@ def advance_schedule(schedule: ScheduleConfig) -> ScheduleConfig:
     last_run = schedule.next_run_at or datetime.utcnow()
 
     if schedule.mode == "cron":
-        if not schedule.cron:
-            raise ValueError("cron schedule requires cron expression")
-        next_run = croniter(schedule.cron, last_run).get_next(datetime)
+        next_run = _cron_next_after(schedule, job_id, last_run)
     else:
         if not schedule.interval_seconds or schedule.interval_seconds <= 0:
             raise ValueError("interval schedule requires positive interval_seconds")
@@ -55,3 +70,86 @@ def advance_schedule(schedule: ScheduleConfig) -> ScheduleConfig:
     if next_run is None:
         return schedule.copy(update={"next_run_at": None, "enabled": False})
     return schedule.copy(update={"next_run_at": next_run})
+
+
+def _tick_at_or_after(schedule: ScheduleConfig, anchor: datetime, when: datetime, job_id: Optional[str] = None) -> datetime:
+    """First tick >= when, computed directly (no walking over the ticks in between)."""
+    if schedule.mode == "cron":
+        return _cron_next_after(schedule, job_id, when - timedelta(microseconds=1))
+    if not schedule.interval_seconds or schedule.interval_seconds <= 0:
+        raise ValueError("interval schedule requires positive interval_seconds")
+    if when <= anchor:
+        return anchor
+    step = timedelta(seconds=schedule.interval_seconds)
+    # Interval ticks stay aligned to the original anchor
+    return anchor + step * -(-(when - anchor) // step)
+
+
+def _tick_after(schedule: ScheduleConfig, anchor: datetime, when: datetime, job_id: Optional[str] = None) -> datetime:
+    """First tick strictly after `when`."""
+    if schedule.mode == "cron":
+        return _cron_next_after(schedule, job_id, when)
+    tick = _tick_at_or_after(schedule, anchor, when)
+    return tick if tick > when else tick + timedelta(seconds=schedule.interval_seconds)
+
+
+class ScheduleFiring(NamedTuple):
+    fire: bool
+    schedule: ScheduleConfig
+    misfired: bool
+    late_seconds: float
+
+
+def plan_schedule_fire(schedule: ScheduleConfig, now: datetime, job_id: Optional[str] = None) -> ScheduleFiring:
+    """
+    Decide whether a due schedule fires now and where its next tick lands, applying the
+    misfire policy. A tick later than misfire_grace_seconds is a misfire: `fire_once`
+    fires one run and jumps to the next future tick, `skip` jumps without firing, and
+    `fire_all` replays missed ticks one per pass but only within max_catchup_seconds.
+    """
+    if not schedule.enabled or schedule.mode == "immediate" or not schedule.next_run_at:
+        return ScheduleFiring(False, schedule.copy(update={"next_run_at": None}), False, 0.0)
+
+    due = schedule.next_run_at
+    late = (now - due).total_seconds()
+    misfired = late > schedule.misfire_grace_seconds
+    fire = True
+    if not misfired:
+        next_run = _tick_after(schedule, due, due if schedule.misfire_policy == "fire_all" else now, job_id)
+    elif schedule.misfire_policy == "fire_all":
+        if schedule.max_catchup_seconds and late > schedule.max_catchup_seconds:
+            # Drop ticks older than the catch-up window; replay resumes from its oldest tick
+            due = _tick_at_or_after(schedule, due, now - timedelta(seconds=schedule.max_catchup_seconds), job_id)
+            fire = due <= now
+        next_run = _tick_after(schedule, due, due, job_id) if fire else due
+    else:
+        fire = schedule.misfire_policy == "fire_once"
+        next_run = _tick_after(schedule, due, now, job_id)
+
+    next_run = _clamp_to_window(next_run, schedule)
+    if next_run is None:
+        advanced = schedule.copy(update={"next_run_at": None, "enabled": False})
+    else:
+        advanced = schedule.copy(update={"next_run_at": next_run})
+    return ScheduleFiring(fire, advanced, misfired, max(late, 0.0))
+
+
+def upcoming_fire_times(
+    schedule: ScheduleConfig, start: datetime, end: datetime, limit: int = 10000, job_id: Optional[str] = None
+) -> List[datetime]:
+    """Fire times in [start, end) from the schedule's next_run_at on, at most `limit` (for forecasts)."""
+    if not schedule.enabled or schedule.mode == "immediate" or not schedule.next_run_at or limit <= 0:
+        return []
+    if schedule.end_at and schedule.end_at < end:
+        end = schedule.end_at + timedelta(microseconds=1)
+    anchor = schedule.next_run_at
+    first = anchor if anchor >= start else _tick_at_or_after(schedule, anchor, start, job_id)
+    if first >= end:
+        return []
+    if schedule.mode == "cron":
+        offset = _jitter(schedule, job_id)
+        rest = _compiled(schedule, job_id).between(first - offset, end - offset - timedelta(microseconds=1), limit - 1)
+        return [first] + [tick + offset for tick in rest]
+    step = timedelta(seconds=schedule.interval_seconds)
+    count = min(limit, -(-(end - first) // step))
+    return [first + step * i for i in range(count)]
@@ -1,14 +1,48 @@
-from typing import Dict, List, Optional
+import random
+from typing import Callable, Dict, List, Optional
 
 
-def select_best_worker(candidates: List[Dict]) -> Optional[Dict]:
-    if not candidates:
-        return None
-    # Select by lowest load (current_running / max_concurrency) then by absolute current_running
-    def load_key(w: Dict):
-        max_c = max(int(w.get("max_concurrency", 1)), 1)
-        cur = int(w.get("current_running", 0))
-        return (cur / max_c, cur)
+def _used(w: Dict) -> int:
+    return int(w.get("current_running", 0)) + int(w.get("reserved", 0))
+
+
+def _load(w: Dict) -> float:
+    return _used(w) / max(int(w.get("max_concurrency", 1)), 1)
+
+
+def spread(candidates: List[Dict]) -> Dict:
+    # Select by lowest load ((current_running + reserved) / max_concurrency) then by absolute load
+    return min(candidates, key=lambda w: (_load(w), _used(w)))
+
+
+def binpack(candidates: List[Dict]) -> Dict:
+    # Fill the busiest worker that still has room so idle workers stay idle (and can scale down)
+    return min(candidates, key=lambda w: (-_load(w), int(w.get("max_concurrency", 1)) - _used(w), w.get("worker_id", "")))
 
-    return sorted(candidates, key=load_key)[0]
 
+def weighted(candidates: List[Dict]) -> Dict:
+    # Least work per CPU, using the cpu_count workers publish at registration
+    return min(candidates, key=lambda w: ((_used(w) + 1) / max(int(w.get("cpu_count") or 1), 1), _load(w)))
+
+
+def power_of_two(candidates: List[Dict], rng: random.Random = random) -> Dict:
+    # Sample two candidates and keep the less loaded one: O(1) per decision for very large fleets
+    if len(candidates) <= 2:
+        return spread(candidates)
+    a, b = rng.sample(candidates, 2)
+    return a if (_load(a), _used(a)) <= (_load(b), _used(b)) else b
+
+
+STRATEGIES: Dict[str, Callable[[List[Dict]], Dict]] = {
+    "spread": spread,
+    "binpack": binpack,
+    "weighted": weighted,
+    "p2c": power_of_two,
+}
+DEFAULT_STRATEGY = "spread"
+
+
+def select_best_worker(candidates: List[Dict], strategy: Optional[str] = None) -> Optional[Dict]:
+    if not candidates:
+        return None
+    return STRATEGIES.get(strategy or DEFAULT_STRATEGY, spread)(candidates)
@@ -0,0 +1,240 @@
+import json
+import threading
+import time
+from typing import Dict, List, Optional
+
+from .redis_client import get_redis
+from .utils.affinity_index import AffinityIndex, AffinitySignature
+from .utils.logging import setup_logging
+
+
+log = setup_logging("scheduler.worker_registry")
+
+WORKER_EVENTS_PATTERN = "worker_events:*"
+
+
+def worker_events_channel(domain: str) -> str:
+    return f"worker_events:{domain}"
+
+
+def publish_worker_event(domain: str, worker_id: str, event_type: str, fields: Optional[Dict] = None):
+    """Notify registries (in every scheduler replica) that a worker hash changed."""
+    r = get_redis()
+    payload = {"type": event_type, "domain": domain, "worker_id": worker_id, "fields": fields or {}, "ts": time.time()}
+    r.publish(worker_events_channel(domain), json.dumps(payload))
+
+
+def parse_worker_hash(worker_id: str, data: Dict) -> Dict:
+    """Convert a raw `workers:{domain}:{id}` hash into the dict shape used for placement."""
+    return {
+        "worker_id": worker_id,
+        "os": data.get("os", ""),
+        "tags": (data.get("tags", "") or "").split(",") if data.get("tags") else [],
+        "allowed_users": (data.get("allowed_users", "") or "").split(",") if data.get("allowed_users") else [],
+        "max_concurrency": int(data.get("max_concurrency", 1)),
+        "cpu_count": int(data.get("cpu_count", 0) or 0) or None,
+        "current_running": int(data.get("current_running", 0)),
+        "reserved": int(data.get("reserved", 0) or 0),
+        "hostname": data.get("hostname", ""),
+        "ip": data.get("ip", ""),
+        "subnet": data.get("subnet", ""),
+        "deployment_type": data.get("deployment_type", ""),
+        "state": data.get("state", "online"),
+        "domain_token_hash": data.get("domain_token_hash"),
+    }
+
+
+def scan_workers(domain: str) -> Dict[str, Dict]:
+    """Read every worker hash and heartbeat for a domain straight from Redis."""
+    r = get_redis()
+    heartbeats = dict(r.zrange(f"worker_heartbeats:{domain}", 0, -1, withscores=True) or [])
+    workers: Dict[str, Dict] = {}
+    for key in r.scan_iter(f"workers:{domain}:*"):
+        parts = key.split(":")
+        worker_id = parts[2] if len(parts) > 2 else parts[-1]
+        data = r.hgetall(key)
+        if not data:
+            continue
+        worker = parse_worker_hash(worker_id, data)
+        worker["last_heartbeat"] = heartbeats.get(worker_id, 0)
+        workers[worker_id] = worker
+    return workers
+
+
+class WorkerRegistry:
+    """
+    Scheduler-side view of every worker, kept current from worker notifications
+    (register / heartbeat / running / state) and periodically reconciled against Redis.
+    Placement reads from here so the dispatch hot path never scans Redis.
+    """
+
+    # Fields compared by check_consistency; heartbeats drift by design and are excluded.
+    COMPARED_FIELDS = ("os", "tags", "allowed_users", "max_concurrency", "hostname", "subnet", "deployment_type", "state")
+
+    def __init__(self):
+        self._workers: Dict[str, Dict[str, Dict]] = {}
+        self._indexes: Dict[str, AffinityIndex] = {}
+        self._token_hashes: Dict[str, Optional[str]] = {}
+        self._strategies: Dict[str, Optional[str]] = {}
+        self._reconciled_at: Dict[str, float] = {}
+        self._lock = threading.Lock()
+
+    def domains(self) -> List[str]:
+        with self._lock:
+            return list(self._workers.keys())
+
+    def get(self, domain: str, worker_id: str) -> Optional[Dict]:
+        with self._lock:
+            worker = self._workers.get(domain, {}).get(worker_id)
+            return dict(worker) if worker else None
+
+    def upsert(self, domain: str, worker: Dict):
+        with self._lock:
+            self._workers.setdefault(domain, {})[worker["worker_id"]] = dict(worker)
+            self._indexes.setdefault(domain, AffinityIndex()).update_worker(worker)
+
+    def remove(self, domain: str, worker_id: str):
+        with self._lock:
+            self._workers.get(domain, {}).pop(worker_id, None)
+            index = self._indexes.get(domain)
+            if index is not None:
+                index.remove_worker(worker_id)
+
+    def placement_strategy(self, domain: str) -> Optional[str]:
+        """Domain-level placement strategy as of the last reconcile (None means the scheduler default)."""
+        with self._lock:
+            return self._strategies.get(domain)
+
+    def has_index(self, domain: str) -> bool:
+        with self._lock:
+            return domain in self._indexes
+
+    def candidate_ids(self, domain: str, signature: AffinitySignature) -> List[str]:
+        """Worker IDs (online or not) whose metadata satisfies a compiled affinity signature."""
+        with self._lock:
+            index = self._indexes.get(domain)
+            return index.candidates(signature) if index is not None else []
+
+    def apply_event(self, event: Dict) -> Optional[Dict]:
+        """Apply a worker notification; returns the updated worker (or None if unknown)."""
+        domain = event.get("domain")
+        worker_id = event.get("worker_id")
+        if not domain or not worker_id:
+            return None
+        event_type = event.get("type")
+        fields = event.get("fields") or {}
+        if event_type == "removed":
+            self.remove(domain, worker_id)
+            return None
+        with self._lock:
+            workers = self._workers.setdefault(domain, {})
+            current = workers.get(worker_id)
+            if event_type == "register":
+                current = parse_worker_hash(worker_id, fields)
+                current["last_heartbeat"] = float(event.get("ts") or time.time())
+                workers[worker_id] = current
+                self._indexes.setdefault(domain, AffinityIndex()).update_worker(current)
+            elif current is None:
+                # Heard about a worker we have not loaded yet; the next reconcile picks it up.
+                return None
+            if event_type == "heartbeat":
+                current["last_heartbeat"] = float(event.get("ts") or time.time())
+            if "current_running" in fields:
+                current["current_running"] = int(fields["current_running"])
+            if "reserved" in fields:
+                current["reserved"] = int(fields["reserved"])
+            if "state" in fields:
+                current["state"] = fields["state"]
+            if "max_concurrency" in fields:
+                current["max_concurrency"] = int(fields["max_concurrency"])
+            return dict(current)
+
+    def online_workers(self, domain: str, ttl_seconds: int, now: Optional[float] = None) -> List[Dict]:
+        """Online, token-valid, state=online workers that still have a free slot."""
+        now = now if now is not None else time.time()
+        with self._lock:
+            expected_hash = self._token_hashes.get(domain)
+            workers = list(self._workers.get(domain, {}).values())
+        result: List[Dict] = []
+        for worker in workers:
+            if now - worker.get("last_heartbeat", 0) > ttl_seconds:
+                continue
+            worker_hash = worker.get("domain_token_hash")
+            if expected_hash and worker_hash and worker_hash != expected_hash:
+                continue
+            if worker.get("state", "online") != "online":
+                continue
+            if worker["current_running"] + worker.get("reserved", 0) < worker["max_concurrency"]:
+                result.append(dict(worker))
+        return result
+
+    def adjust_reserved(self, domain: str, worker_id: str, delta: int):
+        """Record a reservation made by this scheduler before the worker reports it back."""
+        with self._lock:
+            worker = self._workers.get(domain, {}).get(worker_id)
+            if worker is not None:
+                worker["reserved"] = max(0, worker.get("reserved", 0) + delta)
+
+    def refresh_worker(self, domain: str, worker_id: str) -> Optional[Dict]:
+        """Load a single worker hash (used when a notification names a worker we have not seen)."""
+        r = get_redis()
+        data = r.hgetall(f"workers:{domain}:{worker_id}")
+        if not data:
+            self.remove(domain, worker_id)
+            return None
+        worker = parse_worker_hash(worker_id, data)
+        worker["last_heartbeat"] = r.zscore(f"worker_heartbeats:{domain}", worker_id) or 0
+        self.upsert(domain, worker)
+        return worker
+
+    def reconcile(self, domain: str):
+        """Replace the cached view of a domain with what Redis currently holds."""
+        r = get_redis()
+        workers = scan_workers(domain)
+        token_hash = r.get(f"token_hash:{domain}")
+        strategy = r.get(f"placement_strategy:{domain}")
+        with self._lock:
+            # Re-index incrementally: only workers whose affinity metadata changed are touched
+            index = self._indexes.setdefault(domain, AffinityIndex())
+            for worker_id in set(index.worker_ids()) - set(workers):
+                index.remove_worker(worker_id)
+            for worker in workers.values():
+                index.update_worker(worker)
+            self._workers[domain] = workers
+            self._token_hashes[domain] = token_hash
+            self._strategies[domain] = strategy
+            self._reconciled_at[domain] = time.time()
+
+    def needs_reconcile(self, domain: str, interval_seconds: float) -> bool:
+        with self._lock:
+            last = self._reconciled_at.get(domain)
+        return last is None or time.time() - last >= interval_seconds
+
+    def check_consistency(self, domain: str) -> Dict:
+        """Compare the in-memory view against the Redis hashes without mutating either."""
+        redis_workers = scan_workers(domain)
+        with self._lock:
+            cached = {wid: dict(w) for wid, w in self._workers.get(domain, {}).items()}
+        missing = sorted(set(redis_workers) - set(cached))
+        stale = sorted(set(cached) - set(redis_workers))
+        mismatched: Dict[str, Dict] = {}
+        for wid in set(redis_workers) & set(cached):
+            diffs = {
+                field: {"registry": cached[wid].get(field), "redis": redis_workers[wid].get(field)}
+                for field in self.COMPARED_FIELDS + ("current_running", "reserved")
+                if cached[wid].get(field) != redis_workers[wid].get(field)
+            }
+            if diffs:
+                mismatched[wid] = diffs
+        return {
+            "domain": domain,
+            "consistent": not (missing or stale or mismatched),
+            "registry_count": len(cached),
+            "redis_count": len(redis_workers),
+            "missing_in_registry": missing,
+            "stale_in_registry": stale,
+            "mismatched": mismatched,
+        }
+
+
+worker_registry = WorkerRegistry()
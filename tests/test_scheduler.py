@@ -3,8 +3,8 @@ from scheduler.utils.selectors import select_best_worker
 from scheduler.models.job_definition import JobDefinition, Affinity, ScheduleConfig
 from scheduler.models.executor import ShellExecutor, PythonExecutor
 from scheduler.api.jobs import _validate_job_definition
-from scheduler.utils.schedule import initialize_schedule, advance_schedule
-from datetime import datetime
+from scheduler.utils.schedule import initialize_schedule, advance_schedule, plan_schedule_fire
+from datetime import datetime, timedelta
 from scheduler.models.worker_info import WorkerInfo
 
 
@@ -71,6 +71,32 @@ def test_advance_schedule_disables_after_end():
     assert not advanced.enabled
 
 
+def test_misfire_policies_after_outage():
+    now = datetime(2024, 1, 1, 12, 0, 30)
+    due = now - timedelta(hours=3)
+    base = dict(mode="interval", interval_seconds=60, enabled=True, next_run_at=due)
+
+    once = plan_schedule_fire(ScheduleConfig(**base), now)
+    assert once.fire and once.misfired
+    assert once.schedule.next_run_at == datetime(2024, 1, 1, 12, 1, 30)
+
+    skipped = plan_schedule_fire(ScheduleConfig(**base, misfire_policy="skip"), now)
+    assert not skipped.fire
+    assert skipped.schedule.next_run_at == datetime(2024, 1, 1, 12, 1, 30)
+
+    replay = plan_schedule_fire(ScheduleConfig(**base, misfire_policy="fire_all", max_catchup_seconds=300), now)
+    assert replay.fire
+    # Interval ticks stay aligned to the anchor; only the last five minutes are replayed, one per pass
+    assert replay.schedule.next_run_at == datetime(2024, 1, 1, 11, 56, 30)
+
+    cron = plan_schedule_fire(ScheduleConfig(mode="cron", cron="*/15 * * * *", next_run_at=due), now)
+    assert cron.fire and cron.schedule.next_run_at == datetime(2024, 1, 1, 12, 15)
+
+    on_time = plan_schedule_fire(ScheduleConfig(**{**base, "next_run_at": now - timedelta(seconds=5)}), now)
+    assert on_time.fire and not on_time.misfired
+    assert on_time.schedule.next_run_at == datetime(2024, 1, 1, 12, 1, 25)
+
+
 def test_affinity_additional_filters():
     job = {
         "user": "dan",
@@ -109,3 +135,625 @@ def test_worker_info_running_jobs_is_isolated():
     w1.running_jobs.append("job-1")
     assert w1.running_jobs == ["job-1"]
     assert w2.running_jobs == []
+
+
+def test_worker_registry_tracks_events_and_filters_online():
+    from scheduler.worker_registry import WorkerRegistry
+
+    registry = WorkerRegistry()
+    meta = {"os": "linux", "tags": "gpu,cpu", "allowed_users": "", "max_concurrency": 2, "current_running": 0, "state": "online"}
+    registry.apply_event({"type": "register", "domain": "prod", "worker_id": "w1", "fields": meta, "ts": 100.0})
+    registry.apply_event({"type": "register", "domain": "prod", "worker_id": "w2", "fields": meta, "ts": 100.0})
+
+    online = registry.online_workers("prod", ttl_seconds=10, now=105.0)
+    assert {w["worker_id"] for w in online} == {"w1", "w2"}
+    assert online[0]["tags"] == ["gpu", "cpu"]
+
+    registry.apply_event({"type": "running", "domain": "prod", "worker_id": "w1", "fields": {"current_running": 2}})
+    registry.apply_event({"type": "state", "domain": "prod", "worker_id": "w2", "fields": {"state": "draining"}})
+    assert registry.online_workers("prod", ttl_seconds=10, now=105.0) == []
+
+    registry.apply_event({"type": "heartbeat", "domain": "prod", "worker_id": "w1", "fields": {"current_running": 1}, "ts": 200.0})
+    assert [w["worker_id"] for w in registry.online_workers("prod", ttl_seconds=10, now=205.0)] == ["w1"]
+    # Unknown workers are left for the next refresh/reconcile
+    assert registry.apply_event({"type": "heartbeat", "domain": "prod", "worker_id": "ghost", "ts": 200.0}) is None
+
+
+def test_worker_registry_consistency_check():
+    from unittest.mock import patch
+    from scheduler.worker_registry import WorkerRegistry, parse_worker_hash
+
+    registry = WorkerRegistry()
+    registry.upsert("prod", {**parse_worker_hash("w1", {"os": "linux"}), "last_heartbeat": 1.0})
+    registry.upsert("prod", {**parse_worker_hash("gone", {"os": "linux"}), "last_heartbeat": 1.0})
+    redis_view = {
+        "w1": {**parse_worker_hash("w1", {"os": "windows"}), "last_heartbeat": 2.0},
+        "new": {**parse_worker_hash("new", {"os": "linux"}), "last_heartbeat": 2.0},
+    }
+    with patch("scheduler.worker_registry.scan_workers", return_value=redis_view):
+        report = registry.check_consistency("prod")
+    assert not report["consistent"]
+    assert report["missing_in_registry"] == ["new"]
+    assert report["stale_in_registry"] == ["gone"]
+    assert report["mismatched"]["w1"]["os"] == {"registry": "linux", "redis": "windows"}
+
+
+def test_dispatch_batch_consumes_snapshot_capacity():
+    from unittest.mock import MagicMock, patch
+    from scheduler import scheduler as sched
+
+    jobs = [{"_id": f"j{i}", "domain": "prod", "affinity": {}} for i in range(4)]
+    db = MagicMock()
+    db.job_definitions.find.return_value = jobs
+    r = MagicMock()
+    workers = [
+        {"worker_id": "w1", "max_concurrency": 2, "current_running": 0},
+        {"worker_id": "w2", "max_concurrency": 1, "current_running": 0},
+    ]
+    pipe = r.pipeline.return_value
+    pipe.execute.return_value = [1, 1, 1]
+    popped = [("job_queue:prod:pending", job["_id"], 5.0) for job in jobs]
+    with patch.object(sched, "list_online_workers", return_value=workers) as listing, patch.object(
+        sched, "reserve_slot"
+    ) as reserve:
+        dispatched, unplaced = sched.dispatch_batch(r, db, popped, ttl=10)
+
+    listing.assert_called_once_with(10, "prod")
+    db.job_definitions.find.assert_called_once_with({"_id": {"$in": ["j0", "j1", "j2", "j3"]}})
+    assert sorted(d["worker_id"] for d in dispatched) == ["w1", "w1", "w2"]
+    assert [u["job_id"] for u in unplaced] == ["j3"]
+    assert reserve.call_count == 3
+    assert all(call.args[0] is pipe for call in reserve.call_args_list)
+    pipe.execute.assert_called_once()
+
+
+def test_dispatch_batch_requeues_jobs_that_lose_the_reservation():
+    from unittest.mock import MagicMock, patch
+    from scheduler import scheduler as sched
+
+    jobs = [{"_id": "a", "domain": "prod", "affinity": {}}, {"_id": "b", "domain": "prod", "affinity": {}}]
+    db = MagicMock()
+    db.job_definitions.find.return_value = jobs
+    r = MagicMock()
+    # Another replica filled the worker between our snapshot and the atomic reservation
+    r.pipeline.return_value.execute.return_value = [1, 0]
+    workers = [{"worker_id": "w1", "max_concurrency": 4, "current_running": 0}]
+    popped = [("job_queue:prod:pending", "a", 5.0), ("job_queue:prod:pending", "b", 5.0)]
+    with patch.object(sched, "list_online_workers", return_value=workers), patch.object(sched, "reserve_slot"):
+        dispatched, unplaced = sched.dispatch_batch(r, db, popped, ttl=10)
+    assert [d["job_id"] for d in dispatched] == ["a"]
+    assert [u["job_id"] for u in unplaced] == ["b"]
+
+
+def test_select_best_worker_counts_reservations():
+    ws = [
+        {"worker_id": "w1", "max_concurrency": 4, "current_running": 0, "reserved": 3},
+        {"worker_id": "w2", "max_concurrency": 4, "current_running": 1, "reserved": 0},
+    ]
+    assert select_best_worker(ws)["worker_id"] == "w2"
+
+
+def _random_fleet(rng, count):
+    return [
+        {
+            "worker_id": f"w{i}",
+            "os": rng.choice(["linux", "Linux", "windows", "darwin"]),
+            "tags": rng.sample(["gpu", "cpu", "ssd", "GPU", "arm"], rng.randint(0, 3)),
+            "allowed_users": rng.choice([[], ["alice"], ["bob", "alice"]]),
+            "hostname": rng.choice(["host-a", "host-b", "HOST-C"]),
+            "subnet": rng.choice(["10.0.1", "10.0.2"]),
+            "deployment_type": rng.choice(["docker", "kubernetes", "VM"]),
+        }
+        for i in range(count)
+    ]
+
+
+def test_affinity_index_agrees_with_linear_scan():
+    import random
+    from scheduler.utils.affinity_index import AffinityIndex, compile_affinity
+
+    rng = random.Random(7)
+    fleet = _random_fleet(rng, 300)
+    index = AffinityIndex()
+    for worker in fleet:
+        index.update_worker(worker)
+    for _ in range(200):
+        job = {
+            "user": rng.choice(["alice", "bob", "carol"]),
+            "affinity": {
+                "os": rng.sample(["linux", "WINDOWS", "darwin"], rng.randint(0, 2)),
+                "tags": rng.sample(["gpu", "ssd", "arm"], rng.randint(0, 2)),
+                "hostnames": rng.sample(["host-a", "host-c"], rng.randint(0, 1)),
+                "subnets": rng.sample(["10.0.1", "10.0.2"], rng.randint(0, 1)),
+                "deployment_types": rng.sample(["docker", "vm"], rng.randint(0, 1)),
+            },
+        }
+        expected = {w["worker_id"] for w in fleet if passes_affinity(job, w)}
+        assert set(index.candidates(compile_affinity(job))) == expected
+
+
+def test_affinity_index_incremental_updates():
+    from scheduler.utils.affinity_index import AffinityIndex, compile_affinity
+
+    index = AffinityIndex()
+    worker = {"worker_id": "w1", "os": "linux", "tags": ["gpu"], "allowed_users": []}
+    gpu_job = compile_affinity({"affinity": {"tags": ["gpu"]}})
+    assert index.update_worker(worker)
+    assert not index.update_worker(dict(worker))
+    assert index.candidates(gpu_job) == ["w1"]
+
+    index.update_worker({**worker, "tags": ["cpu"]})
+    assert index.candidates(gpu_job) == []
+
+    index.update_worker({"worker_id": "w2", "os": "linux", "tags": ["gpu"], "allowed_users": []})
+    index.remove_worker("w1")
+    index.update_worker({"worker_id": "w3", "os": "linux", "tags": ["gpu"], "allowed_users": []})
+    assert sorted(index.candidates(gpu_job)) == ["w2", "w3"]
+    assert len(index) == 2
+
+
+def test_parked_jobs_wake_only_for_matching_workers():
+    import json
+    from unittest.mock import MagicMock, patch
+    from scheduler.utils import parking
+    from scheduler.utils.affinity_index import compile_affinity
+
+    gpu = compile_affinity({"user": "alice", "affinity": {"tags": ["gpu"], "os": ["linux"]}})
+    win = compile_affinity({"user": "alice", "affinity": {"os": ["windows"]}})
+    r = MagicMock()
+    gpu_id = parking.park_job(r, "prod", "job-1", gpu, 7.0)
+    pipe = r.pipeline.return_value
+    pipe.zadd.assert_called_once_with(f"job_queue:prod:parked:{gpu_id}", {"job-1": 7.0})
+    stored = pipe.hset.call_args.args[2]
+
+    win_id = parking.signature_id(win)
+    r.hgetall.return_value = {gpu_id: stored, win_id: json.dumps(parking._signature_doc(win))}
+    assert parking.load_parked_signatures(r, "prod")[gpu_id] == gpu
+
+    script = MagicMock(return_value=3)
+    worker = {"worker_id": "w1", "os": "linux", "tags": ["gpu"], "allowed_users": []}
+    with patch.object(parking, "_wake_script", script):
+        assert parking.wake_parked(r, "prod", [worker]) == 3
+    script.assert_called_once()
+    assert script.call_args.kwargs["keys"][1] == f"job_queue:prod:parked:{gpu_id}"
+
+
+def test_hash_ring_moves_only_departed_replica_domains():
+    from scheduler.coordination import HashRing
+
+    domains = [f"domain-{i}" for i in range(200)]
+    ring = HashRing(["a", "b", "c"])
+    before = {d: ring.node_for(d) for d in domains}
+    assert set(before.values()) == {"a", "b", "c"}
+    shrunk = HashRing(["a", "b"])
+    for d in domains:
+        if before[d] != "c":
+            assert shrunk.node_for(d) == before[d]
+    assert HashRing([]).node_for("prod") is None
+
+
+def test_leader_lease_tracks_fencing_token():
+    from unittest.mock import MagicMock
+    from scheduler.coordination import LeaderLease
+
+    lease = LeaderLease("failover", "replica-1", ttl_seconds=10)
+    script = MagicMock(return_value=4)
+    assert lease.acquire_or_renew(MagicMock(), script)
+    assert lease.held() and lease.token == 4
+    r = MagicMock()
+    r.get.return_value = "replica-1:4"
+    assert lease.still_valid(r)
+    r.get.return_value = "replica-2:5"
+    assert not lease.still_valid(r)
+    script.return_value = 0
+    assert not lease.acquire_or_renew(MagicMock(), script)
+    assert not lease.held()
+
+
+def test_placement_strategies():
+    import random
+    from scheduler.utils.selectors import power_of_two
+
+    ws = [
+        {"worker_id": "idle", "max_concurrency": 4, "current_running": 0, "cpu_count": 2},
+        {"worker_id": "half", "max_concurrency": 4, "current_running": 2, "cpu_count": 16},
+        {"worker_id": "full-ish", "max_concurrency": 4, "current_running": 3, "cpu_count": 2},
+    ]
+    assert select_best_worker(ws, "spread")["worker_id"] == "idle"
+    assert select_best_worker(ws, "binpack")["worker_id"] == "full-ish"
+    assert select_best_worker(ws, "weighted")["worker_id"] == "half"
+    assert select_best_worker(ws, "unknown")["worker_id"] == "idle"
+    picks = {power_of_two(ws, random.Random(seed))["worker_id"] for seed in range(20)}
+    assert "full-ish" not in picks
+
+
+def test_reserve_slot_script_checks_capacity_and_state():
+    import pytest
+    from unittest.mock import patch
+    from scheduler.utils import reservation
+
+    fakeredis = pytest.importorskip("fakeredis")
+    pytest.importorskip("lupa")
+    r = fakeredis.FakeRedis(decode_responses=True)
+    r.hset("workers:prod:w1", mapping={"max_concurrency": 2, "current_running": 1, "reserved": 0})
+    with patch.object(reservation, "get_redis", return_value=r), patch.object(reservation, "_reserve_script", None):
+        assert reservation.reserve_slot(r, "prod", "w1", "job-a") == 1
+        # Running + reserved now fills the worker
+        assert reservation.reserve_slot(r, "prod", "w1", "job-b") == 0
+        assert r.hget("workers:prod:w1", "reserved") == "1"
+        assert r.lrange("job_queue:prod:w1", 0, -1) == ["job-a"]
+        r.hset("workers:prod:w1", mapping={"current_running": 0, "state": "draining"})
+        assert reservation.reserve_slot(r, "prod", "w1", "job-c") == 0
+        assert reservation.reserve_slot(r, "prod", "gone", "job-d") == 0
+        # Through a pipeline, as dispatch_batch uses it
+        r.hset("workers:prod:w1", "state", "online")
+        pipe = r.pipeline(transaction=False)
+        reservation.reserve_slot(pipe, "prod", "w1", "job-e")
+        reservation.reserve_slot(pipe, "prod", "w1", "job-f")
+        assert pipe.execute() == [1, 0]
+    assert r.lrange("job_queue:prod:w1", 0, -1) == ["job-a", "job-e"]
+    assert not r.exists("job_queue:prod:gone")
+
+
+def test_health_and_overview_count_parked_and_fair_share_jobs():
+    import pytest
+    from types import SimpleNamespace
+    from unittest.mock import MagicMock, patch
+    from scheduler.api import health, jobs as jobs_api
+    from scheduler.utils.affinity_index import compile_affinity
+    from scheduler.utils.parking import park_job
+
+    fakeredis = pytest.importorskip("fakeredis")
+    r = fakeredis.FakeRedis(decode_responses=True)
+    r.zadd("job_queue:prod:pending", {"job-a": 5})
+    park_job(r, "prod", "job-b", compile_affinity({"affinity": {"tags": ["gpu"]}}), 5)
+    r.zadd("job_queue:prod:tenant:alice", {"job-d": 5})
+    r.sadd("job_queue:prod:tenants", "alice")
+    request = SimpleNamespace(state=SimpleNamespace(domain="prod", is_admin=False))
+    db = MagicMock()
+    db.job_definitions.find.return_value = [{"_id": job_id, "domain": "prod"} for job_id in ("job-a", "job-b", "job-c", "job-d")]
+    db.job_runs.count_documents.return_value = 0
+    with patch.object(health, "get_redis", return_value=r), patch.object(jobs_api, "get_redis", return_value=r), patch.object(
+        jobs_api, "get_db", return_value=db
+    ):
+        assert health.health(request)["pending_jobs"] == 3
+        queued = {job["job_id"]: job["queued_runs"] for job in jobs_api.jobs_overview(request)}
+    assert queued == {"job-a": 1, "job-b": 1, "job-c": 0, "job-d": 1}
+
+
+def test_delete_job_drops_it_from_every_waiting_queue():
+    import pytest
+    from types import SimpleNamespace
+    from unittest.mock import MagicMock, patch
+    from scheduler.api import jobs as jobs_api
+    from scheduler.utils.affinity_index import compile_affinity
+    from scheduler.utils.backlog import waiting_queue_keys
+    from scheduler.utils.parking import park_job
+
+    fakeredis = pytest.importorskip("fakeredis")
+    r = fakeredis.FakeRedis(decode_responses=True)
+    park_job(r, "prod", "job-a", compile_affinity({"affinity": {"tags": ["gpu"]}}), 5)
+    r.zadd("job_queue:prod:tenant:alice", {"job-a": 5, "job-b": 5})
+    r.sadd("job_queue:prod:tenants", "alice")
+    db = MagicMock()
+    db.job_definitions.find_one.return_value = {"_id": "job-a", "domain": "prod"}
+    request = SimpleNamespace(state=SimpleNamespace(domain="prod", is_admin=False))
+    with patch.object(jobs_api, "get_redis", return_value=r), patch.object(jobs_api, "get_db", return_value=db), patch.object(
+        jobs_api, "publish_schedule_change"
+    ), patch.object(jobs_api.event_bus, "publish"):
+        jobs_api.delete_job("job-a", request)
+    assert [r.zrange(key, 0, -1) for key in waiting_queue_keys(r, "prod")] == [[], ["job-b"], []]
+
+
+def test_fair_share_allocate_follows_weights():
+    from scheduler.utils.fairshare import allocate
+
+    backlogs = {"big": 50000, "small": 3}
+    deficits = {}
+    alloc, cursor = allocate(backlogs, {}, deficits, 4)
+    assert alloc == {"big": 2, "small": 2}
+    # Weighted 3:1 over several rounds, carrying credit and the cursor between calls
+    totals = {"a": 0, "b": 0}
+    deficits, cursor = {}, 0
+    for _ in range(10):
+        alloc, cursor = allocate({"a": 1000, "b": 1000}, {"a": "3", "b": "1"}, deficits, 4, cursor)
+        for name, n in alloc.items():
+            totals[name] += n
+    assert totals == {"a": 30, "b": 10}
+    # A drained queue gives its slots to the rest and forgets its credit
+    alloc, _ = allocate({"a": 1, "b": 100}, {}, deficits, 5)
+    assert alloc == {"a": 1, "b": 4}
+    alloc, _ = allocate({"b": 100}, {}, deficits, 5)
+    assert "a" not in deficits and alloc == {"b": 5}
+
+
+def test_fair_share_route_moves_arrivals_without_popping_them():
+    from unittest.mock import MagicMock
+    from scheduler.utils.fairshare import FairShareScheduler
+
+    r = MagicMock()
+    r.pipeline.return_value.execute.return_value = [["job-a", "job-gone"]]
+    script = MagicMock(return_value=2)
+    r.register_script.return_value = script
+    db = MagicMock()
+    db.job_definitions.find.side_effect = RuntimeError("mongo down")
+    fs = FairShareScheduler()
+    try:
+        fs.route(r, db, ["job_queue:prod:pending"], 100)
+    except RuntimeError:
+        pass
+    # Arrivals were only read, so a failed lookup leaves them in pending
+    r.pipeline.return_value.zrevrange.assert_called_once_with("job_queue:prod:pending", 0, 99)
+    script.assert_not_called()
+    r.zpopmax.assert_not_called()
+
+    db.job_definitions.find.side_effect = None
+    db.job_definitions.find.return_value = [{"_id": "job-a", "user": "alice", "domain": "prod"}]
+    assert fs.route(r, db, ["job_queue:prod:pending"], 100) == 2
+    # One atomic move per pending queue; a job without a definition is routed, not dropped
+    script.assert_called_once_with(
+        keys=[
+            "job_queue:prod:pending",
+            "job_queue:prod:tenant:alice",
+            "job_queue:prod:tenants",
+            "job_queue:prod:tenant:default",
+            "job_queue:prod:tenants",
+        ],
+        args=["job-a", "alice", "job-gone", "default"],
+    )
+
+
+def test_schedule_timers_order_and_lazy_invalidation():
+    from scheduler.schedule_timers import ScheduleTimers
+
+    t0 = datetime(2024, 1, 1)
+    timers = ScheduleTimers()
+    timers.track({"_id": "a", "schedule": {"next_run_at": t0 + timedelta(seconds=30)}})
+    timers.track({"_id": "b", "schedule": {"next_run_at": t0 + timedelta(seconds=10)}})
+    timers.track({"_id": "c", "schedule": {"next_run_at": t0 + timedelta(seconds=20)}})
+    # Rescheduling b leaves a stale heap entry behind that must not fire
+    timers.track({"_id": "b", "schedule": {"next_run_at": t0 + timedelta(seconds=40)}})
+    timers.remove("c")
+    assert timers.next_due() == t0 + timedelta(seconds=30)
+    assert timers.pop_due(t0 + timedelta(seconds=35)) == [
+        ({"_id": "a", "schedule": {"next_run_at": t0 + timedelta(seconds=30)}}, t0 + timedelta(seconds=30))
+    ]
+    assert len(timers) == 1 and timers.next_due() == t0 + timedelta(seconds=40)
+
+
+def test_fire_due_schedules_bulk_writes_and_rearms():
+    from unittest.mock import MagicMock, patch
+    from scheduler import scheduler as sched
+    from scheduler.schedule_timers import ScheduleTimers
+
+    now = datetime(2024, 1, 1, 12, 0, 1)
+    schedule = ScheduleConfig(mode="interval", interval_seconds=60, next_run_at=datetime(2024, 1, 1, 12)).model_dump()
+    timers = ScheduleTimers()
+    timers.track({"_id": "job-1", "domain": "prod", "priority": 7, "schedule": schedule})
+    db = MagicMock()
+    db.job_definitions.bulk_write.return_value = MagicMock(matched_count=1)
+    r = MagicMock()
+    pipe = r.pipeline.return_value
+    with patch.object(sched.event_bus, "publish"):
+        fired = sched.fire_due_schedules(r, db, timers, timers.pop_due(now), fence=3, now=now)
+    assert fired == 1
+    db.job_definitions.find.assert_not_called()
+    (ops,), _ = db.job_definitions.bulk_write.call_args
+    assert len(ops) == 1
+    pipe.zadd.assert_called_once_with("job_queue:prod:pending", {"job-1": 7})
+    assert timers.next_due() == datetime(2024, 1, 1, 12, 1)
+
+
+def test_fire_due_schedules_rearms_timers_when_the_write_fails():
+    from unittest.mock import MagicMock
+    from scheduler import scheduler as sched
+    from scheduler.schedule_timers import ScheduleTimers
+
+    now = datetime(2024, 1, 1, 12, 0, 1)
+    due_at = datetime(2024, 1, 1, 12)
+    schedule = ScheduleConfig(mode="interval", interval_seconds=60, next_run_at=due_at).model_dump()
+    timers = ScheduleTimers()
+    timers.track({"_id": "job-1", "domain": "prod", "schedule": schedule})
+    db = MagicMock()
+    db.job_definitions.bulk_write.side_effect = RuntimeError("mongo down")
+    r = MagicMock()
+    try:
+        sched.fire_due_schedules(r, db, timers, timers.pop_due(now), fence=3, now=now)
+    except RuntimeError:
+        pass
+    r.pipeline.return_value.zadd.assert_not_called()
+    # Still due at its original time, so the next pass retries it
+    assert timers.next_due() == due_at
+    assert [job["_id"] for job, _when in timers.pop_due(now)] == ["job-1"]
+
+
+def test_compiled_cron_matches_croniter_and_honours_timezone():
+    from croniter import croniter
+    from scheduler.utils.cron_cache import compile_cron
+
+    base = datetime(2024, 3, 9, 17, 7)
+    compiled = compile_cron("*/15 * * * *", "UTC")
+    assert compile_cron("*/15 * * * *", "UTC") is compiled
+    it = croniter("*/15 * * * *", base)
+    assert compiled.next_n(base, 5) == [it.get_next(datetime) for _ in range(5)]
+    # Served from the cached window for a later point inside it
+    assert compiled.next_after(base + timedelta(minutes=20)) == datetime(2024, 3, 9, 17, 30)
+    # 09:00 New York is 14:00 UTC before the DST switch and 13:00 UTC after it
+    ny = compile_cron("0 9 * * *", "America/New_York")
+    assert ny.next_n(base, 2) == [datetime(2024, 3, 10, 13), datetime(2024, 3, 11, 13)]
+    assert ny.next_after(datetime(2024, 3, 8, 12)) == datetime(2024, 3, 8, 14)
+
+
+def test_upcoming_fire_times_for_forecast():
+    from scheduler.utils.schedule import upcoming_fire_times
+
+    start = datetime(2024, 1, 1, 12)
+    cron = ScheduleConfig(mode="cron", cron="*/15 * * * *", next_run_at=start)
+    assert upcoming_fire_times(cron, start, start + timedelta(hours=1)) == [
+        start + timedelta(minutes=m) for m in (0, 15, 30, 45)
+    ]
+    interval = ScheduleConfig(mode="interval", interval_seconds=40, next_run_at=start - timedelta(seconds=10))
+    ticks = upcoming_fire_times(interval, start, start + timedelta(minutes=2))
+    assert ticks == [start + timedelta(seconds=s) for s in (30, 70, 110)]
+
+
+def test_hash_cron_fields_spread_jobs_stably():
+    from scheduler.utils.cron_cache import is_valid_cron, resolve_hash_fields
+
+    assert resolve_hash_fields("H * * * *", "job-1") == resolve_hash_fields("H * * * *", "job-1")
+    minutes = {int(resolve_hash_fields("H * * * *", f"job-{i}").split()[0]) for i in range(200)}
+    assert len(minutes) > 40 and all(0 <= m <= 59 for m in minutes)
+    fields = resolve_hash_fields("H/15 H(9-17) * * 1-5", "job-7").split()
+    offset, hour = fields[0].split("-")[0], int(fields[1])
+    assert 0 <= int(offset) < 15 and fields[0].endswith("-59/15") and 9 <= hour <= 17
+    assert is_valid_cron("H/5 * * * *") and not is_valid_cron("H(5-2) * * * *")
+
+    start = datetime(2024, 1, 1, 12, 0)
+    schedule = ScheduleConfig(mode="cron", cron="H * * * *")
+    first = initialize_schedule(schedule, start, "job-1").next_run_at
+    assert first.minute == int(resolve_hash_fields("H * * * *", "job-1").split()[0])
+    assert advance_schedule(schedule.model_copy(update={"next_run_at": first}), "job-1").next_run_at == first + timedelta(hours=1)
+
+
+def test_jitter_seconds_offsets_ticks_per_job():
+    from scheduler.utils.schedule import upcoming_fire_times
+
+    start = datetime(2024, 1, 1, 12, 0)
+    schedule = ScheduleConfig(mode="cron", cron="*/5 * * * *", jitter_seconds=120)
+    firsts = {initialize_schedule(schedule, start, f"job-{i}").next_run_at for i in range(50)}
+    assert len(firsts) > 20
+    # Each job's first tick is its own offset after a */5 boundary, never more than 2 minutes late
+    assert all(start < f <= start + timedelta(minutes=7) and (f.minute % 5) * 60 + f.second <= 120 for f in firsts)
+    seeded = initialize_schedule(schedule, start, "job-3")
+    ticks = upcoming_fire_times(seeded, start, start + timedelta(minutes=30), job_id="job-3")
+    assert [t - ticks[0] for t in ticks] == [timedelta(minutes=5 * i) for i in range(len(ticks))]
+    assert plan_schedule_fire(seeded, ticks[0], "job-3").schedule.next_run_at == ticks[1]
+
+
+def test_failover_sweeps_only_newly_expired_workers():
+    from unittest.mock import MagicMock, patch
+    from scheduler.utils import failover
+
+    r = MagicMock()
+    r.smembers.return_value = {"prod"}
+    pipe = r.pipeline.return_value
+    pipe.execute.side_effect = [["970.0"], [["w-dead"]]]
+    with patch.object(failover, "get_redis", return_value=r):
+        offline = failover.find_offline_workers(10, now=1000.0)
+    assert offline == ["prod:w-dead"]
+    # Only heartbeats that expired after the previous cutoff; finding them does not move the cursor
+    pipe.zrangebyscore.assert_called_once_with("worker_heartbeats:prod", "(970.0", 990.0)
+    pipe.set.assert_not_called()
+    r.set.assert_not_called()
+
+
+def test_failover_cursor_advances_only_after_reclaim():
+    from unittest.mock import MagicMock, patch
+    from scheduler.utils import failover
+
+    r = MagicMock()
+    r.smembers.return_value = {"prod"}
+    r.pipeline.return_value.execute.side_effect = [[None], [["w-dead"]]] * 2
+    requeue = MagicMock(side_effect=[RuntimeError("redis went away"), None])
+    with patch.object(failover, "get_redis", return_value=r), patch.object(
+        failover, "requeue_jobs_for_worker", requeue
+    ), patch.object(failover, "expire_run_leases"):
+        try:
+            failover.failover_once(10, now=1000.0)
+        except RuntimeError:
+            pass
+        else:
+            raise AssertionError("the failed reclaim should propagate")
+        # The failed sweep left the cursor alone, so the next one retries the same worker
+        r.set.assert_not_called()
+        failover.failover_once(10, now=1001.0)
+    assert [c.args[0] for c in requeue.call_args_list] == ["prod:w-dead", "prod:w-dead"]
+    r.set.assert_called_once_with("failover:prod:cursor", 991.0)
+
+
+def test_expired_run_lease_requeues_at_job_priority():
+    from unittest.mock import MagicMock, patch
+    from scheduler.utils import failover
+
+    r = MagicMock()
+    r.smembers.return_value = {"prod"}
+    r.zrangebyscore.return_value = ["job-a:3", "job-b:7"]
+    script = MagicMock(
+        side_effect=[
+            ["job_id", "job-a", "fence", "3", "worker_id", "w1", "priority", "9", "run_id", "65f000000000000000000001"],
+            None,  # renewed (or claimed by another sweep) in the meantime
+        ]
+    )
+    r.register_script.return_value = script
+    db = MagicMock()
+    db.job_runs.update_one.return_value.matched_count = 1
+    pipe = r.pipeline.return_value
+    with patch.object(failover, "get_redis", return_value=r), patch.object(failover, "get_db", return_value=db), patch.object(
+        failover, "_expire_script", None
+    ), patch.object(failover.event_bus, "publish"):
+        expired = failover.expire_run_leases(now=1000.0)
+    assert expired == [{"domain": "prod", "job_id": "job-a", "fence": 3, "requeued": True}]
+    script.assert_any_call(keys=["run_lease:prod:job-a:3", "run_leases:prod"], args=["job-a:3", 1000.0])
+    run_filter, update = db.job_runs.update_one.call_args.args
+    assert run_filter["status"] == "running" and update["$set"]["status"] == "lost"
+    pipe.zadd.assert_called_once_with("job_queue:prod:pending", {"job-a": 9})
+
+
+def test_queue_audit_reclaims_backlogs_nobody_will_drain():
+    from unittest.mock import MagicMock, patch
+    from scheduler.utils import failover
+
+    r = MagicMock()
+    r.smembers.return_value = {"prod"}
+    r.scan_iter.side_effect = [
+        ["job_queue:prod:w-live", "job_queue:prod:w-gone", "job_queue:prod:w-drain"],
+        ["job_processing:prod:w-gone"],
+    ]
+    r.pipeline.return_value.execute.side_effect = [
+        [["online", "draining"], [None, None], ["online", "online"]],  # w-drain, w-gone, w-live
+        [["c"]],  # draining: only its queue
+        [["a"], ["b"]],  # gone: queue plus popped-but-unstarted jobs
+    ]
+    script = MagicMock(side_effect=[1, 2])
+    r.register_script.return_value = script
+    with patch.object(failover, "get_redis", return_value=r), patch.object(failover, "_reclaim_script", None), patch.object(
+        failover, "job_priorities", side_effect=lambda ids: {job_id: 7 for job_id in ids}
+    ), patch.object(failover.event_bus, "publish"):
+        reclaimed = failover.audit_worker_queues()
+    assert reclaimed == {"prod:w-drain": 1, "prod:w-gone": 2}
+    r.scan_iter.assert_any_call(match="job_queue:prod:*", _type="list")
+    script.assert_any_call(
+        keys=["job_queue:prod:w-drain", "job_queue:prod:pending", "workers:prod:w-drain", "job_attempts:prod"],
+        args=["c", "c", 7],
+    )
+    script.assert_any_call(
+        keys=[
+            "job_queue:prod:w-gone",
+            "job_queue:prod:pending",
+            "workers:prod:w-gone",
+            "job_attempts:prod",
+            "job_processing:prod:w-gone",
+        ],
+        args=["a", "a", 7, "b", "b", 7],
+    )
+
+
+def test_run_output_range_reads_only_overlapping_chunks():
+    import zlib
+    from types import SimpleNamespace
+    from unittest.mock import MagicMock, patch
+    from scheduler.api import logs
+
+    text = b"".join(f"{i:04d}\n".encode() for i in range(300))  # 1500 bytes
+    chunks = [
+        {"offset": off, "size": 500, "data": zlib.compress(text[off : off + 500])} for off in (0, 500, 1000)
+    ]
+    db = MagicMock()
+    db.job_runs.find_one.return_value = {"_id": "run-1", "domain": "prod", "stdout_bytes": 1500}
+    db.job_run_chunks.find.side_effect = lambda query, sort: [c for c in chunks if c["offset"] < query["offset"]["$lt"]]
+    request = SimpleNamespace(state=SimpleNamespace(domain="prod", is_admin=False))
+    with patch.object(logs, "get_db", return_value=db):
+        page = logs.read_run_output(request, "run-1", offset=490, length=20)
+        last = logs.read_run_output(request, "run-1", offset=1495, length=100)
+    assert page["text"].encode() == text[490:510] and page["next_offset"] == 510 and not page["eof"]
+    assert last["text"].encode() == text[1495:] and last["eof"]
@@ -103,3 +103,483 @@ def test_completion_helpers_are_strict():
     assert success
     success, reason = _contains_none("abc def", ["abc"])
     assert not success and "forbidden" in reason.lower()
+
+
+def test_record_run_end_is_fenced():
+    from unittest.mock import MagicMock, patch
+    from worker import executor
+
+    db = MagicMock()
+    db.job_runs.update_one.return_value.matched_count = 0
+    run_id = "65f000000000000000000001"
+    with patch.object(executor, "get_db", return_value=db):
+        committed = executor.record_run_end(run_id, "success", 0, "", "", 1, "exit_code", fence=4)
+    assert committed is False
+    query = db.job_runs.update_one.call_args.args[0]
+    assert query["fence"] == 4 and query["status"] == "running"
+
+
+def test_fits_locally_mirrors_scheduler_affinity():
+    from worker.utils.stealing import fits_locally
+
+    meta = {"os": "linux", "tags": "gpu,ssd", "allowed_users": "alice", "hostname": "node-1", "subnet": "10.0.0"}
+    assert fits_locally({"user": "alice", "affinity": {"os": ["Linux"], "tags": ["GPU"]}}, meta)
+    assert not fits_locally({"user": "bob", "affinity": {}}, meta)
+    assert not fits_locally({"user": "alice", "affinity": {"tags": ["gpu", "arm"]}}, meta)
+    assert not fits_locally({"user": "alice", "affinity": {"subnets": ["10.0.1"]}}, meta)
+
+
+def test_run_lease_claim_fails_once_job_was_reclaimed():
+    from unittest.mock import MagicMock, patch
+    from worker.utils import leases
+
+    r = MagicMock()
+    r.incr.return_value = 3
+    r.pipeline.return_value.execute.side_effect = [[0, 1, 1], [1, 1]]
+    with patch.object(leases, "get_redis", return_value=r):
+        fence = leases.acquire_run_lease({"_id": "job-a", "priority": 4}, "w1", claim_from="job_processing:prod:w1")
+    assert fence is None
+    r.pipeline.return_value.lrem.assert_called_once_with("job_processing:prod:w1", 1, "job-a")
+    r.pipeline.return_value.delete.assert_called_once_with("run_lease:prod:job-a:3")
+
+
+def test_claim_job_returns_the_item_to_the_queue_when_claiming_fails():
+    import pytest
+    from unittest.mock import MagicMock, patch
+    from worker import worker as worker_mod
+
+    fakeredis = pytest.importorskip("fakeredis")
+    pytest.importorskip("lupa")
+    r = fakeredis.FakeRedis(decode_responses=True)
+    r.rpush("job_queue:prod:w1", "job-b")
+    r.rpush("job_processing:prod:w1", "job-a")
+    db = MagicMock()
+    db.job_definitions.find_one.side_effect = RuntimeError("mongo down")
+    with patch.object(worker_mod, "release_reserved_slot") as release, patch.object(
+        worker_mod, "acquire_run_lease"
+    ) as lease, patch.object(worker_mod, "_return_script", None), patch.dict("os.environ", {"WORKER_DOMAIN": "prod"}):
+        assert worker_mod.claim_job(r, db, "w1", "job-a", "job_processing:prod:w1") is None
+        lease.assert_not_called()
+        # Back at the head of the queue, still holding its reservation, for the next pop
+        assert r.lrange("job_processing:prod:w1", 0, -1) == []
+        assert r.lrange("job_queue:prod:w1", 0, -1) == ["job-a", "job-b"]
+        release.assert_not_called()
+
+        # The lease transaction went through but its reply was lost: nothing to put back
+        db.job_definitions.find_one.side_effect = None
+        db.job_definitions.find_one.return_value = {"_id": "job-c"}
+        lease.side_effect = ConnectionError("redis went away")
+        assert worker_mod.claim_job(r, db, "w1", "job-c", "job_processing:prod:w1") is None
+        assert r.lrange("job_queue:prod:w1", 0, -1) == ["job-a", "job-b"]
+        release.assert_called_once_with("w1")
+
+
+def test_end_run_keeps_the_running_record_of_the_run_that_took_over():
+    import pytest
+    from unittest.mock import patch
+    from worker import worker as worker_mod
+
+    fakeredis = pytest.importorskip("fakeredis")
+    pytest.importorskip("lupa")
+    r = fakeredis.FakeRedis(decode_responses=True)
+    r.hset("job_running:prod:job-a", mapping={"worker_id": "w2", "fence": 4})
+    with patch.object(worker_mod, "release_run_lease"), patch.object(worker_mod, "remove_active_job"), patch.object(
+        worker_mod, "incr_running"
+    ), patch.object(worker_mod, "_end_running_script", None), patch.dict("os.environ", {"WORKER_DOMAIN": "prod"}):
+        # w1's lease (fence 3) expired and w2 re-ran the job
+        worker_mod.end_run(r, "w1", "job-a", 3)
+        assert r.hget("job_running:prod:job-a", "worker_id") == "w2"
+        worker_mod.end_run(r, "w2", "job-a", 4)
+        assert not r.exists("job_running:prod:job-a")
+
+
+def test_dispatch_envelope_round_trip():
+    from datetime import datetime
+    from scheduler.utils.envelope import build_envelope
+    from worker.utils.envelope import parse_queue_item
+
+    created = datetime(2024, 1, 1, 12, 0)
+    job = {"_id": "job-a", "priority": 3, "created_at": created, "schedule": {"mode": "cron", "cron": "* * * * *"}}
+    item = build_envelope(job, attempt=2, run_id="65f000000000000000000001", dispatched_at=10.0)
+    parsed = parse_queue_item(item)
+    assert parsed["job_id"] == "job-a" and parsed["attempt"] == 2 and parsed["run_id"] == "65f000000000000000000001"
+    assert parsed["job"]["created_at"] == created and parsed["job"]["schedule"] == {"mode": "cron", "next_run_at": None}
+    # Bare IDs from older schedulers still work; the worker loads the definition itself
+    assert parse_queue_item("job-a")["job"] is None
+
+
+def test_log_shipper_batches_lines_into_one_pipeline():
+    from unittest.mock import MagicMock
+    from worker.utils.log_shipper import LogShipper
+
+    r = MagicMock()
+    shipper = LogShipper(r, "prod", "run-1")
+    for i in range(3):
+        shipper.write("stdout", f"line {i}\n")
+    shipper.write("stderr", "oops\n")
+    assert shipper.close() == 0
+    pipe = r.pipeline.return_value
+    entries = [(c.args[1]["stream"], c.args[1]["text"]) for c in pipe.xadd.call_args_list]
+    # Consecutive lines of one stream share an entry; the end marker closes the stream
+    assert entries == [("stdout", "line 0\nline 1\nline 2\n"), ("stderr", "oops\n"), ("end", "")]
+    assert all(c.kwargs == {"maxlen": 10000, "approximate": True} for c in pipe.xadd.call_args_list)
+    assert pipe.execute.call_count == 1
+
+
+def test_output_store_writes_compressed_chunks_and_summary(monkeypatch):
+    import zlib
+    from unittest.mock import MagicMock
+    from worker.utils import output_store
+
+    monkeypatch.setenv("WORKER_OUTPUT_CHUNK_BYTES", "4096")
+    db = MagicMock()
+    store = output_store.OutputStore(db, "run-1")
+    lines = [f"line {i:05d}\n" for i in range(5000)]
+    for line in lines:
+        store.write("stdout", line)
+    store.write("stderr", "boom\n")
+    fields = store.close()
+
+    docs = [doc for c in db.job_run_chunks.insert_many.call_args_list for doc in c.args[0]]
+    chunks = sorted((doc for doc in docs if doc["stream"] == "stdout"), key=lambda doc: doc["seq"])
+    assert b"".join(zlib.decompress(c["data"]) for c in chunks).decode() == "".join(lines)
+    assert [c["offset"] for c in chunks] == [sum(c2["size"] for c2 in chunks[:i]) for i in range(len(chunks))]
+    assert fields["stdout_bytes"] == 5000 * 11 and fields["output_truncated"]
+    assert fields["stdout"].startswith("line 00000\n") and fields["stdout"].endswith("line 04999\n")
+    assert len(fields["stdout"]) < output_store.HEAD_BYTES + output_store.TAIL_BYTES + 200
+    assert fields["stderr"] == "boom\n" and fields["stderr_tail"] == "boom\n"
+    assert fields["output_failed_chunks"] == 0 and "output_gaps" not in fields
+
+
+def test_output_store_reports_chunks_that_could_not_be_stored(monkeypatch):
+    from unittest.mock import MagicMock
+    from worker.utils import output_store
+
+    monkeypatch.setenv("WORKER_OUTPUT_CHUNK_BYTES", "4096")
+    from pymongo.errors import BulkWriteError
+
+    def insert_many(docs, ordered):
+        # The first chunk fails, whether or not the writer batched both together
+        failed = [{"index": i, "errmsg": "timed out"} for i, doc in enumerate(docs) if doc["seq"] == 0]
+        if failed:
+            raise BulkWriteError({"writeErrors": failed})
+
+    db = MagicMock()
+    db.job_run_chunks.insert_many.side_effect = insert_many
+    store = output_store.OutputStore(db, "run-2")
+    store.write("stdout", "x" * 5000)
+    store.write("stdout", "y" * 5000)
+    fields = store.close()
+    # Offsets stay byte-accurate and the lost range is on the run document
+    assert fields["output_chunks"] == 2 and fields["output_failed_chunks"] == 1
+    assert fields["output_gaps"] == [{"stream": "stdout", "offset": 0, "size": 5000}]
+    stored = [doc for c in db.job_run_chunks.insert_many.call_args_list for doc in c.args[0]]
+    assert [(doc["offset"], doc["size"]) for doc in stored if doc["seq"] == 1] == [(5000, 5000)]
+
+
+def test_output_store_write_does_not_wait_for_mongo(monkeypatch):
+    import threading
+    from unittest.mock import MagicMock
+    from worker.utils import output_store
+
+    monkeypatch.setenv("WORKER_OUTPUT_CHUNK_BYTES", "4096")
+    release = threading.Event()
+    db = MagicMock()
+    db.job_run_chunks.insert_many.side_effect = lambda docs, ordered: release.wait(5)
+    store = output_store.OutputStore(db, "run-3")
+    # Completing chunks while an insert hangs returns at once (the asyncio engine writes on its loop)
+    writer = threading.Thread(target=lambda: [store.write("stdout", "z" * 4096) for _ in range(3)])
+    writer.start()
+    writer.join(1)
+    assert not writer.is_alive()
+    release.set()
+    assert store.close()["output_chunks"] == 3
+
+
+def test_venv_cache_builds_once_and_evicts_least_recently_used(tmp_path):
+    import os
+    import time
+    from worker.utils.venv_cache import VenvCache, cache_stats
+
+    cache = VenvCache(str(tmp_path), max_bytes=10**9, max_entries=2)
+    builds = []
+
+    def build(venv_dir):
+        builds.append(os.path.basename(venv_dir))
+        os.makedirs(venv_dir)
+        with open(os.path.join(venv_dir, "payload"), "w") as fh:
+            fh.write("x" * 100)
+
+    before = cache_stats()
+    venv_a, release_a = cache.acquire("a", build)
+    release_a()
+    _venv, release = cache.acquire("a", build)
+    release()
+    assert builds == ["a"] and venv_a == str(tmp_path / "a")
+    time.sleep(0.01)
+    # "b" stays in use while "c" is built: only the least recently used idle entry goes
+    _venv, release_b = cache.acquire("b", build)
+    time.sleep(0.01)
+    _venv, release_c = cache.acquire("c", build)
+    release_b()
+    release_c()
+    assert sorted(e["key"] for e in cache.entries()) == ["b", "c"]
+    after = cache_stats()
+    assert after["hits"] - before["hits"] == 1 and after["misses"] - before["misses"] == 3
+    assert after["evictions"] - before["evictions"] == 1
+
+
+def test_git_mirror_cache_checks_out_worktrees_and_skips_fetch_for_known_sha(tmp_path):
+    import os
+    import subprocess
+    from worker.utils.git import GitMirrorCache, git_cache_stats
+
+    repo = tmp_path / "repo"
+    git = ["git", "-c", "user.email=ci@example.com", "-c", "user.name=ci"]
+    subprocess.run(["git", "init", "-q", "-b", "main", str(repo)], check=True)
+    os.makedirs(repo / "jobs")
+    (repo / "jobs" / "run.sh").write_text("echo hi\n")
+    os.makedirs(repo / "docs")
+    (repo / "docs" / "index.md").write_text("docs\n")
+    subprocess.run(git + ["add", "."], cwd=repo, check=True)
+    subprocess.run(git + ["commit", "-qm", "init"], cwd=repo, check=True)
+    head = subprocess.run(["git", "rev-parse", "HEAD"], cwd=repo, check=True, capture_output=True, text=True).stdout.strip()
+    subprocess.run(["git", "update-ref", "refs/pull/1/head", head], cwd=repo, check=True)
+
+    cache = GitMirrorCache(str(tmp_path / "cache"), max_bytes=10**9, max_age=3600)
+    before = git_cache_stats()
+    first = tmp_path / "run1"
+    first.mkdir()
+    commit, release = cache.checkout(str(repo), "main", str(first))
+    assert commit == head and (first / "docs" / "index.md").exists()
+    release()
+    assert not first.exists()
+
+    sparse = tmp_path / "run2"
+    sparse.mkdir()
+    commit, release = cache.checkout(str(repo), head, str(sparse), sparse_path="jobs")
+    assert commit == head and (sparse / "jobs" / "run.sh").exists() and not (sparse / "docs").exists()
+    release()
+    after = git_cache_stats()
+    assert after["clones"] - before["clones"] == 1 and after["fetches_skipped"] - before["fetches_skipped"] == 1
+
+    # Branches and tags only; origin/<branch> resolves like it does in a clone
+    mirror = tmp_path / "cache" / f"{cache.key(str(repo))}.git"
+    subprocess.run(git + ["commit", "-q", "--allow-empty", "-m", "next"], cwd=repo, check=True)
+    tip = subprocess.run(["git", "rev-parse", "HEAD"], cwd=repo, check=True, capture_output=True, text=True).stdout.strip()
+    third = tmp_path / "run3"
+    third.mkdir()
+    commit, release = cache.checkout(str(repo), "origin/main", str(third))
+    assert commit == tip
+    release()
+    refs = subprocess.run(["git", "for-each-ref", "--format=%(refname)"], cwd=mirror, check=True, capture_output=True, text=True)
+    assert refs.stdout.split() == ["refs/heads/main"]
+
+    # Unused past max_age: evicted
+    assert cache.evict(now=cache.entries()[0]["last_used"] + 7200) == [cache.key(str(repo))]
+    assert cache.entries() == []
+
+
+def test_async_runner_streams_lines_and_enforces_timeout():
+    import asyncio
+    import sys
+    import time
+    from worker.utils.os_exec import _run_with_callbacks_async
+
+    seen = []
+
+    async def on_stdout(line):
+        seen.append(line)
+
+    code = "import sys; print('a'); print('b' * 100000); sys.stderr.write('err'); sys.exit(3)"
+    rc, out, err = asyncio.run(_run_with_callbacks_async([sys.executable, "-c", code], None, None, None, on_stdout=on_stdout))
+    assert rc == 3 and out == "a\n" + "b" * 100000 + "\n" and err == "err"
+    assert seen == ["a\n", "b" * 100000 + "\n"]
+
+    started = time.monotonic()
+    rc, _out, _err = asyncio.run(_run_with_callbacks_async([sys.executable, "-c", "import time; time.sleep(30)"], 1, None, None))
+    assert rc != 0 and time.monotonic() - started < 10
+
+
+def test_asyncio_engine_prefetch_does_not_raise_concurrency(monkeypatch):
+    import asyncio
+    import threading
+    import time
+    from unittest.mock import MagicMock
+    from worker import worker as worker_mod
+
+    items = [f"job-{i}" for i in range(6)]
+    running, peak, done = [0], [0], []
+    lock = threading.Lock()
+
+    class FakeAsyncRedis:
+        async def blmove(self, *_args):
+            return items.pop(0) if items else None
+
+    def claim_job(r, db, worker_id, item, in_flight_key):
+        with lock:
+            running[0] += 1
+            peak[0] = max(peak[0], running[0])
+        time.sleep(0.1)
+        with lock:
+            running[0] -= 1
+            done.append(item)
+        return None
+
+    monkeypatch.setenv("WORKER_PREFETCH", "3")
+    monkeypatch.setattr(worker_mod, "get_async_redis", lambda: FakeAsyncRedis())
+    monkeypatch.setattr(worker_mod, "claim_job", claim_job)
+    monkeypatch.setattr(worker_mod, "steal_job", lambda *args: None)
+
+    async def main():
+        engine = asyncio.create_task(worker_mod.run_asyncio_engine(MagicMock(), MagicMock(), "w1", 2, {}, {}, threading.Lock()))
+        while len(done) < 6:
+            await asyncio.sleep(0.05)
+        engine.cancel()
+
+    asyncio.run(asyncio.wait_for(main(), 10))
+    # Five credits pop ahead, but only max_concurrency=2 items are being worked on at a time
+    assert peak[0] == 2
+
+
+def test_async_log_shipper_batches_lines_into_one_pipeline():
+    import asyncio
+    from unittest.mock import AsyncMock, MagicMock
+    from worker.utils.log_shipper import AsyncLogShipper
+
+    r = MagicMock()
+    pipe = r.pipeline.return_value
+    pipe.execute = AsyncMock()
+
+    async def ship():
+        shipper = AsyncLogShipper(r, "prod", "run-1")
+        for i in range(3):
+            await shipper.write("stdout", f"line {i}\n")
+        await shipper.write("stderr", "oops\n")
+        return await shipper.close()
+
+    assert asyncio.run(ship()) == 0
+    entries = [(c.args[1]["stream"], c.args[1]["text"]) for c in pipe.xadd.call_args_list]
+    assert entries == [("stdout", "line 0\nline 1\nline 2\n"), ("stderr", "oops\n"), ("end", "")]
+    assert pipe.execute.await_count == 1
+
+
+def test_warm_python_pool_forks_jobs_from_a_started_interpreter():
+    import sys
+    from worker.utils.warm_python import WarmPythonPool
+
+    pool = WarmPythonPool()
+    executor = {"type": "python", "warm": True, "environment": {"type": "venv", "venv_path": sys.prefix, "preload": ["json"]}}
+    code = "import sys; print(__name__, sys.argv[1:]); sys.stderr.write('warn\\n'); raise SystemExit(3)"
+    try:
+        first, second = {}, {}
+        assert pool.run(executor, code, ["a"], None, {"X": "1"}, None, run_info=first) == (3, "__main__ ['a']\n", "warn\n")
+        assert pool.run(executor, "import os; print(os.environ['X'])", [], None, {"X": "2"}, None, run_info=second) == (0, "2\n", "")
+        assert first["python_start_mode"] == "cold" and second["python_start_mode"] == "warm"
+        assert second["python_startup_ms"] < second["python_cold_startup_ms"] == first["python_cold_startup_ms"]
+
+        rc, out, err = pool.run(executor, "1/0", [], None, None, None)
+        assert rc == 1 and err.splitlines()[1:] == ['  File "<string>", line 1, in <module>', "ZeroDivisionError: division by zero"]
+        rc, out, _err = pool.run(executor, "import time; print('s', flush=True); time.sleep(30)", [], 1, None, None)
+        assert rc == -9 and out == "s\n"
+    finally:
+        pool.close()
+
+
+def test_async_warm_runs_do_not_hold_the_loop_executor(tmp_path, monkeypatch):
+    import asyncio
+    import sys
+    from concurrent.futures import ThreadPoolExecutor
+    from worker import executor as executor_mod
+    from worker.utils import warm_python
+
+    monkeypatch.setenv("MAX_CONCURRENCY", "2")
+    monkeypatch.setattr(executor_mod, "_run_threads", None)
+    monkeypatch.setattr(warm_python, "_pool", None)
+    flag = tmp_path / "flag"
+    environment = {"type": "venv", "venv_path": sys.prefix}
+    waiter = {
+        "_id": "waiter",
+        "timeout": 20,
+        "executor": {"type": "python", "warm": True, "environment": environment, "code": (
+            "import os, time\n"
+            f"while not os.path.exists({str(flag)!r}):\n    time.sleep(0.05)\n"
+            "print('released')"
+        )},
+    }
+    setter = {
+        "_id": "setter",
+        "executor": {"type": "python", "warm": True, "environment": environment, "code": f"open({str(flag)!r}, 'w').close()"},
+    }
+    seen = []
+
+    async def on_stdout(text):
+        seen.append(text)
+
+    async def main():
+        # A single loop thread: a warm run held on it would keep the second job from starting
+        asyncio.get_running_loop().set_default_executor(ThreadPoolExecutor(max_workers=1))
+        first = asyncio.create_task(executor_mod.execute_job_async(waiter, log_callback_out=on_stdout))
+        await asyncio.sleep(0.5)
+        second = await asyncio.wait_for(executor_mod.execute_job_async(setter), 10)
+        return await asyncio.wait_for(first, 10), second
+
+    try:
+        (rc, out, _err), (rc2, _out2, _err2) = asyncio.run(main())
+    finally:
+        warm_python.get_warm_pool().close()
+    assert (rc, out, rc2) == (0, "released\n", 0) and seen == ["released\n"]
+
+
+def test_persistent_shell_pool_isolates_runs_and_kills_timeouts():
+    from worker.utils.shell_pool import ShellPool
+
+    pool = ShellPool()
+    try:
+        seen = []
+        assert pool.run("echo hi; echo err >&2; cd /; X=1; exit 3", None, None, None, on_stdout=seen.append) == (3, "hi\n", "err\n")
+        assert seen == ["hi\n"]
+        # Same shell, fresh state: the previous run's cd, variable and exit stayed in its subshell
+        assert pool.run('echo "[$X]"; printf tail', None, None, None) == (0, "[]\ntail", "")
+        rc, out, _err = pool.run("echo s; sleep 30 & sleep 30", 1, None, None)
+        assert rc == -9 and out == "s\n"
+        assert pool.run("echo again", None, None, None) == (0, "again\n", "")
+        # Reading stdin sees EOF instead of swallowing the shell's command channel
+        assert pool.run("read x; echo got:$x:$?", 3, None, None) == (0, "got::1\n", "")
+        assert pool.run("cat; echo after", 3, None, None) == (0, "after\n", "")
+    finally:
+        pool.close()
+
+
+def test_persistent_shell_fails_the_run_once_its_command_was_sent(tmp_path, monkeypatch):
+    from worker.executor import execute_job
+    from worker.utils import shell_pool
+
+    marker = tmp_path / "ran"
+    frame = shell_pool.PersistentShell._frame
+
+    def lose_pid_frame(self, kind, deadline):
+        if kind == "pid":
+            raise TimeoutError(kind)
+        return frame(self, kind, deadline)
+
+    monkeypatch.setattr(shell_pool, "_pool", None)
+    monkeypatch.setattr(shell_pool.PersistentShell, "_frame", lose_pid_frame)
+    job = {"_id": "once", "executor": {"type": "shell", "shell_mode": "persistent", "script": f"echo x >> {marker}"}}
+    try:
+        rc, _out, err = execute_job(job)
+    finally:
+        shell_pool.get_shell_pool().close()
+    # Reported as a failed run, not retried in a fresh shell
+    assert rc == 1 and "did not report" in err
+    assert not marker.exists() or marker.read_text() == "x\n"
+    assert not shell_pool.get_shell_pool()._idle
+
+
+def test_shell_mode_selects_login_or_plain_bash():
+    from worker.executor import streaming_command
+
+    job = {"executor": {"type": "shell", "script": "true"}}
+    assert streaming_command(job)[0] == ["/bin/bash", "-lc", "true"]
+    job["executor"]["shell_mode"] = "non_login"
+    assert streaming_command(job)[0] == ["/bin/bash", "-c", "true"]
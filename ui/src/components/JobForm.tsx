@@ -67,6 +67,10 @@ const createDefaultPayload = (): JobPayload => ({
     end_at: null,
     next_run_at: null,
     timezone: "UTC",
+    misfire_policy: "fire_once",
+    misfire_grace_seconds: 60,
+    max_catchup_seconds: 3600,
+    jitter_seconds: 0,
   },
   completion: {
     exit_codes: [0],
@@ -535,7 +539,7 @@ export function JobForm({
               <Row gutter={16}>
                 <Col span={24}>
                   <Form.Item label="Cron Expression">
-                    <Input value={schedule.cron ?? ""} onChange={(e) => updateSchedule({ cron: e.target.value })} placeholder="*/5 * * * *" />
+                    <Input value={schedule.cron ?? ""} onChange={(e) => updateSchedule({ cron: e.target.value })} placeholder="H/5 * * * *" />
                   </Form.Item>
                 </Col>
               </Row>
@@ -562,6 +566,56 @@ export function JobForm({
                 </Col>
               </Row>
             )}
+            {(schedule.mode === "interval" || schedule.mode === "cron") && (
+              <Row gutter={16}>
+                <Col xs={24} md={8}>
+                  <Form.Item label="Missed Runs" tooltip="What to do with ticks missed during an outage">
+                    <Select
+                      value={schedule.misfire_policy ?? "fire_once"}
+                      onChange={(misfire_policy) => updateSchedule({ misfire_policy })}
+                      options={[
+                        { label: "Run once, then resume", value: "fire_once" },
+                        { label: "Replay all", value: "fire_all" },
+                        { label: "Skip", value: "skip" },
+                      ]}
+                    />
+                  </Form.Item>
+                </Col>
+                <Col xs={24} md={8}>
+                  <Form.Item label="Grace (seconds)">
+                    <InputNumber
+                      min={0}
+                      style={{ width: "100%" }}
+                      value={schedule.misfire_grace_seconds ?? 60}
+                      onChange={(value) => updateSchedule({ misfire_grace_seconds: Number(value ?? 0) })}
+                    />
+                  </Form.Item>
+                </Col>
+                <Col xs={24} md={8}>
+                  <Form.Item label="Jitter (seconds)" tooltip="Stable per-job delay to spread jobs that share a cadence">
+                    <InputNumber
+                      min={0}
+                      max={86400}
+                      style={{ width: "100%" }}
+                      value={schedule.jitter_seconds ?? 0}
+                      onChange={(value) => updateSchedule({ jitter_seconds: Number(value ?? 0) })}
+                    />
+                  </Form.Item>
+                </Col>
+                {schedule.misfire_policy === "fire_all" && (
+                  <Col xs={24} md={8}>
+                    <Form.Item label="Max Catch-up (seconds)">
+                      <InputNumber
+                        min={1}
+                        style={{ width: "100%" }}
+                        value={schedule.max_catchup_seconds ?? undefined}
+                        onChange={(value) => updateSchedule({ max_catchup_seconds: value ? Number(value) : null })}
+                      />
+                    </Form.Item>
+                  </Col>
+                )}
+              </Row>
+            )}
           </>
         );
       case "completion":
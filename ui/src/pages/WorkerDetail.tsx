@@ -66,6 +66,10 @@ export function WorkerDetailPage() {
       <Card title="Details">
         <Descriptions bordered column={1} size="small">
           <Descriptions.Item label="Domain">{worker.domain}</Descriptions.Item>
+          <Descriptions.Item label="Stolen Jobs">{worker.stolen_jobs ?? 0}</Descriptions.Item>
+          <Descriptions.Item label="Venv Cache">
+            {`${worker.venv_cache_hits ?? 0} hits / ${worker.venv_cache_misses ?? 0} misses / ${worker.venv_cache_evictions ?? 0} evictions`}
+          </Descriptions.Item>
           <Descriptions.Item label="Hostname">{worker.hostname || "-"}</Descriptions.Item>
           <Descriptions.Item label="IP">{worker.ip || "-"}</Descriptions.Item>
           <Descriptions.Item label="OS">{worker.os || "-"}</Descriptions.Item>
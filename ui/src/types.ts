@@ -12,6 +12,7 @@ export type Executor =
       type: "python";
       code: string;
       interpreter?: string;
+      warm?: boolean;
       environment?: PythonEnvironment;
       args?: string[];
       env?: Record<string, string>;
@@ -21,6 +22,7 @@ export type Executor =
       type: "shell";
       script: string;
       shell?: string;
+      shell_mode?: "login" | "non_login" | "persistent";
       args?: string[];
       env?: Record<string, string>;
       workdir?: string | null;
@@ -47,6 +49,7 @@ export interface PythonEnvironment {
   venv_path?: string | null;
   requirements?: string[];
   requirements_file?: string | null;
+  preload?: string[];
 }
 
 export interface ScheduleConfig {
@@ -58,6 +61,10 @@ export interface ScheduleConfig {
   next_run_at?: string | null;
   timezone?: string;
   enabled: boolean;
+  misfire_policy?: "fire_once" | "fire_all" | "skip";
+  misfire_grace_seconds?: number;
+  max_catchup_seconds?: number | null;
+  jitter_seconds?: number;
 }
 
 export interface CompletionCriteria {
@@ -100,6 +107,10 @@ export interface JobRun {
   retries_remaining?: number;
   schedule_tick?: string;
   executor_type?: string;
+  source_commit?: string;
+  python_start_mode?: string;
+  python_startup_ms?: number;
+  python_cold_startup_ms?: number;
   queue_latency_ms?: number;
   completion_reason?: string;
   stdout_tail?: string;
@@ -163,6 +174,11 @@ export interface WorkerInfo {
   allowed_users: string[];
   max_concurrency: number;
   current_running: number;
+  reserved?: number;
+  stolen_jobs?: number;
+  venv_cache_hits?: number;
+  venv_cache_misses?: number;
+  venv_cache_evictions?: number;
   last_heartbeat?: number;
   status: string;
   state?: string;
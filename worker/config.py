@@ -1,3 +1,4 @@
+import json
 import os
 import platform
 from typing import List
@@ -38,3 +39,138 @@ def get_domain_token() -> str:
     if not token:
         raise RuntimeError("WORKER_DOMAIN_TOKEN (or API_TOKEN) is required for domain-scoped worker registration")
     return token
+
+
+def get_run_lease_ttl() -> float:
+    """Seconds a run lease survives without renewal before the scheduler requeues the run."""
+    try:
+        return max(float(os.getenv("WORKER_RUN_LEASE_TTL", "10")), 1.0)
+    except Exception:
+        return 10.0
+
+
+def get_steal_min_backlog() -> int:
+    """Steal from a peer only when its queue holds at least this many jobs; 0 disables stealing."""
+    try:
+        return max(int(os.getenv("WORKER_STEAL_MIN_BACKLOG", "2")), 0)
+    except Exception:
+        return 2
+
+
+def get_prefetch() -> int:
+    """Jobs a worker may pop beyond its free slots; 0 pops only when a slot is free."""
+    try:
+        return max(int(os.getenv("WORKER_PREFETCH", "0")), 0)
+    except Exception:
+        return 0
+
+
+def get_engine() -> str:
+    """How a worker runs jobs: `thread` (a pool thread per job) or `asyncio` (one event loop)."""
+    engine = os.getenv("WORKER_ENGINE", "thread").strip().lower()
+    if engine not in ("thread", "asyncio"):
+        print(f"Unknown WORKER_ENGINE {engine!r}; using thread")
+        return "thread"
+    return engine
+
+
+def _env_number(name: str, default: float, minimum: float) -> float:
+    try:
+        return max(float(os.getenv(name, str(default))), minimum)
+    except Exception:
+        return default
+
+
+def get_async_blocking_threads() -> int:
+    """Threads the asyncio engine uses for Mongo writes, lease scripts and source/env preparation."""
+    return int(_env_number("WORKER_ASYNC_THREADS", 32, 1))
+
+
+def get_log_flush_interval() -> float:
+    """Seconds a log line may wait in the shipper's buffer before it is flushed."""
+    return _env_number("WORKER_LOG_FLUSH_MS", 200, 1) / 1000.0
+
+
+def get_log_batch_lines() -> int:
+    """Lines that trigger an early flush."""
+    return int(_env_number("WORKER_LOG_BATCH_LINES", 500, 1))
+
+
+def get_log_buffer_bytes() -> int:
+    """Unflushed bytes a run may hold before writers wait and then drop lines."""
+    return int(_env_number("WORKER_LOG_BUFFER_BYTES", 4 * 1024 * 1024, 1024))
+
+
+def get_log_stream_maxlen() -> int:
+    """Approximate number of entries kept in each run's log stream."""
+    return int(_env_number("WORKER_LOG_STREAM_MAXLEN", 10000, 100))
+
+
+def get_output_chunk_bytes() -> int:
+    """Uncompressed bytes per stored output chunk (job_run_chunks)."""
+    return int(_env_number("WORKER_OUTPUT_CHUNK_BYTES", 256 * 1024, 4096))
+
+
+def get_venv_cache_dir() -> str:
+    """Worker-local cache of python executor environments; empty disables caching."""
+    default = os.path.join(os.path.expanduser("~"), ".cache", "hydra", "venvs")
+    return os.getenv("WORKER_VENV_CACHE_DIR", default)
+
+
+def get_venv_cache_max_bytes() -> int:
+    return int(_env_number("WORKER_VENV_CACHE_MAX_MB", 5120, 1) * 1024 * 1024)
+
+
+def get_venv_cache_max_entries() -> int:
+    return int(_env_number("WORKER_VENV_CACHE_MAX_ENTRIES", 32, 1))
+
+
+def get_git_cache_dir() -> str:
+    """Worker-local bare mirrors of job source repositories; empty restores a full clone per run."""
+    default = os.path.join(os.path.expanduser("~"), ".cache", "hydra", "git")
+    return os.getenv("WORKER_GIT_CACHE_DIR", default)
+
+
+def get_git_cache_max_bytes() -> int:
+    return int(_env_number("WORKER_GIT_CACHE_MAX_MB", 20480, 1) * 1024 * 1024)
+
+
+def get_git_cache_max_age() -> float:
+    """Seconds a mirror may go unused before it is evicted."""
+    return _env_number("WORKER_GIT_CACHE_MAX_AGE_HOURS", 168, 0) * 3600
+
+
+def get_python_warm_idle_seconds() -> float:
+    """Seconds a warm python fork server may sit unused before it is stopped."""
+    return _env_number("WORKER_PYTHON_WARM_IDLE_SECONDS", 600, 0)
+
+
+def get_python_warm_preload() -> List[str]:
+    """Modules every warm python fork server imports before it serves runs."""
+    modules = os.getenv("WORKER_PYTHON_WARM_PRELOAD", "")
+    return [m.strip() for m in modules.split(",") if m.strip()]
+
+
+def get_shell_pool_size() -> int:
+    """Idle persistent shells kept per (env, workdir) for `shell_mode: persistent` jobs."""
+    return int(_env_number("WORKER_SHELL_POOL_SIZE", 4, 0))
+
+
+def get_shell_pool_idle_seconds() -> float:
+    return _env_number("WORKER_SHELL_IDLE_SECONDS", 300, 0)
+
+
+def get_venv_warmup() -> List[dict]:
+    """Environments to build at worker start: a JSON list of python `environment` blocks, or @file."""
+    raw = os.getenv("WORKER_VENV_WARMUP", "").strip()
+    if not raw:
+        return []
+    try:
+        if raw.startswith("@"):
+            with open(raw[1:], "r", encoding="utf-8") as fh:
+                raw = fh.read()
+        specs = json.loads(raw)
+    except Exception as exc:
+        print(f"Ignoring WORKER_VENV_WARMUP: {exc}")
+        return []
+    return [spec for spec in specs if isinstance(spec, dict)] if isinstance(specs, list) else []
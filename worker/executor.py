@@ -1,64 +1,186 @@
+from concurrent.futures import ThreadPoolExecutor
 from datetime import datetime
-from typing import Tuple, Callable, Optional
+from typing import Any, List, Tuple, Callable, Optional
+import asyncio
+import inspect
 import tempfile
 import shutil
+import threading
 import os
 
 from bson import ObjectId
 
+from .config import get_max_concurrency
 from .mongo_client import get_db
-from .utils.os_exec import run_command, run_external, _run_with_callbacks
+from .utils.os_exec import run_command, run_external, _run_with_callbacks, _run_with_callbacks_async
 from .utils.python_env import prepare_python_command
-from .utils.git import fetch_git_source
+from .utils.git import checkout_git_source
+from .utils.shell_pool import ShellUnavailable, get_shell_pool
+from .utils.warm_python import WarmUnavailable, get_warm_pool
+
+
+def _checkout_source(job: dict, workdir: Optional[str], run_info: Optional[dict]) -> Tuple[Optional[str], Optional[Callable[[], None]]]:
+    """Check out the job's git source (if any); returns the effective workdir and a cleanup."""
+    source = job.get("source")
+    if not (source and source.get("url")):
+        return workdir, None
+    job_identifier = job.get("_id") or job.get("id") or "job"
+    tmp_source_dir = tempfile.mkdtemp(prefix=f"hydra-source-{job_identifier}-")
+    release_checkout = None
+    try:
+        sparse_path = source.get("path") if source.get("sparse") else None
+        commit, release_checkout = checkout_git_source(
+            source["url"], source.get("ref", "main"), tmp_source_dir, sparse_path=sparse_path
+        )
+        if run_info is not None:
+            run_info["source_commit"] = commit
+        # Determine effective workdir
+        # 1. Start at repo root
+        base_path = tmp_source_dir
+        # 2. If source has a 'path' sub-directory, append it
+        if source.get("path"):
+            base_path = os.path.join(base_path, source["path"])
+
+        # 3. If executor has a workdir:
+        #    - if absolute, use it (ignores repo, risky but standard behavior)
+        #    - if relative, append to base_path
+        if workdir:
+            if not os.path.isabs(workdir):
+                workdir = os.path.join(base_path, workdir)
+        else:
+            workdir = base_path
+    except Exception:
+        if release_checkout:
+            release_checkout()
+        shutil.rmtree(tmp_source_dir, ignore_errors=True)
+        raise
+
+    def _cleanup_source():
+        if release_checkout:
+            release_checkout()
+        shutil.rmtree(tmp_source_dir, ignore_errors=True)
+
+    return workdir, _cleanup_source
+
+
+def streaming_command(job: dict) -> Tuple[List[str], Optional[Callable[[], None]]]:
+    """The argv a job runs with when its output is streamed, plus a cleanup (python env teardown)."""
+    executor = job.get("executor") or {}
+    args = executor.get("args") or []
+    exec_type = (executor.get("type") or job.get("shell") or "shell").lower()
+    if exec_type == "python":
+        code = executor.get("code") or job.get("command", "")
+        command, cleanup = prepare_python_command(executor, job.get("_id") or job.get("id") or "job")
+        return command + ["-c", code] + args, cleanup
+    if exec_type == "external":
+        return [executor.get("command") or job.get("command", "")] + args, None
+    if exec_type == "batch":
+        script = executor.get("script") or job.get("command", "")
+        shell = executor.get("shell", "cmd")
+        return (["cmd", "/c", script] if shell == "cmd" else [shell, "-c", script]), None
+    script = executor.get("script") or job.get("command", "")
+    shell = executor.get("shell", job.get("shell", "bash"))
+    if shell != "bash":
+        return [shell, "-c", script], None
+    # `persistent` falls back to a login shell when no pooled shell can take the run
+    return ["/bin/bash", "-c" if _shell_mode(job) == "non_login" else "-lc", script], None
+
+
+def _shell_mode(job: dict) -> str:
+    return (job.get("executor") or {}).get("shell_mode") or "login"
+
+
+def _uses_persistent_shell(job: dict) -> bool:
+    executor = job.get("executor") or {}
+    exec_type = (executor.get("type") or job.get("shell") or "shell").lower()
+    shell = executor.get("shell", job.get("shell", "bash"))
+    return exec_type not in ("python", "external", "batch") and shell == "bash" and _shell_mode(job) == "persistent"
+
+
+def _run_persistent_shell(
+    job: dict,
+    timeout: Optional[int],
+    env: Optional[dict],
+    workdir: Optional[str],
+    on_stdout: Optional[Callable[[str], None]],
+    on_stderr: Optional[Callable[[str], None]],
+) -> Optional[Tuple[int, str, str]]:
+    """Run a `shell_mode: persistent` job in a pooled bash; None means run it in a fresh login shell."""
+    executor = job.get("executor") or {}
+    script = executor.get("script") or job.get("command", "")
+    try:
+        return get_shell_pool().run(script, timeout, env, workdir, on_stdout, on_stderr)
+    except ShellUnavailable as exc:
+        print(f"Running job {job.get('_id')} in a fresh shell: {exc}")
+        return None
+
+
+def _run_warm_python(
+    job: dict,
+    timeout: Optional[int],
+    env: Optional[dict],
+    workdir: Optional[str],
+    on_stdout: Optional[Callable[[str], None]],
+    on_stderr: Optional[Callable[[str], None]],
+    run_info: Optional[dict],
+) -> Optional[Tuple[int, str, str]]:
+    """Run a `warm: true` python job as a fork of the worker's warm interpreter; None means run it cold."""
+    executor = job.get("executor") or {}
+    code = executor.get("code") or job.get("command", "")
+    try:
+        return get_warm_pool().run(
+            executor, code, executor.get("args") or [], timeout, env, workdir, on_stdout, on_stderr, run_info
+        )
+    except WarmUnavailable as exc:
+        print(f"Running job {job.get('_id')} without a warm interpreter: {exc}")
+        if run_info is not None:
+            run_info["python_start_mode"] = "cold"
+        return None
+    except Exception as prep_err:
+        return 1, "", str(prep_err)
 
 
 def execute_job(
     job: dict,
     log_callback_out: Optional[Callable[[str], None]] = None,
     log_callback_err: Optional[Callable[[str], None]] = None,
+    run_info: Optional[dict] = None,
 ) -> Tuple[int, str, str]:
+    """
+    Run a job once and return (returncode, stdout, stderr). Facts learned along the way that
+    belong on the run document (such as the resolved `source_commit`) are put in `run_info`.
+    """
     executor = job.get("executor") or {}
     timeout = job.get("timeout", 0) or None
     env = executor.get("env")
-    workdir = executor.get("workdir")
     args = executor.get("args") or []
     exec_type = (executor.get("type") or job.get("shell") or "shell").lower()
     job_identifier = job.get("_id") or job.get("id") or "job"
 
-    source = job.get("source")
-    source_cleanup = None
-
-    if source and source.get("url"):
-        tmp_source_dir = tempfile.mkdtemp(prefix=f"hydra-source-{job_identifier}-")
-        try:
-            fetch_git_source(source["url"], source.get("ref", "main"), tmp_source_dir)
-            # Determine effective workdir
-            # 1. Start at repo root
-            base_path = tmp_source_dir
-            # 2. If source has a 'path' sub-directory, append it
-            if source.get("path"):
-                base_path = os.path.join(base_path, source["path"])
-            
-            # 3. If executor has a workdir:
-            #    - if absolute, use it (ignores repo, risky but standard behavior)
-            #    - if relative, append to base_path
-            if workdir:
-                if os.path.isabs(workdir):
-                    pass # keep as is
-                else:
-                    workdir = os.path.join(base_path, workdir)
-            else:
-                workdir = base_path
-            
-            def _cleanup_source():
-                shutil.rmtree(tmp_source_dir, ignore_errors=True)
-            source_cleanup = _cleanup_source
-
-        except Exception as e:
-            shutil.rmtree(tmp_source_dir, ignore_errors=True)
-            return 1, "", f"Failed to fetch source: {str(e)}"
+    try:
+        workdir, source_cleanup = _checkout_source(job, executor.get("workdir"), run_info)
+    except Exception as e:
+        return 1, "", f"Failed to fetch source: {str(e)}"
 
     try:
+        if exec_type == "python" and executor.get("warm"):
+            result = _run_warm_python(job, timeout, env, workdir, log_callback_out, log_callback_err, run_info)
+            if result is not None:
+                return result
+        if _uses_persistent_shell(job):
+            result = _run_persistent_shell(job, timeout, env, workdir, log_callback_out, log_callback_err)
+            if result is not None:
+                return result
+        if log_callback_out or log_callback_err:
+            try:
+                cmd, cleanup = streaming_command(job)
+            except Exception as prep_err:
+                return 1, "", str(prep_err)
+            try:
+                return _run_with_callbacks(cmd, timeout, env, workdir, on_stdout=log_callback_out, on_stderr=log_callback_err)
+            finally:
+                if cleanup:
+                    cleanup()
         if exec_type == "python":
             code = executor.get("code") or job.get("command", "")
             try:
@@ -67,44 +189,142 @@ def execute_job(
                 return 1, "", str(prep_err)
             try:
                 cmd_with_code = command + ["-c", code] + args
-                if log_callback_out or log_callback_err:
-                    rc, out, err = _run_with_callbacks(
-                        cmd_with_code, timeout, env, workdir, on_stdout=log_callback_out, on_stderr=log_callback_err
-                    )
-                else:
-                    rc, out, err = run_external(binary=cmd_with_code[0], args=cmd_with_code[1:], timeout=timeout, env=env, workdir=workdir)
-                return rc, out, err
+                return run_external(binary=cmd_with_code[0], args=cmd_with_code[1:], timeout=timeout, env=env, workdir=workdir)
             finally:
                 if cleanup:
                     cleanup()
         if exec_type == "external":
             binary = executor.get("command") or job.get("command", "")
-            if log_callback_out or log_callback_err:
-                cmd = [binary] + args
-                return _run_with_callbacks(cmd, timeout, env, workdir, on_stdout=log_callback_out, on_stderr=log_callback_err)
             return run_external(binary=binary, args=args, timeout=timeout, env=env, workdir=workdir)
         if exec_type == "batch":
             script = executor.get("script") or job.get("command", "")
             shell = executor.get("shell", "cmd")
-            if log_callback_out or log_callback_err:
-                cmd = ["cmd", "/c", script] if shell == "cmd" else [shell, "-c", script]
-                return _run_with_callbacks(cmd, timeout, env, workdir, on_stdout=log_callback_out, on_stderr=log_callback_err)
             return run_command(script, shell=shell, timeout=timeout, env=env, workdir=workdir)
 
         # default shell executor
         script = executor.get("script") or job.get("command", "")
         shell = executor.get("shell", job.get("shell", "bash"))
-        cmd = ["/bin/bash", "-lc", script] if shell == "bash" else [shell, "-c", script]
-        if log_callback_out or log_callback_err:
-            return _run_with_callbacks(cmd, timeout, env, workdir, on_stdout=log_callback_out, on_stderr=log_callback_err)
-        return run_command(script, shell=shell, timeout=timeout, env=env, workdir=workdir)
+        return run_command(
+            script, shell=shell, timeout=timeout, env=env, workdir=workdir, login=_shell_mode(job) != "non_login"
+        )
     finally:
         if source_cleanup:
             source_cleanup()
 
 
-def record_run_start(job: dict, worker_id: str, slot: int, retries_remaining: int) -> str:
+def _on_loop(cb: Optional[Callable[[str], Any]], loop: asyncio.AbstractEventLoop) -> Optional[Callable[[str], None]]:
+    """Wrap an engine callback (possibly a coroutine function) for calls from a drain thread."""
+    if cb is None:
+        return None
+
+    def call(text: str):
+        async def invoke():
+            result = cb(text)
+            if inspect.isawaitable(result):
+                await result
+
+        asyncio.run_coroutine_threadsafe(invoke(), loop).result()
+
+    return call
+
+
+_run_threads: Optional[ThreadPoolExecutor] = None
+_run_threads_lock = threading.Lock()
+
+
+def _run_thread_pool() -> ThreadPoolExecutor:
+    """
+    Threads for asyncio-engine runs whose protocol blocks for the whole run (warm python,
+    persistent shells). One per run the engine can execute at once (MAX_CONCURRENCY), so
+    such runs neither wait for each other nor take the loop's WORKER_ASYNC_THREADS pool away
+    from the claims, Mongo writes and checkouts of every other run.
+    """
+    global _run_threads
+    with _run_threads_lock:
+        if _run_threads is None:
+            _run_threads = ThreadPoolExecutor(
+                max_workers=get_max_concurrency(), thread_name_prefix="blocking-run"
+            )
+        return _run_threads
+
+
+async def execute_job_async(
+    job: dict,
+    log_callback_out: Optional[Callable[[str], Any]] = None,
+    log_callback_err: Optional[Callable[[str], Any]] = None,
+    run_info: Optional[dict] = None,
+) -> Tuple[int, str, str]:
+    """
+    execute_job for the asyncio engine. Source checkout and environment preparation run on
+    the loop's executor threads; the process itself, its pipes and its timeout live on the loop.
+    """
+    executor = job.get("executor") or {}
+    timeout = job.get("timeout", 0) or None
+    env = executor.get("env")
+
+    try:
+        workdir, source_cleanup = await asyncio.to_thread(_checkout_source, job, executor.get("workdir"), run_info)
+    except Exception as e:
+        return 1, "", f"Failed to fetch source: {str(e)}"
+
+    try:
+        if (executor.get("type") or "").lower() == "python" and executor.get("warm"):
+            # The fork server protocol is blocking; its pipe callbacks hop back onto the loop
+            loop = asyncio.get_running_loop()
+            result = await loop.run_in_executor(
+                _run_thread_pool(),
+                _run_warm_python,
+                job,
+                timeout,
+                env,
+                workdir,
+                _on_loop(log_callback_out, loop),
+                _on_loop(log_callback_err, loop),
+                run_info,
+            )
+            if result is not None:
+                return result
+        if _uses_persistent_shell(job):
+            loop = asyncio.get_running_loop()
+            result = await loop.run_in_executor(
+                _run_thread_pool(),
+                _run_persistent_shell,
+                job,
+                timeout,
+                env,
+                workdir,
+                _on_loop(log_callback_out, loop),
+                _on_loop(log_callback_err, loop),
+            )
+            if result is not None:
+                return result
+        try:
+            cmd, cleanup = await asyncio.to_thread(streaming_command, job)
+        except Exception as prep_err:
+            return 1, "", str(prep_err)
+        try:
+            return await _run_with_callbacks_async(
+                cmd, timeout, env, workdir, on_stdout=log_callback_out, on_stderr=log_callback_err
+            )
+        finally:
+            if cleanup:
+                await asyncio.to_thread(cleanup)
+    finally:
+        if source_cleanup:
+            await asyncio.to_thread(source_cleanup)
+
+
+def record_run_start(
+    job: dict,
+    worker_id: str,
+    slot: int,
+    retries_remaining: int,
+    fence: Optional[int] = None,
+    dispatch: Optional[dict] = None,
+) -> str:
+    """Insert the running run doc; `dispatch` is the parsed queue item (run ID, dispatch time, attempt)."""
     db = get_db()
+    dispatch = dispatch or {}
     job_id = job.get("_id") or job.get("id")
     user = job.get("user", "")
     domain = job.get("domain", "prod")
@@ -137,15 +357,40 @@ def record_run_start(job: dict, worker_id: str, slot: int, retries_remaining: in
         "executor_type": executor_type,
         "queue_latency_ms": queue_latency_ms,
         "completion_reason": None,
+        "fence": fence,
+        "dispatch_attempt": dispatch.get("attempt", 1),
+        "dispatched_at": datetime.utcfromtimestamp(dispatch["dispatched_at"]) if dispatch.get("dispatched_at") else None,
     }
+    if dispatch.get("run_id"):
+        run_doc["_id"] = ObjectId(dispatch["run_id"])
     res = db.job_runs.insert_one(run_doc)
     return str(res.inserted_id)
 
 
-def record_run_end(run_id: str, status: str, returncode: int, stdout: str, stderr: str, attempts: int, completion_reason: str):
+def record_run_end(
+    run_id: str,
+    status: str,
+    returncode: int,
+    stdout: str,
+    stderr: str,
+    attempts: int,
+    completion_reason: str,
+    fence: Optional[int] = None,
+    output: Optional[dict] = None,
+) -> bool:
+    """
+    Commit a run's result. stdout/stderr are the (summarised) text kept on the run document;
+    `output` adds the OutputStore fields (tails, byte counts, chunk count). With a fencing
+    token, the write only lands while the run is still `running` under that token; once the
+    scheduler has expired the lease (marking the run lost and requeueing it) a late result
+    from the stale holder is refused and False is returned.
+    """
     db = get_db()
-    db.job_runs.update_one(
-        {"_id": ObjectId(run_id)},
+    query = {"_id": ObjectId(run_id)}
+    if fence is not None:
+        query.update({"fence": fence, "status": "running"})
+    result = db.job_runs.update_one(
+        query,
         {
             "$set": {
                 "end_ts": datetime.utcnow(),
@@ -155,6 +400,8 @@ def record_run_end(run_id: str, status: str, returncode: int, stdout: str, stder
                 "stderr": stderr,
                 "attempt": attempts,
                 "completion_reason": completion_reason,
+                **{k: v for k, v in (output or {}).items() if k not in ("stdout", "stderr")},
             }
         },
     )
+    return result.matched_count > 0
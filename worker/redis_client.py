@@ -1,14 +1,32 @@
 import os
 import redis
+import redis.asyncio
 
 
 _redis_client = None
+_async_redis_client = None
+
+# Connections the asyncio engine's client may open; log flushes of every run share them
+ASYNC_MAX_CONNECTIONS = 64
+
+
+def _redis_url() -> str:
+    return os.getenv("REDIS_URL", "redis://localhost:6379/0")
 
 
 def get_redis() -> redis.Redis:
     global _redis_client
     if _redis_client is None:
-        url = os.getenv("REDIS_URL", "redis://localhost:6379/0")
-        _redis_client = redis.from_url(url, decode_responses=True)
+        _redis_client = redis.from_url(_redis_url(), decode_responses=True)
     return _redis_client
 
+
+def get_async_redis() -> redis.asyncio.Redis:
+    """Client for the asyncio engine; create and use it on the engine's event loop only."""
+    global _async_redis_client
+    if _async_redis_client is None:
+        pool = redis.asyncio.BlockingConnectionPool.from_url(
+            _redis_url(), decode_responses=True, max_connections=ASYNC_MAX_CONNECTIONS
+        )
+        _async_redis_client = redis.asyncio.Redis(connection_pool=pool)
+    return _async_redis_client
@@ -1,11 +1,48 @@
 from ..redis_client import get_redis
 from ..config import get_domain
+from .events import publish_worker_event
+
+
+# Convert a scheduler reservation into a running slot (or release it) atomically so the
+# scheduler's capacity check always sees running + reserved <= max_concurrency.
+CLAIM_RESERVED_LUA = """
+local reserved = tonumber(redis.call('HGET', KEYS[1], 'reserved') or '0') or 0
+if reserved > 0 then
+    reserved = redis.call('HINCRBY', KEYS[1], 'reserved', -1)
+end
+local running = redis.call('HINCRBY', KEYS[1], 'current_running', tonumber(ARGV[1]))
+return {running, reserved}
+"""
+
+_claim_script = None
+
+
+def _get_claim_script():
+    global _claim_script
+    if _claim_script is None:
+        _claim_script = get_redis().register_script(CLAIM_RESERVED_LUA)
+    return _claim_script
 
 
 def incr_running(worker_id: str, delta: int) -> int:
     r = get_redis()
     key = f"workers:{get_domain()}:{worker_id}"
-    return r.hincrby(key, "current_running", delta)
+    running = r.hincrby(key, "current_running", delta)
+    publish_worker_event(worker_id, "running", {"current_running": running})
+    return running
+
+
+def claim_reserved_slot(worker_id: str) -> int:
+    """Turn one reservation into a running slot; returns the new current_running."""
+    running, reserved = _get_claim_script()(keys=[f"workers:{get_domain()}:{worker_id}"], args=[1])
+    publish_worker_event(worker_id, "running", {"current_running": running, "reserved": reserved})
+    return int(running)
+
+
+def release_reserved_slot(worker_id: str):
+    """Drop a reservation for a job this worker will not run."""
+    running, reserved = _get_claim_script()(keys=[f"workers:{get_domain()}:{worker_id}"], args=[0])
+    publish_worker_event(worker_id, "running", {"current_running": running, "reserved": reserved})
 
 
 def add_active_job(worker_id: str, job_id: str):
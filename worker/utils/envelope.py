@@ -0,0 +1,41 @@
+import json
+from datetime import datetime
+from typing import Dict, Optional
+
+
+def _parse_ts(value) -> Optional[datetime]:
+    if isinstance(value, str):
+        try:
+            return datetime.fromisoformat(value)
+        except ValueError:
+            return None
+    return value
+
+
+def parse_queue_item(item: str) -> Dict:
+    """
+    Decode an item popped from this worker's queue. The scheduler pushes dispatch envelopes
+    (definition snapshot, run ID, dispatch time, attempt); older schedulers push a bare job
+    ID, in which case `job` is None and the caller loads the definition itself.
+    """
+    parsed = {"raw": item, "job_id": item, "job": None, "run_id": None, "dispatched_at": None, "attempt": 1}
+    if not item.startswith("{"):
+        return parsed
+    try:
+        envelope = json.loads(item)
+        job = envelope["job"]
+        parsed.update(
+            job_id=envelope["job_id"],
+            run_id=envelope.get("run_id"),
+            dispatched_at=envelope.get("dispatched_at"),
+            attempt=int(envelope.get("attempt", 1)),
+        )
+    except (ValueError, KeyError, TypeError):
+        return parsed
+    # The snapshot went through JSON; restore the timestamps run documents record
+    job["created_at"] = _parse_ts(job.get("created_at"))
+    schedule = job.get("schedule") or {}
+    if schedule.get("next_run_at"):
+        schedule["next_run_at"] = _parse_ts(schedule["next_run_at"])
+    parsed["job"] = job
+    return parsed
@@ -0,0 +1,14 @@
+import json
+import time
+from typing import Dict, Optional
+
+from ..redis_client import get_redis
+from ..config import get_domain
+
+
+def publish_worker_event(worker_id: str, event_type: str, fields: Optional[Dict] = None):
+    """Notify scheduler registries that this worker registered, heartbeated or changed load/state."""
+    r = get_redis()
+    domain = get_domain()
+    payload = {"type": event_type, "domain": domain, "worker_id": worker_id, "fields": fields or {}, "ts": time.time()}
+    r.publish(f"worker_events:{domain}", json.dumps(payload))
@@ -1,18 +1,258 @@
-import subprocess
+import hashlib
+import json
 import os
+import re
+import shutil
+import subprocess
+import threading
+import time
+from typing import Callable, Dict, List, Optional, Set, Tuple
+
+from ..config import get_git_cache_dir, get_git_cache_max_age, get_git_cache_max_bytes
+from .venv_cache import FileLock, _dir_size
+
+
+FULL_SHA = re.compile(r"^[0-9a-f]{40}$")
+# Branches and tags only: a --mirror clone would also copy refs/pull/* and other host refs
+MIRROR_REFSPECS = ("+refs/heads/*:refs/heads/*", "+refs/tags/*:refs/tags/*")
+
+_stats = {"clones": 0, "fetches": 0, "fetches_skipped": 0, "evictions": 0}
+_stats_lock = threading.Lock()
+
+
+def _count(name: str, amount=1):
+    with _stats_lock:
+        _stats[name] += amount
+
+
+def git_cache_stats() -> Dict[str, int]:
+    with _stats_lock:
+        return dict(_stats)
+
 
-def fetch_git_source(url: str, ref: str, dest: str):
+def _git(*args: str, cwd: Optional[str] = None) -> str:
+    out = subprocess.run(
+        ["git", *args], cwd=cwd, check=True, stdout=subprocess.PIPE, stderr=subprocess.PIPE, text=True
+    )
+    return out.stdout.strip()
+
+
+def fetch_git_source(url: str, ref: str, dest: str) -> str:
     """
     Clones a git repository to the destination directory and checks out the reference.
+    Returns the commit SHA that was checked out.
     """
-    # Ensure destination does not exist or we might fail, 
+    # Ensure destination does not exist or we might fail,
     # but usually the temp dir created by executor is empty or we are passed a fresh path.
-    
+
     # Clone
     cmd_clone = ["git", "clone", "-q", url, dest]
     subprocess.run(cmd_clone, check=True)
-    
+
     # Checkout
     if ref:
         cmd_checkout = ["git", "checkout", ref]
         subprocess.run(cmd_checkout, cwd=dest, check=True)
+    return _git("rev-parse", "HEAD", cwd=dest)
+
+
+class GitMirrorCache:
+    """
+    Worker-local cache of bare mirrors, one per repository URL in `<cache_dir>/<key>.git`,
+    holding the remote's branches and tags (`origin/<branch>` refs resolve to the branch).
+
+    A run takes a shared `<key>.use` lock for as long as its checkout exists, then updates
+    the mirror under the exclusive `<key>.lock`: clone on first use, otherwise an incremental
+    fetch - skipped when the ref is a full SHA the mirror already has - followed by a detached
+    `git worktree add` of the resolved commit. Mirrors unused for longer than `max_age` go
+    first at eviction, then the least recently used down to `max_bytes`; a mirror with a
+    checkout in use is never evicted.
+    """
+
+    def __init__(self, cache_dir: str, max_bytes: int, max_age: float):
+        self.cache_dir = cache_dir
+        self.max_bytes = max_bytes
+        self.max_age = max_age
+        # (key, sha) pairs known to be in a mirror, so pinned runs skip even the object lookup
+        self._known: Set[Tuple[str, str]] = set()
+        self._known_lock = threading.Lock()
+
+    @staticmethod
+    def key(url: str) -> str:
+        return hashlib.sha256(url.encode()).hexdigest()[:24]
+
+    def _paths(self, key: str) -> Dict[str, str]:
+        base = os.path.join(self.cache_dir, key)
+        return {"mirror": f"{base}.git", "meta": f"{base}.json", "lock": f"{base}.lock", "use": f"{base}.use"}
+
+    def checkout(
+        self, url: str, ref: str, dest: str, sparse_path: Optional[str] = None
+    ) -> Tuple[str, Callable[[], None]]:
+        """Check `ref` of `url` out into the empty directory `dest`; returns (commit, release)."""
+        os.makedirs(self.cache_dir, exist_ok=True)
+        key = self.key(url)
+        paths = self._paths(key)
+        in_use = FileLock(paths["use"], shared=True)
+        in_use.acquire()
+        try:
+            with FileLock(paths["lock"]):
+                commit = self._update(key, url, ref or "HEAD", paths)
+                if sparse_path:
+                    _git("worktree", "add", "-q", "--detach", "--no-checkout", dest, commit, cwd=paths["mirror"])
+                    _git("sparse-checkout", "set", sparse_path, cwd=dest)
+                    _git("reset", "-q", "--hard", commit, cwd=dest)
+                else:
+                    _git("worktree", "add", "-q", "--detach", dest, commit, cwd=paths["mirror"])
+        except Exception:
+            in_use.release()
+            raise
+
+        def release():
+            try:
+                with FileLock(paths["lock"]):
+                    try:
+                        _git("worktree", "remove", "--force", dest, cwd=paths["mirror"])
+                    except subprocess.CalledProcessError:
+                        shutil.rmtree(dest, ignore_errors=True)
+                        _git("worktree", "prune", cwd=paths["mirror"])
+            finally:
+                in_use.release()
+            self.evict(keep=key)
+
+        return commit, release
+
+    def _update(self, key: str, url: str, ref: str, paths: Dict[str, str]) -> str:
+        mirror = paths["mirror"]
+        meta = self._read_meta(paths["meta"])
+        if not meta or not os.path.isdir(mirror):
+            self._forget(key)
+            shutil.rmtree(mirror, ignore_errors=True)  # leftovers of an interrupted clone
+            _git("clone", "-q", "--bare", url, mirror)
+            _count("clones")
+            meta = {"url": url}
+        elif FULL_SHA.match(ref) and self._has_commit(key, mirror, ref):
+            _count("fetches_skipped")
+        else:
+            _git("fetch", "-q", "--prune", "origin", *MIRROR_REFSPECS, cwd=mirror)
+            _count("fetches")
+            meta.pop("size", None)
+        try:
+            commit = _git("rev-parse", "--verify", "--quiet", f"{self._mirror_ref(ref)}^{{commit}}", cwd=mirror)
+        except subprocess.CalledProcessError:
+            raise ValueError(f"ref {ref!r} not found in {url}") from None
+        with self._known_lock:
+            self._known.add((key, commit))
+        meta["last_used"] = time.time()
+        if "size" not in meta:
+            meta["size"] = _dir_size(mirror)
+        with open(paths["meta"], "w", encoding="utf-8") as fh:
+            json.dump(meta, fh)
+        return commit
+
+    @staticmethod
+    def _mirror_ref(ref: str) -> str:
+        """Branches sit under refs/heads in the mirror, so `origin/<branch>` names them there."""
+        if ref == "origin/HEAD":
+            return "HEAD"
+        if ref.startswith("origin/"):
+            return "refs/heads/" + ref[len("origin/") :]
+        return ref
+
+    def _has_commit(self, key: str, mirror: str, sha: str) -> bool:
+        with self._known_lock:
+            if (key, sha) in self._known:
+                return True
+        try:
+            _git("cat-file", "-e", f"{sha}^{{commit}}", cwd=mirror)
+        except subprocess.CalledProcessError:
+            return False
+        with self._known_lock:
+            self._known.add((key, sha))
+        return True
+
+    def _forget(self, key: str):
+        with self._known_lock:
+            self._known = {entry for entry in self._known if entry[0] != key}
+
+    @staticmethod
+    def _read_meta(path: str) -> Optional[Dict]:
+        try:
+            with open(path, "r", encoding="utf-8") as fh:
+                return json.load(fh)
+        except (OSError, ValueError):
+            return None
+
+    def entries(self) -> List[Dict]:
+        """Mirrors with their URL, size and last use, oldest first."""
+        found = []
+        try:
+            names = os.listdir(self.cache_dir)
+        except OSError:
+            return []
+        for name in names:
+            if not name.endswith(".json"):
+                continue
+            key = name[: -len(".json")]
+            meta = self._read_meta(os.path.join(self.cache_dir, name))
+            if not meta:
+                continue
+            found.append(
+                {"key": key, "url": meta.get("url"), "size": int(meta.get("size", 0)), "last_used": meta.get("last_used", 0)}
+            )
+        return sorted(found, key=lambda e: e["last_used"])
+
+    def evict(self, keep: Optional[str] = None, now: Optional[float] = None) -> List[str]:
+        now = time.time() if now is None else now
+        entries = self.entries()
+        total = sum(e["size"] for e in entries)
+        evicted = []
+        for entry in entries:
+            stale = now - entry["last_used"] > self.max_age
+            if not stale and total <= self.max_bytes:
+                break
+            if entry["key"] == keep:
+                continue
+            paths = self._paths(entry["key"])
+            in_use = FileLock(paths["use"])
+            if not in_use.acquire(blocking=False):
+                continue  # a run has a checkout from it
+            try:
+                with FileLock(paths["lock"]):
+                    os.remove(paths["meta"])
+                    shutil.rmtree(paths["mirror"], ignore_errors=True)
+                    self._forget(entry["key"])
+            finally:
+                in_use.release()
+            total -= entry["size"]
+            evicted.append(entry["key"])
+        if evicted:
+            _count("evictions", len(evicted))
+        return evicted
+
+
+_cache: Optional[GitMirrorCache] = None
+
+
+def get_git_cache() -> Optional[GitMirrorCache]:
+    """The worker's mirror cache, or None when WORKER_GIT_CACHE_DIR is set to an empty string."""
+    global _cache
+    cache_dir = get_git_cache_dir()
+    if not cache_dir:
+        return None
+    if _cache is None or _cache.cache_dir != cache_dir:
+        _cache = GitMirrorCache(cache_dir, get_git_cache_max_bytes(), get_git_cache_max_age())
+    return _cache
+
+
+def checkout_git_source(
+    url: str, ref: str, dest: str, sparse_path: Optional[str] = None
+) -> Tuple[str, Optional[Callable[[], None]]]:
+    """
+    Check a job's source out into `dest`: a worktree of the cached mirror, or a plain clone
+    when the cache is disabled. Returns (commit SHA, release) - release detaches a worktree
+    and is None for a clone, which the caller simply deletes.
+    """
+    cache = get_git_cache()
+    if cache is None:
+        return fetch_git_source(url, ref, dest), None
+    return cache.checkout(url, ref, dest, sparse_path=sparse_path)
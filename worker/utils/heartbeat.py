@@ -1,14 +1,19 @@
 import threading
 import time
-from typing import Callable
+from typing import Callable, Dict
 
 from ..redis_client import get_redis
 from ..config import get_domain
+from .events import publish_worker_event
+from .leases import renew_run_lease
+from .venv_cache import cache_stats
 
 
-def start_heartbeat(worker_id: str, get_active_jobs: Callable[[], list], interval: float = 2.0) -> threading.Thread:
+def start_heartbeat(worker_id: str, get_active_jobs: Callable[[], Dict[str, int]], interval: float = 2.0) -> threading.Thread:
+    """get_active_jobs returns {job_id: fencing token} for the runs this worker holds leases on."""
     r = get_redis()
     domain = get_domain()
+    lost = set()
 
     def _beat():
         while True:
@@ -16,10 +21,26 @@ def start_heartbeat(worker_id: str, get_active_jobs: Callable[[], list], interva
             r.zadd(f"worker_heartbeats:{domain}", {worker_id: now})
             # Keep current_running in sync with active job count for UI accuracy
             active_jobs = get_active_jobs()
-            r.hset(f"workers:{domain}:{worker_id}", mapping={"current_running": len(active_jobs)})
-            # Update heartbeat for running jobs
-            for job_id in active_jobs:
+            # status flips back to online if failover marked this worker offline during a stall
+            venv = cache_stats()
+            r.hset(
+                f"workers:{domain}:{worker_id}",
+                mapping={
+                    "current_running": len(active_jobs),
+                    "status": "online",
+                    "venv_cache_hits": venv["hits"],
+                    "venv_cache_misses": venv["misses"],
+                    "venv_cache_evictions": venv["evictions"],
+                },
+            )
+            publish_worker_event(worker_id, "heartbeat", {"current_running": len(active_jobs)})
+            # Update heartbeat for running jobs and renew their run leases
+            for job_id, fence in active_jobs.items():
                 r.hset(f"job_running:{domain}:{job_id}", mapping={"worker_id": worker_id, "heartbeat": now})
+                if not renew_run_lease(job_id, fence) and (job_id, fence) not in lost:
+                    lost.add((job_id, fence))
+                    print(f"Run lease for job {job_id} (fence {fence}) expired; its result will be discarded")
+            lost.intersection_update(active_jobs.items())
             time.sleep(interval)
 
     t = threading.Thread(target=_beat, daemon=True)
@@ -0,0 +1,96 @@
+import time
+from typing import Optional
+
+from ..redis_client import get_redis
+from ..config import get_domain, get_run_lease_ttl
+
+
+# Renew only while the lease still exists: once the scheduler expires it (and requeues the
+# run) this holder is stale and must not resurrect it.
+RENEW_RUN_LEASE_LUA = """
+if redis.call('EXISTS', KEYS[1]) == 0 then
+    return 0
+end
+redis.call('HSET', KEYS[1], 'heartbeat', ARGV[3])
+redis.call('ZADD', KEYS[2], 'XX', ARGV[2], ARGV[1])
+return 1
+"""
+
+_renew_script = None
+
+
+def run_lease_key(domain: str, job_id: str, fence: int) -> str:
+    return f"run_lease:{domain}:{job_id}:{fence}"
+
+
+def run_leases_key(domain: str) -> str:
+    return f"run_leases:{domain}"
+
+
+def lease_member(job_id: str, fence: int) -> str:
+    return f"{job_id}:{fence}"
+
+
+def acquire_run_lease(
+    job: dict, worker_id: str, claim_from: Optional[str] = None, item: Optional[str] = None
+) -> Optional[int]:
+    """
+    Start a run lease; returns its fencing token (monotonically increasing per job).
+    With `claim_from` (the worker's processing list) the job's queue `item` leaves that list in the same
+    transaction, so it is always owned by either the list or the lease. Returns None when the
+    job is no longer in the list because the scheduler reclaimed it.
+    """
+    r = get_redis()
+    domain = get_domain()
+    job_id = job.get("_id") or job.get("id")
+    fence = int(r.incr(f"job_fence:{domain}:{job_id}"))
+    now = time.time()
+    ttl = get_run_lease_ttl()
+    pipe = r.pipeline(transaction=True)
+    if claim_from:
+        pipe.lrem(claim_from, 1, item or job_id)
+    pipe.hset(
+        run_lease_key(domain, job_id, fence),
+        mapping={
+            "job_id": job_id,
+            "fence": fence,
+            "worker_id": worker_id,
+            "priority": job.get("priority", 5),
+            "user": job.get("user", ""),
+            "heartbeat": now,
+        },
+    )
+    pipe.zadd(run_leases_key(domain), {lease_member(job_id, fence): now + ttl})
+    results = pipe.execute()
+    if claim_from and not results[0]:
+        release_run_lease(job_id, fence)
+        return None
+    return fence
+
+
+def attach_run(job_id: str, fence: int, run_id: str):
+    """Record the run document guarded by this lease (lets the scheduler mark it lost)."""
+    get_redis().hset(run_lease_key(get_domain(), job_id, fence), "run_id", run_id)
+
+
+def renew_run_lease(job_id: str, fence: int) -> bool:
+    global _renew_script
+    r = get_redis()
+    if _renew_script is None:
+        _renew_script = r.register_script(RENEW_RUN_LEASE_LUA)
+    domain = get_domain()
+    now = time.time()
+    renewed = _renew_script(
+        keys=[run_lease_key(domain, job_id, fence), run_leases_key(domain)],
+        args=[lease_member(job_id, fence), now + get_run_lease_ttl(), now],
+    )
+    return bool(renewed)
+
+
+def release_run_lease(job_id: str, fence: int):
+    r = get_redis()
+    domain = get_domain()
+    pipe = r.pipeline(transaction=True)
+    pipe.delete(run_lease_key(domain, job_id, fence))
+    pipe.zrem(run_leases_key(domain), lease_member(job_id, fence))
+    pipe.execute()
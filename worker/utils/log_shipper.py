@@ -0,0 +1,215 @@
+import asyncio
+import threading
+import time
+from typing import List, Optional, Tuple
+
+from ..config import get_log_batch_lines, get_log_buffer_bytes, get_log_flush_interval, get_log_stream_maxlen
+
+
+LOG_STREAM_TTL_SECONDS = 3600
+# Consecutive lines of one stream are coalesced into entries of at most this many characters
+MAX_ENTRY_CHARS = 64 * 1024
+# How long a writer waits for the flusher to make room before dropping its line
+BACKPRESSURE_SECONDS = 1.0
+
+
+def log_stream_key(domain: str, run_id: str) -> str:
+    return f"log_stream:{domain}:{run_id}"
+
+
+class LogShipper:
+    """
+    Buffers a run's stdout/stderr lines and ships them to the Redis Stream
+    `log_stream:<domain>:<run_id>` from a background thread: one pipeline per flush, on size
+    (`WORKER_LOG_BATCH_LINES`) or time (`WORKER_LOG_FLUSH_MS`), trimmed with `MAXLEN ~`.
+    When Redis falls behind the buffer fills up to `WORKER_LOG_BUFFER_BYTES`; writers then
+    wait briefly (slowing the job's output pipe) and finally drop lines, counting them in
+    `dropped`. A closing `end` entry tells readers the run is finished.
+    """
+
+    def __init__(self, r, domain: str, run_id: str):
+        self._r = r
+        self.key = log_stream_key(domain, run_id)
+        self._batch_lines = get_log_batch_lines()
+        self._buffer_limit = get_log_buffer_bytes()
+        self._interval = get_log_flush_interval()
+        self._maxlen = get_log_stream_maxlen()
+        self._buffer: List[Tuple[str, str]] = []
+        self._buffered_bytes = 0
+        self._cond = threading.Condition()
+        self._closed = False
+        self.dropped = 0
+        self.shipped = 0
+        self.failed_flushes = 0
+        self._thread = threading.Thread(target=self._run, daemon=True)
+        self._thread.start()
+
+    def write(self, kind: str, text: str):
+        if not text:
+            return
+        size = len(text)
+        with self._cond:
+            deadline = time.monotonic() + BACKPRESSURE_SECONDS
+            while self._buffered_bytes + size > self._buffer_limit and not self._closed:
+                self._cond.notify_all()
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    self.dropped += 1
+                    return
+                self._cond.wait(remaining)
+            self._buffer.append((kind, text))
+            self._buffered_bytes += size
+            if len(self._buffer) >= self._batch_lines:
+                self._cond.notify_all()
+
+    def _take(self) -> List[Tuple[str, str]]:
+        batch, self._buffer, self._buffered_bytes = self._buffer, [], 0
+        self._cond.notify_all()
+        return batch
+
+    def _run(self):
+        while True:
+            with self._cond:
+                if not self._closed and len(self._buffer) < self._batch_lines:
+                    self._cond.wait(self._interval)
+                if self._closed:
+                    # close() ships the remainder together with the end marker
+                    return
+                batch = self._take()
+            if batch:
+                self._flush(batch)
+
+    @staticmethod
+    def _coalesce(batch: List[Tuple[str, str]]) -> List[Tuple[str, str]]:
+        entries: List[Tuple[str, str]] = []
+        for kind, text in batch:
+            if entries and entries[-1][0] == kind and len(entries[-1][1]) + len(text) <= MAX_ENTRY_CHARS:
+                entries[-1] = (kind, entries[-1][1] + text)
+            else:
+                entries.append((kind, text))
+        return entries
+
+    def _flush(self, batch: List[Tuple[str, str]], final: Optional[dict] = None):
+        now = time.time()
+        pipe = self._r.pipeline(transaction=False)
+        for kind, text in self._coalesce(batch):
+            pipe.xadd(self.key, {"stream": kind, "text": text, "ts": now}, maxlen=self._maxlen, approximate=True)
+        if final is not None:
+            pipe.xadd(self.key, {"stream": "end", "text": "", "ts": now, **final}, maxlen=self._maxlen, approximate=True)
+        pipe.expire(self.key, LOG_STREAM_TTL_SECONDS)
+        try:
+            pipe.execute()
+            self.shipped += len(batch)
+        except Exception as exc:
+            # Logs are best effort; the full output still lands in the run document
+            self.failed_flushes += 1
+            self.dropped += len(batch)
+            if self.failed_flushes == 1:
+                print(f"Log shipping to {self.key} failed: {exc}")
+
+    def close(self) -> int:
+        """Flush what is left, write the end marker and stop; returns the number of dropped lines."""
+        with self._cond:
+            if self._closed:
+                return self.dropped
+            self._closed = True
+            self._cond.notify_all()
+        self._thread.join(timeout=5)
+        with self._cond:
+            batch = self._take()
+        self._flush(batch, final={"dropped": self.dropped})
+        return self.dropped
+
+
+class AsyncLogShipper:
+    """
+    LogShipper for the asyncio engine: same stream layout, batching and end marker, but the
+    flusher is a task on the running loop and XADDs go through a `redis.asyncio` client. A
+    full buffer makes `write` await the flusher (the engine awaits it from the pipe reader,
+    so the job's output slows down) before lines are dropped.
+    """
+
+    def __init__(self, r, domain: str, run_id: str):
+        self._r = r
+        self.key = log_stream_key(domain, run_id)
+        self._batch_lines = get_log_batch_lines()
+        self._buffer_limit = get_log_buffer_bytes()
+        self._interval = get_log_flush_interval()
+        self._maxlen = get_log_stream_maxlen()
+        self._buffer: List[Tuple[str, str]] = []
+        self._buffered_bytes = 0
+        self._wake = asyncio.Event()
+        self._drained = asyncio.Event()
+        self._closed = False
+        self.dropped = 0
+        self.shipped = 0
+        self.failed_flushes = 0
+        self._task = asyncio.get_running_loop().create_task(self._run())
+
+    async def write(self, kind: str, text: str):
+        if not text:
+            return
+        size = len(text)
+        if self._buffered_bytes + size > self._buffer_limit and not self._closed:
+            self._drained.clear()
+            self._wake.set()
+            try:
+                await asyncio.wait_for(self._drained.wait(), BACKPRESSURE_SECONDS)
+            except asyncio.TimeoutError:
+                pass
+            if self._buffered_bytes + size > self._buffer_limit:
+                self.dropped += 1
+                return
+        self._buffer.append((kind, text))
+        self._buffered_bytes += size
+        if len(self._buffer) >= self._batch_lines:
+            self._wake.set()
+
+    def _take(self) -> List[Tuple[str, str]]:
+        batch, self._buffer, self._buffered_bytes = self._buffer, [], 0
+        self._drained.set()
+        return batch
+
+    async def _run(self):
+        while True:
+            if len(self._buffer) < self._batch_lines:
+                try:
+                    await asyncio.wait_for(self._wake.wait(), self._interval)
+                except asyncio.TimeoutError:
+                    pass
+            self._wake.clear()
+            if self._closed:
+                return
+            batch = self._take()
+            if batch:
+                await self._flush(batch)
+
+    async def _flush(self, batch: List[Tuple[str, str]], final: Optional[dict] = None):
+        now = time.time()
+        pipe = self._r.pipeline(transaction=False)
+        for kind, text in LogShipper._coalesce(batch):
+            pipe.xadd(self.key, {"stream": kind, "text": text, "ts": now}, maxlen=self._maxlen, approximate=True)
+        if final is not None:
+            pipe.xadd(self.key, {"stream": "end", "text": "", "ts": now, **final}, maxlen=self._maxlen, approximate=True)
+        pipe.expire(self.key, LOG_STREAM_TTL_SECONDS)
+        try:
+            await pipe.execute()
+            self.shipped += len(batch)
+        except Exception as exc:
+            self.failed_flushes += 1
+            self.dropped += len(batch)
+            if self.failed_flushes == 1:
+                print(f"Log shipping to {self.key} failed: {exc}")
+
+    async def close(self) -> int:
+        """Flush what is left, write the end marker and stop; returns the number of dropped lines."""
+        if self._closed:
+            return self.dropped
+        self._closed = True
+        self._wake.set()
+        try:
+            await asyncio.wait_for(self._task, 5)
+        except (asyncio.TimeoutError, asyncio.CancelledError):
+            pass
+        await self._flush(self._take(), final={"dropped": self.dropped})
+        return self.dropped
@@ -1,8 +1,12 @@
+import asyncio
+import codecs
+import inspect
 import os
 import platform
 import subprocess
+import sys
 import threading
-from typing import Callable, Dict, List, Optional, Sequence, Tuple
+from typing import Any, Callable, Dict, List, Optional, Sequence, Tuple
 
 
 def _merged_env(extra: Optional[Dict[str, str]]) -> Dict[str, str]:
@@ -24,6 +28,23 @@ def _run(cmd: Sequence[str], timeout: Optional[int], env: Optional[Dict[str, str
     return proc.returncode, proc.stdout, proc.stderr
 
 
+def _drain(pipe, sink: List[str], cb: Optional[Callable[[str], None]]):
+    for line in iter(pipe.readline, ""):
+        sink.append(line)
+        if cb:
+            try:
+                cb(line)
+            except Exception:
+                pass
+    pipe.close()
+
+
+def _start_drain(pipe, sink: List[str], cb: Optional[Callable[[str], None]]) -> threading.Thread:
+    thread = threading.Thread(target=_drain, args=(pipe, sink, cb), daemon=True)
+    thread.start()
+    return thread
+
+
 def _run_with_callbacks(
     cmd: Sequence[str],
     timeout: Optional[int],
@@ -45,26 +66,11 @@ def _run_with_callbacks(
     )
     stdout_lines: List[str] = []
     stderr_lines: List[str] = []
-
-    def _drain(pipe, sink: List[str], cb: Optional[Callable[[str], None]]):
-        for line in iter(pipe.readline, ""):
-            sink.append(line)
-            if cb:
-                try:
-                    cb(line)
-                except Exception:
-                    pass
-        pipe.close()
-
     threads = []
     if proc.stdout:
-        t_out = threading.Thread(target=_drain, args=(proc.stdout, stdout_lines, on_stdout), daemon=True)
-        t_out.start()
-        threads.append(t_out)
+        threads.append(_start_drain(proc.stdout, stdout_lines, on_stdout))
     if proc.stderr:
-        t_err = threading.Thread(target=_drain, args=(proc.stderr, stderr_lines, on_stderr), daemon=True)
-        t_err.start()
-        threads.append(t_err)
+        threads.append(_start_drain(proc.stderr, stderr_lines, on_stderr))
 
     try:
         proc.wait(timeout=timeout if timeout and timeout > 0 else None)
@@ -77,19 +83,99 @@ def _run_with_callbacks(
     return proc.returncode, "".join(stdout_lines), "".join(stderr_lines)
 
 
+# Bytes read from a pipe per await in the asyncio engine
+_PIPE_READ_BYTES = 64 * 1024
+
+
+def install_child_watcher(loop: asyncio.AbstractEventLoop) -> bool:
+    """
+    Before Python 3.12 asyncio waits for every child process in a thread of its own; where the
+    kernel has pidfds, wait for them on `loop` instead. Returns whether a watcher was installed.
+    """
+    if sys.version_info >= (3, 12) or not hasattr(os, "pidfd_open"):
+        return False
+    try:
+        os.close(os.pidfd_open(os.getpid()))
+    except OSError:
+        return False
+    watcher = asyncio.PidfdChildWatcher()
+    watcher.attach_loop(loop)
+    asyncio.get_event_loop_policy().set_child_watcher(watcher)
+    return True
+
+
+async def _drain_async(stream: asyncio.StreamReader, sink: List[str], cb: Optional[Callable[[str], Any]]):
+    # Split lines ourselves: StreamReader.readline() raises (and loses data) on lines over its limit
+    decoder = codecs.getincrementaldecoder("utf-8")(errors="replace")
+    partial = ""
+    while True:
+        data = await stream.read(_PIPE_READ_BYTES)
+        *complete, partial = (partial + decoder.decode(data, final=not data)).split("\n")
+        lines = [line + "\n" for line in complete]
+        if not data and partial:
+            lines.append(partial)
+        for line in lines:
+            sink.append(line)
+            if cb:
+                try:
+                    result = cb(line)
+                    if inspect.isawaitable(result):
+                        await result
+                except Exception:
+                    pass
+        if not data:
+            return
+
+
+async def _run_with_callbacks_async(
+    cmd: Sequence[str],
+    timeout: Optional[int],
+    env: Optional[Dict[str, str]],
+    workdir: Optional[str],
+    on_stdout: Optional[Callable[[str], Any]] = None,
+    on_stderr: Optional[Callable[[str], Any]] = None,
+) -> Tuple[int, str, str]:
+    """
+    Event-loop counterpart of _run_with_callbacks: both pipes are drained by coroutines on the
+    running loop and the timeout is a loop timer, so a run costs no threads. Callbacks may be
+    coroutine functions; awaiting them slows the pipe reads, which is how log backpressure
+    reaches the job.
+    """
+    proc = await asyncio.create_subprocess_exec(
+        *cmd,
+        stdout=asyncio.subprocess.PIPE,
+        stderr=asyncio.subprocess.PIPE,
+        cwd=workdir,
+        env=_merged_env(env),
+    )
+    stdout_lines: List[str] = []
+    stderr_lines: List[str] = []
+    drains = asyncio.gather(
+        _drain_async(proc.stdout, stdout_lines, on_stdout),
+        _drain_async(proc.stderr, stderr_lines, on_stderr),
+    )
+    try:
+        await asyncio.wait_for(proc.wait(), timeout=timeout if timeout and timeout > 0 else None)
+    except asyncio.TimeoutError:
+        proc.kill()
+        await proc.wait()
+    try:
+        # Same grace as the thread drains' join: a grandchild may still hold the pipes open
+        await asyncio.wait_for(drains, timeout=1)
+    except asyncio.TimeoutError:
+        pass
+
+    return proc.returncode, "".join(stdout_lines), "".join(stderr_lines)
+
+
 def run_command(command: str, shell: str = "bash", timeout: Optional[int] = None,
-                env: Optional[Dict[str, str]] = None, workdir: Optional[str] = None) -> Tuple[int, str, str]:
+                env: Optional[Dict[str, str]] = None, workdir: Optional[str] = None,
+                login: bool = True) -> Tuple[int, str, str]:
     system = platform.system().lower()
     shell_lc = (shell or "bash").lower()
     if system.startswith("linux") or system == "darwin":
-        if shell_lc == "bash":
-            cmd = ["/bin/bash", "-lc", command]
-        elif shell_lc == "cmd":
-            cmd = ["/bin/bash", "-lc", command]
-        elif shell_lc == "powershell":
-            cmd = ["/bin/bash", "-lc", command]
-        else:
-            cmd = ["/bin/bash", "-lc", command]
+        # A login shell sources the whole profile first; `login=False` skips it
+        cmd = ["/bin/bash", "-lc" if login else "-c", command]
     elif system.startswith("win"):
         if shell_lc == "powershell":
             cmd = ["powershell.exe", "-NoProfile", "-NonInteractive", "-Command", command]
@@ -98,7 +184,7 @@ def run_command(command: str, shell: str = "bash", timeout: Optional[int] = None
         else:
             cmd = ["powershell.exe", "-NoProfile", "-NonInteractive", "-Command", command]
     else:
-        cmd = ["/bin/bash", "-lc", command]
+        cmd = ["/bin/bash", "-lc" if login else "-c", command]
 
     return _run(cmd, timeout, env, workdir)
 
@@ -0,0 +1,185 @@
+import queue
+import threading
+import zlib
+from typing import Dict, List, Optional, Tuple
+
+from bson import Binary
+from pymongo.errors import BulkWriteError
+
+from ..config import get_output_chunk_bytes
+
+
+# Bytes of each stream kept verbatim at the start and end of the run document's summary
+HEAD_BYTES = 16 * 1024
+TAIL_BYTES = 16 * 1024
+TAIL_PREVIEW_CHARS = 4096
+COMPRESS_LEVEL = 6
+# Chunks the background writer sends in one insert_many
+WRITE_BATCH = 64
+
+
+class _StreamBuffer:
+    def __init__(self):
+        self.pending = bytearray()
+        self.head = bytearray()
+        self.tail = bytearray()
+        self.total = 0
+        self.seq = 0
+        self.offset = 0
+
+    def add(self, data: bytes):
+        self.pending += data
+        if len(self.head) < HEAD_BYTES:
+            self.head += data[: HEAD_BYTES - len(self.head)]
+        self.tail += data
+        if len(self.tail) > TAIL_BYTES:
+            del self.tail[: len(self.tail) - TAIL_BYTES]
+        self.total += len(data)
+
+    def summary(self, run_id: str, stream: str) -> str:
+        if self.total <= len(self.head) + len(self.tail):
+            # Head and tail overlap or touch: together they are the whole output
+            rest = self.total - len(self.head)
+            text = bytes(self.head) + (bytes(self.tail[len(self.tail) - rest :]) if rest > 0 else b"")
+            return text.decode("utf-8", errors="replace")
+        skipped = self.total - len(self.head) - len(self.tail)
+        marker = f"\n... [{skipped} bytes omitted; GET /runs/{run_id}/output?stream={stream}] ...\n"
+        return (
+            bytes(self.head).decode("utf-8", errors="replace")
+            + marker
+            + bytes(self.tail).decode("utf-8", errors="replace")
+        )
+
+
+class ChunkWriter:
+    """
+    Inserts finished output chunks from one background thread per worker process, compressing
+    them and batching whatever queued up meanwhile into one insert_many per collection.
+    OutputStore only hands chunks over, so neither a pipe drain thread nor the asyncio loop
+    waits on Mongo; each store is told which of its chunks failed.
+    """
+
+    def __init__(self):
+        self._queue: "queue.SimpleQueue[Tuple[OutputStore, Dict]]" = queue.SimpleQueue()
+        self._thread: Optional[threading.Thread] = None
+        self._lock = threading.Lock()
+
+    def submit(self, store: "OutputStore", doc: Dict):
+        with self._lock:
+            if self._thread is None or not self._thread.is_alive():
+                self._thread = threading.Thread(target=self._run, name="output-chunk-writer", daemon=True)
+                self._thread.start()
+        self._queue.put((store, doc))
+
+    def _run(self):
+        while True:
+            batch = [self._queue.get()]
+            while len(batch) < WRITE_BATCH:
+                try:
+                    batch.append(self._queue.get_nowait())
+                except queue.Empty:
+                    break
+            by_collection: Dict[int, Tuple[object, List[Tuple[OutputStore, Dict]]]] = {}
+            for store, doc in batch:
+                by_collection.setdefault(id(store.collection), (store.collection, []))[1].append((store, doc))
+            for collection, items in by_collection.values():
+                self._insert(collection, items)
+
+    @staticmethod
+    def _insert(collection, items: List[Tuple["OutputStore", Dict]]):
+        errors: Dict[int, str] = {}
+        try:
+            docs = [{**doc, "data": Binary(zlib.compress(doc["data"], COMPRESS_LEVEL))} for _store, doc in items]
+            collection.insert_many(docs, ordered=False)
+        except BulkWriteError as exc:
+            errors = {err["index"]: err.get("errmsg", "") for err in exc.details.get("writeErrors", [])}
+            if not errors:
+                errors = {i: str(exc) for i in range(len(items))}
+        except Exception as exc:
+            errors = {i: str(exc) for i in range(len(items))}
+        for i, (store, doc) in enumerate(items):
+            store._chunk_done(doc, errors.get(i))
+
+
+_writer = ChunkWriter()
+
+
+class OutputStore:
+    """
+    Writes a run's stdout/stderr to `job_run_chunks` while it runs: zlib-compressed chunks
+    of `WORKER_OUTPUT_CHUNK_BYTES` keyed by (run_id, stream, seq) with their byte offset, so
+    any range can be read back without loading the whole log. Chunks are stored by the
+    process's ChunkWriter, so write() never waits on Mongo. The run document only gets the
+    head/tail summary, byte counts and any chunks that could not be stored, returned by close().
+    """
+
+    def __init__(self, db, run_id: str):
+        self.collection = db.job_run_chunks
+        self.run_id = run_id
+        self._chunk_bytes = get_output_chunk_bytes()
+        self._streams: Dict[str, _StreamBuffer] = {"stdout": _StreamBuffer(), "stderr": _StreamBuffer()}
+        self._cond = threading.Condition()
+        self._unwritten = 0
+        self.failed_chunks = 0
+        # Byte ranges lost with failed chunks, so readers can tell a gap from the end of output
+        self.gaps: List[Dict] = []
+
+    def write(self, stream: str, text: str):
+        if not text:
+            return
+        with self._cond:
+            buf = self._streams.setdefault(stream, _StreamBuffer())
+            buf.add(text.encode("utf-8", errors="replace"))
+            if len(buf.pending) >= self._chunk_bytes:
+                self._flush(stream, buf)
+
+    def _flush(self, stream: str, buf: _StreamBuffer):
+        data = bytes(buf.pending)
+        buf.pending.clear()
+        if not data:
+            return
+        doc = {
+            "run_id": self.run_id,
+            "stream": stream,
+            "seq": buf.seq,
+            "offset": buf.offset,
+            "size": len(data),
+            "encoding": "zlib",
+            "data": data,
+        }
+        buf.seq += 1
+        buf.offset += len(data)
+        self._unwritten += 1
+        _writer.submit(self, doc)
+
+    def _chunk_done(self, doc: Dict, error: Optional[str]):
+        with self._cond:
+            self._unwritten -= 1
+            if error is not None:
+                self.failed_chunks += 1
+                self.gaps.append({"stream": doc["stream"], "offset": doc["offset"], "size": doc["size"]})
+                if self.failed_chunks == 1:
+                    print(f"Storing output of run {self.run_id} failed: {error}")
+            self._cond.notify_all()
+
+    def close(self) -> Dict:
+        """Flush the remaining output and wait for it to be stored; returns the run document fields describing it."""
+        with self._cond:
+            for stream, buf in self._streams.items():
+                self._flush(stream, buf)
+            while self._unwritten:
+                self._cond.wait()
+            fields: Dict = {}
+            for stream, buf in self._streams.items():
+                summary = buf.summary(self.run_id, stream)
+                fields[stream] = summary
+                fields[f"{stream}_tail"] = summary[-TAIL_PREVIEW_CHARS:]
+                fields[f"{stream}_bytes"] = buf.total
+            fields["output_chunks"] = sum(buf.seq for buf in self._streams.values())
+            fields["output_truncated"] = any(
+                buf.total > len(buf.head) + len(buf.tail) for buf in self._streams.values()
+            )
+            fields["output_failed_chunks"] = self.failed_chunks
+            if self.gaps:
+                fields["output_gaps"] = sorted(self.gaps, key=lambda g: (g["stream"], g["offset"]))
+            return fields
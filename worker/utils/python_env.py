@@ -5,6 +5,8 @@ import subprocess
 import tempfile
 from typing import Dict, List, Optional, Tuple, Callable
 
+from .venv_cache import environment_key, get_venv_cache
+
 
 def _venv_python_path(venv_dir: str) -> str:
     if platform.system().lower().startswith("win"):
@@ -23,6 +25,20 @@ def _install_requirements(python_bin: str, requirements: List[str], requirements
         _run([python_bin, "-m", "pip", "install", "-r", requirements_file])
 
 
+def warm_up_environments(specs: List[Dict]) -> int:
+    """Build the given `environment` blocks into the venv cache ahead of the first job."""
+    built = 0
+    for spec in specs:
+        try:
+            _cmd, release = prepare_python_command({"environment": {"type": "system", **spec}}, "warmup")
+            if release:
+                release()
+            built += 1
+        except Exception as exc:
+            print(f"Warm-up of python environment {spec} failed: {exc}")
+    return built
+
+
 def _resolve_python_binary(version: Optional[str], default: str) -> str:
     if not version:
         return default
@@ -35,6 +51,11 @@ def _resolve_python_binary(version: Optional[str], default: str) -> str:
 
 
 def prepare_python_command(executor: Dict, job_id: str) -> Tuple[List[str], Optional[Callable[[], None]]]:
+    """
+    Command prefix for a python job plus an optional cleanup. Environments built from a
+    requirements spec come from the worker's venv cache (keyed by interpreter and
+    requirements) instead of a fresh venv per run; `venv_path` environments are used as-is.
+    """
     env_cfg = (executor.get("environment") or {})
     env_type = env_cfg.get("type", "system")
     python_version = env_cfg.get("python_version")
@@ -44,8 +65,12 @@ def prepare_python_command(executor: Dict, job_id: str) -> Tuple[List[str], Opti
     venv_path = env_cfg.get("venv_path") or None
     cleanup = None
 
+    cache = get_venv_cache()
     if env_type == "uv":
         cmd = ["uv", "run"]
+        if cache:
+            # uv keeps its own content-addressed package cache; share the worker's cache directory
+            cmd += ["--cache-dir", os.path.join(cache.cache_dir, "uv")]
         if python_version:
             cmd += ["--python", python_version]
         for req in requirements:
@@ -61,6 +86,16 @@ def prepare_python_command(executor: Dict, job_id: str) -> Tuple[List[str], Opti
         python_bin = _venv_python_path(venv_path)
     else:
         base_python = _resolve_python_binary(python_version, interpreter)
+        key = environment_key(base_python, requirements, requirements_file) if cache else None
+        if key:
+            def _build(venv_dir: str):
+                _run([base_python, "-m", "venv", venv_dir])
+                _install_requirements(_venv_python_path(venv_dir), requirements, requirements_file)
+
+            meta = {"python": base_python, "requirements": requirements, "requirements_file": requirements_file}
+            venv_dir, release = cache.acquire(key, _build, meta)
+            # Requirements are baked into the cached environment; release marks it evictable again
+            return [_venv_python_path(venv_dir)], release
         tmp_dir = tempfile.mkdtemp(prefix=f"hydra-venv-{job_id}-")
         _run([base_python, "-m", "venv", tmp_dir])
         python_bin = _venv_python_path(tmp_dir)
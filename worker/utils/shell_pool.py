@@ -0,0 +1,287 @@
+import atexit
+import json
+import os
+import secrets
+import selectors
+import shlex
+import shutil
+import signal
+import subprocess
+import tempfile
+import threading
+import time
+from typing import Callable, Dict, List, Optional, Tuple
+
+from ..config import get_shell_pool_idle_seconds, get_shell_pool_size
+from .os_exec import _drain, _merged_env
+
+
+STARTUP_TIMEOUT_SECONDS = 30
+# How long to wait for a killed run's exit frame before giving the shell up
+KILL_GRACE_SECONDS = 10
+
+
+class ShellUnavailable(Exception):
+    """No persistent shell could take the run; nothing ran, so it can run in a fresh shell instead."""
+
+
+class PersistentShell:
+    """
+    A long-lived `bash --login` started once for an (env, workdir) pair. Its stdin takes one
+    command line per run and its stdout only carries control frames prefixed with a random
+    token; the profile is paid for once, at startup.
+
+    Each run sources the script in a background subshell - a fork of the already initialised
+    shell, with job control on so it leads its own process group - with stdin from /dev/null
+    (the shell's own stdin is the command channel) and stdout and stderr redirected into
+    per-run FIFOs that the worker drains. The shell reports the subshell's
+    pid, then `wait`s and reports its exit status, so the script's `exit`, `cd` and
+    variables stay inside the run and a timeout kills exactly the run's process group.
+    """
+
+    def __init__(self, env: Optional[Dict[str, str]], workdir: Optional[str]):
+        self._token = secrets.token_hex(8)
+        self._buf = b""
+        started = time.monotonic()
+        self._proc = subprocess.Popen(
+            ["/bin/bash", "--login", "-s"],
+            stdin=subprocess.PIPE,
+            stdout=subprocess.PIPE,
+            stderr=subprocess.DEVNULL,
+            cwd=workdir,
+            env=_merged_env(env),
+        )
+        self._selector = selectors.DefaultSelector()
+        self._selector.register(self._proc.stdout, selectors.EVENT_READ)
+        try:
+            self._send(f"set -m; printf '%s ready\\n' {self._token}")
+            self._frame("ready", time.monotonic() + STARTUP_TIMEOUT_SECONDS)
+        except Exception as exc:
+            self.close()
+            raise ShellUnavailable(f"persistent shell did not start: {exc}") from exc
+        self.startup_ms = (time.monotonic() - started) * 1000
+        self.last_used = time.monotonic()
+
+    def alive(self) -> bool:
+        return self._proc.poll() is None
+
+    def _send(self, line: str):
+        self._proc.stdin.write((line + "\n").encode())
+        self._proc.stdin.flush()
+
+    def _frame(self, kind: str, deadline: Optional[float]) -> str:
+        """Value of the next `<token> <kind> <value>` line; other output (profile noise) is skipped."""
+        prefix = f"{self._token} {kind}".encode()
+        fd = self._proc.stdout.fileno()
+        while True:
+            while b"\n" in self._buf:
+                line, self._buf = self._buf.split(b"\n", 1)
+                if line.startswith(prefix):
+                    return line[len(prefix):].decode().strip()
+            remaining = None if deadline is None else deadline - time.monotonic()
+            if remaining is not None and remaining <= 0:
+                raise TimeoutError(kind)
+            if not self._selector.select(remaining):
+                raise TimeoutError(kind)
+            data = os.read(fd, 65536)
+            if not data:
+                raise EOFError("persistent shell exited")
+            self._buf += data
+
+    def run(
+        self,
+        script: str,
+        timeout: Optional[int],
+        on_stdout: Optional[Callable[[str], None]] = None,
+        on_stderr: Optional[Callable[[str], None]] = None,
+    ) -> Tuple[int, str, str]:
+        tmp_dir = tempfile.mkdtemp(prefix="hydra-shell-")
+        script_path = os.path.join(tmp_dir, "script.sh")
+        fifos = [os.path.join(tmp_dir, "stdout"), os.path.join(tmp_dir, "stderr")]
+        with open(script_path, "w", encoding="utf-8") as fh:
+            fh.write(script)
+        for fifo in fifos:
+            os.mkfifo(fifo, 0o600)
+        stdout_lines: List[str] = []
+        stderr_lines: List[str] = []
+        threads = [
+            threading.Thread(target=_drain_fifo, args=(fifos[0], stdout_lines, on_stdout), daemon=True),
+            threading.Thread(target=_drain_fifo, args=(fifos[1], stderr_lines, on_stderr), daemon=True),
+        ]
+        for t in threads:
+            t.start()
+        q = shlex.quote
+        try:
+            try:
+                self._send(
+                    f"( . {q(script_path)} ) </dev/null >{q(fifos[0])} 2>{q(fifos[1])} & "
+                    f"printf '%s pid %d\\n' {self._token} $!; wait $!; printf '%s exit %d\\n' {self._token} $?"
+                )
+            except (OSError, ValueError) as exc:
+                self.close()
+                raise ShellUnavailable(str(exc)) from exc
+            try:
+                pid = int(self._frame("pid", time.monotonic() + STARTUP_TIMEOUT_SECONDS))
+            except (EOFError, TimeoutError, ValueError) as exc:
+                # The command line went out, so the script may be running: fail the run rather
+                # than let it be retried in a fresh shell
+                self.kill()
+                pid = None
+                returncode = 1
+                stderr_lines.append(f"persistent shell did not report the run's pid: {exc!r}\n")
+            deadline = time.monotonic() + timeout if timeout and timeout > 0 else None
+            try:
+                if pid is not None:
+                    returncode = int(self._frame("exit", deadline))
+            except TimeoutError:
+                _kill_group(pid)
+                try:
+                    self._frame("exit", time.monotonic() + KILL_GRACE_SECONDS)
+                except (EOFError, TimeoutError):
+                    self.close()
+                # Same as a killed fresh process
+                returncode = -signal.SIGKILL
+            except (EOFError, ValueError):
+                # The script took the shell down with it (e.g. `exec` or killing its parent)
+                _kill_group(pid)
+                self.close()
+                returncode = 1
+                stderr_lines.append("persistent shell exited while the job was running\n")
+        finally:
+            for fifo in fifos:
+                _release_reader(fifo)
+            for t in threads:
+                t.join(timeout=1)
+            shutil.rmtree(tmp_dir, ignore_errors=True)
+        self.last_used = time.monotonic()
+        return returncode, "".join(stdout_lines), "".join(stderr_lines)
+
+    def kill(self):
+        if self._proc.poll() is None:
+            self._proc.kill()
+            self._proc.wait()
+        self._selector.close()
+
+    def close(self):
+        if self._proc.poll() is None:
+            try:
+                self._proc.stdin.close()
+                self._proc.wait(timeout=5)
+            except Exception:
+                self._proc.kill()
+                self._proc.wait()
+        self._selector.close()
+
+
+def _drain_fifo(path: str, sink: List[str], cb: Optional[Callable[[str], None]]):
+    # Blocks until the run's subshell opens the FIFO for writing (or _release_reader does)
+    try:
+        pipe = open(path, "r", errors="replace")
+    except OSError:
+        return
+    _drain(pipe, sink, cb)
+
+
+def _release_reader(path: str):
+    """Unblock a drain still waiting in open() because the run died before its redirects."""
+    try:
+        os.close(os.open(path, os.O_WRONLY | os.O_NONBLOCK))
+    except OSError:
+        pass  # no reader waiting
+
+
+def _kill_group(pid: int):
+    try:
+        os.killpg(pid, signal.SIGKILL)
+    except (ProcessLookupError, PermissionError):
+        try:
+            os.kill(pid, signal.SIGKILL)
+        except ProcessLookupError:
+            pass
+
+
+class ShellPool:
+    """
+    Idle persistent shells per (env, workdir). A run takes an idle shell or starts one and
+    gives it back afterwards; at most WORKER_SHELL_POOL_SIZE idle shells are kept per key, and
+    shells idle longer than WORKER_SHELL_IDLE_SECONDS are closed.
+    """
+
+    def __init__(self):
+        self._idle: Dict[str, List[PersistentShell]] = {}
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def key(env: Optional[Dict[str, str]], workdir: Optional[str]) -> str:
+        return json.dumps({"env": env or {}, "workdir": workdir}, sort_keys=True)
+
+    def run(
+        self,
+        script: str,
+        timeout: Optional[int],
+        env: Optional[Dict[str, str]],
+        workdir: Optional[str],
+        on_stdout: Optional[Callable[[str], None]] = None,
+        on_stderr: Optional[Callable[[str], None]] = None,
+    ) -> Tuple[int, str, str]:
+        """Run on a pooled shell; raises ShellUnavailable when the job should get a fresh shell instead."""
+        self.reap_idle()
+        key = self.key(env, workdir)
+        shell = None
+        with self._lock:
+            idle = self._idle.get(key) or []
+            while idle and shell is None:
+                candidate = idle.pop()
+                if candidate.alive():
+                    shell = candidate
+                else:
+                    candidate.close()
+        if shell is None:
+            shell = PersistentShell(env, workdir)
+        result = shell.run(script, timeout, on_stdout, on_stderr)
+        if shell.alive():
+            with self._lock:
+                idle = self._idle.setdefault(key, [])
+                if len(idle) < get_shell_pool_size():
+                    idle.append(shell)
+                    shell = None
+        if shell is not None:
+            shell.close()
+        return result
+
+    def reap_idle(self, now: Optional[float] = None) -> int:
+        now = time.monotonic() if now is None else now
+        limit = get_shell_pool_idle_seconds()
+        stale = []
+        with self._lock:
+            for key in list(self._idle):
+                keep = []
+                for shell in self._idle[key]:
+                    (stale if now - shell.last_used > limit else keep).append(shell)
+                if keep:
+                    self._idle[key] = keep
+                else:
+                    del self._idle[key]
+        for shell in stale:
+            shell.close()
+        return len(stale)
+
+    def close(self):
+        with self._lock:
+            shells = [shell for idle in self._idle.values() for shell in idle]
+            self._idle = {}
+        for shell in shells:
+            shell.close()
+
+
+_pool: Optional[ShellPool] = None
+_pool_lock = threading.Lock()
+
+
+def get_shell_pool() -> ShellPool:
+    global _pool
+    with _pool_lock:
+        if _pool is None:
+            _pool = ShellPool()
+            atexit.register(_pool.close)
+        return _pool
@@ -0,0 +1,124 @@
+import time
+from typing import Dict, List, Optional
+
+from ..redis_client import get_redis
+from ..config import get_domain, get_steal_min_backlog
+from .events import publish_worker_event
+from .envelope import parse_queue_item
+
+
+# Peers that heartbeated within this window are candidates to steal from
+PEER_TTL_SECONDS = 10
+MAX_VICTIMS = 3
+
+# Move the job at the tail of a peer's queue to the head of ours and carry its reservation
+# along, but only if the tail is still the job we vetted for affinity, the peer still has a
+# backlog, and we are online with a free slot. Returns {victim reserved, own reserved} or nil.
+STEAL_JOB_LUA = """
+if redis.call('LLEN', KEYS[1]) < tonumber(ARGV[2]) then
+    return nil
+end
+if redis.call('LINDEX', KEYS[1], -1) ~= ARGV[1] then
+    return nil
+end
+local state = redis.call('HGET', KEYS[4], 'state') or 'online'
+if state ~= 'online' then
+    return nil
+end
+local max_concurrency = tonumber(redis.call('HGET', KEYS[4], 'max_concurrency') or '1') or 1
+local running = tonumber(redis.call('HGET', KEYS[4], 'current_running') or '0') or 0
+local reserved = tonumber(redis.call('HGET', KEYS[4], 'reserved') or '0') or 0
+if running + reserved >= max_concurrency then
+    return nil
+end
+redis.call('LMOVE', KEYS[1], KEYS[2], 'RIGHT', 'LEFT')
+local victim_reserved = tonumber(redis.call('HGET', KEYS[3], 'reserved') or '0') or 0
+if victim_reserved > 0 then
+    victim_reserved = redis.call('HINCRBY', KEYS[3], 'reserved', -1)
+end
+local own_reserved = redis.call('HINCRBY', KEYS[4], 'reserved', 1)
+redis.call('HINCRBY', KEYS[4], 'stolen_jobs', 1)
+return {victim_reserved, own_reserved}
+"""
+
+_steal_script = None
+
+
+def _split(value) -> List[str]:
+    if isinstance(value, str):
+        return [v for v in value.split(",") if v]
+    return list(value or [])
+
+
+def fits_locally(job: Dict, meta: Dict) -> bool:
+    """The scheduler's affinity rules (scheduler/utils/affinity.py) evaluated against this worker."""
+    affinity = job.get("affinity") or {}
+
+    def one_of(wanted: List[str], have: str) -> bool:
+        return not wanted or (have or "").lower() in {w.lower() for w in wanted}
+
+    tags = {t.lower() for t in _split(meta.get("tags"))}
+    allowed_users = _split(meta.get("allowed_users"))
+    subnets = affinity.get("subnets") or []
+    return (
+        one_of(affinity.get("os") or [], meta.get("os", ""))
+        and all(t.lower() in tags for t in affinity.get("tags") or [])
+        and (not allowed_users or job.get("user", "") in allowed_users)
+        and one_of(affinity.get("hostnames") or [], meta.get("hostname", ""))
+        and (not subnets or meta.get("subnet", "") in subnets)
+        and one_of(affinity.get("deployment_types") or [], meta.get("deployment_type", ""))
+    )
+
+
+def _victims(r, domain: str, worker_id: str, min_backlog: int) -> List[str]:
+    """Live peers with a backlog of at least min_backlog, longest queue first."""
+    peers = [
+        wid
+        for wid in r.zrangebyscore(f"worker_heartbeats:{domain}", time.time() - PEER_TTL_SECONDS, "+inf") or []
+        if wid != worker_id
+    ]
+    if not peers:
+        return []
+    pipe = r.pipeline(transaction=False)
+    for wid in peers:
+        pipe.llen(f"job_queue:{domain}:{wid}")
+    backlogs = [(int(n or 0), wid) for wid, n in zip(peers, pipe.execute()) if int(n or 0) >= min_backlog]
+    return [wid for _, wid in sorted(backlogs, reverse=True)[:MAX_VICTIMS]]
+
+
+def steal_job(db, worker_id: str, meta: Dict) -> Optional[str]:
+    """
+    Called when this worker's own queue is empty: take one job from the tail of the most
+    backlogged live peer whose tail job this worker may run. The job lands at the head of our
+    queue with its reservation, so the normal pop path runs it. Returns the stolen job ID.
+    """
+    global _steal_script
+    min_backlog = get_steal_min_backlog()
+    if min_backlog <= 0:
+        return None
+    r = get_redis()
+    domain = get_domain()
+    if _steal_script is None:
+        _steal_script = r.register_script(STEAL_JOB_LUA)
+    for victim in _victims(r, domain, worker_id, min_backlog):
+        victim_queue = f"job_queue:{domain}:{victim}"
+        item = r.lindex(victim_queue, -1)
+        if not item:
+            continue
+        dispatch = parse_queue_item(item)
+        job_id = dispatch["job_id"]
+        job = dispatch["job"] or db.job_definitions.find_one({"_id": job_id}, {"affinity": 1, "user": 1})
+        if not job or not fits_locally(job, meta):
+            continue
+        moved = _steal_script(
+            keys=[victim_queue, f"job_queue:{domain}:{worker_id}", f"workers:{domain}:{victim}", f"workers:{domain}:{worker_id}"],
+            args=[item, min_backlog],
+        )
+        if not moved:
+            continue
+        victim_reserved, own_reserved = moved
+        publish_worker_event(victim, "running", {"reserved": int(victim_reserved)})
+        publish_worker_event(worker_id, "running", {"reserved": int(own_reserved)})
+        print(f"Stole job {job_id} from worker {victim}")
+        return job_id
+    return None
@@ -0,0 +1,241 @@
+import hashlib
+import json
+import os
+import shutil
+import subprocess
+import threading
+import time
+from contextlib import nullcontext
+from functools import lru_cache
+from typing import Callable, Dict, List, Optional, Tuple
+
+from ..config import get_venv_cache_dir, get_venv_cache_max_bytes, get_venv_cache_max_entries
+
+try:
+    import fcntl
+except ImportError:  # Windows: no advisory locks, builds are still serialised per process
+    fcntl = None
+
+
+READY_MARKER = ".hydra-ready"
+LAST_USED_MARKER = ".hydra-last-used"
+
+_stats = {"hits": 0, "misses": 0, "builds_failed": 0, "evictions": 0, "build_seconds": 0.0}
+_stats_lock = threading.Lock()
+_process_lock = threading.Lock()
+
+
+def _count(name: str, amount=1):
+    with _stats_lock:
+        _stats[name] += amount
+
+
+def cache_stats() -> Dict[str, float]:
+    with _stats_lock:
+        return dict(_stats)
+
+
+class FileLock:
+    """flock-based lock on `path`; shared locks mark an environment in use, exclusive ones build or evict it."""
+
+    def __init__(self, path: str, shared: bool = False):
+        self.path = path
+        self.shared = shared
+        self._fh = None
+
+    def acquire(self, blocking: bool = True) -> bool:
+        self._fh = open(self.path, "a+")
+        if fcntl is None:
+            return True
+        flags = fcntl.LOCK_SH if self.shared else fcntl.LOCK_EX
+        try:
+            fcntl.flock(self._fh.fileno(), flags | (0 if blocking else fcntl.LOCK_NB))
+        except BlockingIOError:
+            self._fh.close()
+            self._fh = None
+            return False
+        return True
+
+    def release(self):
+        if self._fh is None:
+            return
+        if fcntl is not None:
+            fcntl.flock(self._fh.fileno(), fcntl.LOCK_UN)
+        self._fh.close()
+        self._fh = None
+
+    def __enter__(self):
+        self.acquire()
+        return self
+
+    def __exit__(self, *_exc):
+        self.release()
+
+
+@lru_cache(maxsize=32)
+def interpreter_fingerprint(python_bin: str) -> str:
+    """Exact version and platform of an interpreter, so a patch upgrade gets fresh environments."""
+    out = subprocess.run(
+        [python_bin, "-c", "import sys, platform; print(sys.version); print(platform.platform())"],
+        check=True,
+        stdout=subprocess.PIPE,
+        stderr=subprocess.PIPE,
+        text=True,
+    )
+    return out.stdout.strip()
+
+
+def environment_key(python_bin: str, requirements: List[str], requirements_file: Optional[str]) -> Optional[str]:
+    """Content hash of interpreter, requirement list and requirements file; None if the file cannot be read."""
+    digest = hashlib.sha256()
+    digest.update(interpreter_fingerprint(python_bin).encode())
+    digest.update(json.dumps(sorted(r.strip() for r in requirements)).encode())
+    if requirements_file:
+        try:
+            with open(requirements_file, "rb") as fh:
+                digest.update(fh.read())
+        except OSError:
+            return None
+    return digest.hexdigest()[:32]
+
+
+def _dir_size(path: str) -> int:
+    total = 0
+    for root, _dirs, files in os.walk(path):
+        for name in files:
+            try:
+                total += os.lstat(os.path.join(root, name)).st_size
+            except OSError:
+                pass
+    return total
+
+
+class VenvCache:
+    """
+    Worker-local, content-addressed cache of python executor environments.
+
+    Each entry lives in `<cache_dir>/<key>` and is only used once its ready marker exists.
+    Builds take an exclusive file lock per key, so concurrent jobs (or workers sharing the
+    directory) build an environment once; runs hold a shared lock while they use it, and
+    eviction - least recently used first, down to the size and entry limits - skips entries
+    that are locked.
+    """
+
+    def __init__(self, cache_dir: str, max_bytes: int, max_entries: int):
+        self.cache_dir = cache_dir
+        self.max_bytes = max_bytes
+        self.max_entries = max_entries
+
+    def _paths(self, key: str) -> Tuple[str, str]:
+        return os.path.join(self.cache_dir, key), os.path.join(self.cache_dir, f"{key}.lock")
+
+    @staticmethod
+    def _ready(venv_dir: str) -> bool:
+        return os.path.exists(os.path.join(venv_dir, READY_MARKER))
+
+    def acquire(
+        self, key: str, build: Callable[[str], None], meta: Optional[Dict] = None
+    ) -> Tuple[str, Callable[[], None]]:
+        """Return (venv_dir, release) for `key`, building it with `build(venv_dir)` on a miss."""
+        os.makedirs(self.cache_dir, exist_ok=True)
+        venv_dir, lock_path = self._paths(key)
+        if not self._ready(venv_dir):
+            with _process_lock if fcntl is None else nullcontext(), FileLock(lock_path):
+                if not self._ready(venv_dir):
+                    self._build(venv_dir, build, meta)
+                else:
+                    _count("hits")
+        else:
+            _count("hits")
+        in_use = FileLock(lock_path, shared=True)
+        in_use.acquire()
+        if not self._ready(venv_dir):
+            # Evicted between the check and the shared lock; rare enough to simply rebuild
+            in_use.release()
+            return self.acquire(key, build, meta)
+        _touch(os.path.join(venv_dir, LAST_USED_MARKER))
+        return venv_dir, in_use.release
+
+    def _build(self, venv_dir: str, build: Callable[[str], None], meta: Optional[Dict]):
+        _count("misses")
+        shutil.rmtree(venv_dir, ignore_errors=True)  # leftovers of an interrupted build
+        started = time.monotonic()
+        try:
+            build(venv_dir)
+        except Exception:
+            _count("builds_failed")
+            shutil.rmtree(venv_dir, ignore_errors=True)
+            raise
+        elapsed = time.monotonic() - started
+        _count("build_seconds", elapsed)
+        record = {**(meta or {}), "size": _dir_size(venv_dir), "built_at": time.time(), "build_seconds": elapsed}
+        with open(os.path.join(venv_dir, READY_MARKER), "w", encoding="utf-8") as fh:
+            json.dump(record, fh)
+        self.evict(keep=os.path.basename(venv_dir))
+
+    def entries(self) -> List[Dict]:
+        """Ready entries with their size and last use, oldest first."""
+        found = []
+        try:
+            names = os.listdir(self.cache_dir)
+        except OSError:
+            return []
+        for name in names:
+            venv_dir = os.path.join(self.cache_dir, name)
+            marker = os.path.join(venv_dir, READY_MARKER)
+            if name.endswith(".lock") or not os.path.exists(marker):
+                continue
+            try:
+                with open(marker, "r", encoding="utf-8") as fh:
+                    size = int(json.load(fh).get("size", 0))
+            except (OSError, ValueError):
+                size = 0
+            last_used_path = os.path.join(venv_dir, LAST_USED_MARKER)
+            last_used = os.path.getmtime(last_used_path) if os.path.exists(last_used_path) else os.path.getmtime(marker)
+            found.append({"key": name, "size": size, "last_used": last_used})
+        return sorted(found, key=lambda e: e["last_used"])
+
+    def evict(self, keep: Optional[str] = None) -> List[str]:
+        entries = self.entries()
+        total = sum(e["size"] for e in entries)
+        count = len(entries)
+        evicted = []
+        for entry in entries:
+            if total <= self.max_bytes and count <= self.max_entries:
+                break
+            if entry["key"] == keep:
+                continue
+            venv_dir, lock_path = self._paths(entry["key"])
+            lock = FileLock(lock_path)
+            if not lock.acquire(blocking=False):
+                continue  # a run is using it
+            try:
+                os.remove(os.path.join(venv_dir, READY_MARKER))
+                shutil.rmtree(venv_dir, ignore_errors=True)
+            finally:
+                lock.release()
+            total -= entry["size"]
+            count -= 1
+            evicted.append(entry["key"])
+        if evicted:
+            _count("evictions", len(evicted))
+        return evicted
+
+
+def _touch(path: str):
+    with open(path, "a"):
+        os.utime(path, None)
+
+
+_cache: Optional[VenvCache] = None
+
+
+def get_venv_cache() -> Optional[VenvCache]:
+    """The worker's cache, or None when WORKER_VENV_CACHE_DIR is set to an empty string."""
+    global _cache
+    cache_dir = get_venv_cache_dir()
+    if not cache_dir:
+        return None
+    if _cache is None or _cache.cache_dir != cache_dir:
+        _cache = VenvCache(cache_dir, get_venv_cache_max_bytes(), get_venv_cache_max_entries())
+    return _cache
@@ -0,0 +1,276 @@
+import array
+import atexit
+import json
+import os
+import shutil
+import signal
+import socket
+import struct
+import subprocess
+import tempfile
+import threading
+import time
+from typing import Callable, Dict, List, Optional, Tuple
+
+from ..config import get_python_warm_idle_seconds, get_python_warm_preload
+from .os_exec import _merged_env, _start_drain
+from .python_env import prepare_python_command
+
+
+SERVER_SCRIPT = os.path.join(os.path.dirname(os.path.abspath(__file__)), "warm_server.py")
+
+
+class WarmUnavailable(Exception):
+    """The job could not be handed to a fork server; nothing ran, so it can run cold instead."""
+
+
+def _read_line(sock: socket.socket, buf: bytearray) -> str:
+    while b"\n" not in buf:
+        data = sock.recv(4096)
+        if not data:
+            raise EOFError("fork server closed the connection")
+        buf += data
+    line, _, rest = bytes(buf).partition(b"\n")
+    buf[:] = rest
+    return line.decode()
+
+
+class WarmServer:
+    """One fork server (warm_server.py) running under an environment's interpreter with its modules imported."""
+
+    def __init__(self, python_bin: str, modules: List[str], release: Optional[Callable[[], None]]):
+        self.python_bin = python_bin
+        self.modules = modules
+        self._release = release
+        self._dir = tempfile.mkdtemp(prefix="hydra-warm-")
+        self.sock_path = os.path.join(self._dir, "server.sock")
+        started = time.monotonic()
+        try:
+            self._proc = subprocess.Popen(
+                [python_bin, SERVER_SCRIPT, self.sock_path, *modules],
+                stdin=subprocess.PIPE,
+                stdout=subprocess.PIPE,
+                text=True,
+            )
+        except OSError as exc:
+            shutil.rmtree(self._dir, ignore_errors=True)
+            raise WarmUnavailable(str(exc)) from exc
+        if self._proc.stdout.readline().strip() != "ready":
+            self._stop()
+            raise WarmUnavailable(f"fork server for {python_bin} did not start")
+        # What a cold run of this environment pays before user code: interpreter start plus the imports
+        self.startup_ms = (time.monotonic() - started) * 1000
+        self.last_used = time.monotonic()
+        self.active = 0
+
+    def alive(self) -> bool:
+        return self._proc.poll() is None
+
+    def run(
+        self,
+        code: str,
+        args: List[str],
+        timeout: Optional[int],
+        env: Optional[Dict[str, str]],
+        workdir: Optional[str],
+        on_stdout: Optional[Callable[[str], None]] = None,
+        on_stderr: Optional[Callable[[str], None]] = None,
+    ) -> Tuple[int, str, str, float]:
+        """Run `code` in a forked child; returns (returncode, stdout, stderr, startup_ms)."""
+        out_r, out_w = os.pipe()
+        err_r, err_w = os.pipe()
+        sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        buf = bytearray()
+        started = time.monotonic()
+        try:
+            body = json.dumps({"code": code, "args": args, "env": _merged_env(env), "cwd": workdir}).encode()
+            payload = struct.pack("!I", len(body)) + body
+            sock.connect(self.sock_path)
+            sent = sock.sendmsg([payload], [(socket.SOL_SOCKET, socket.SCM_RIGHTS, array.array("i", [out_w, err_w]))])
+            sock.sendall(payload[sent:])
+            pid = int(_read_line(sock, buf).split()[1])
+        except (OSError, EOFError, ValueError, IndexError) as exc:
+            sock.close()
+            os.close(out_r)
+            os.close(err_r)
+            raise WarmUnavailable(str(exc)) from exc
+        finally:
+            os.close(out_w)
+            os.close(err_w)
+        startup_ms = (time.monotonic() - started) * 1000
+
+        stdout_lines: List[str] = []
+        stderr_lines: List[str] = []
+        threads = [
+            _start_drain(os.fdopen(out_r, "r"), stdout_lines, on_stdout),
+            _start_drain(os.fdopen(err_r, "r"), stderr_lines, on_stderr),
+        ]
+        sock.settimeout(timeout if timeout and timeout > 0 else None)
+        try:
+            try:
+                line = _read_line(sock, buf)
+            except socket.timeout:
+                try:
+                    os.kill(pid, signal.SIGKILL)
+                except ProcessLookupError:
+                    pass
+                sock.settimeout(None)
+                line = _read_line(sock, buf)
+            returncode = os.waitstatus_to_exitcode(int(line.split()[1]))
+        except (OSError, EOFError, ValueError, IndexError):
+            # The server died under the run; its child may be gone with it
+            try:
+                os.kill(pid, signal.SIGKILL)
+            except ProcessLookupError:
+                pass
+            returncode = -signal.SIGKILL
+            stderr_lines.append("warm python fork server exited while the job was running\n")
+        finally:
+            sock.close()
+        for t in threads:
+            t.join(timeout=1)
+        return returncode, "".join(stdout_lines), "".join(stderr_lines), startup_ms
+
+    def close(self):
+        self._stop()
+        if self._release:
+            self._release()
+            self._release = None
+
+    def _stop(self):
+        if self._proc.poll() is None:
+            try:
+                self._proc.stdin.close()  # EOF tells the server to stop
+                self._proc.wait(timeout=5)
+            except Exception:
+                self._proc.kill()
+                self._proc.wait()
+        shutil.rmtree(self._dir, ignore_errors=True)
+
+
+class WarmPythonPool:
+    """
+    Per-worker fork servers for python jobs with `warm: true`, one per environment (interpreter,
+    `environment` block and preload modules). The environment comes from prepare_python_command
+    - so from the venv cache when it is enabled - and stays acquired while its server lives; a
+    run is a fork of a server that has already started and imported, instead of a new
+    interpreter. Servers idle for WORKER_PYTHON_WARM_IDLE_SECONDS are stopped.
+    """
+
+    def __init__(self):
+        self._servers: Dict[str, WarmServer] = {}
+        self._key_locks: Dict[str, threading.Lock] = {}
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def _spec(executor: Dict) -> Tuple[str, List[str]]:
+        env_cfg = executor.get("environment") or {}
+        modules = list(dict.fromkeys(get_python_warm_preload() + list(env_cfg.get("preload") or [])))
+        requirements_file = env_cfg.get("requirements_file")
+        try:
+            requirements_mtime = os.path.getmtime(requirements_file) if requirements_file else None
+        except OSError:
+            requirements_mtime = None
+        key = json.dumps(
+            {
+                "interpreter": executor.get("interpreter", "python3"),
+                "environment": env_cfg,
+                "preload": modules,
+                "requirements_mtime": requirements_mtime,
+            },
+            sort_keys=True,
+        )
+        return key, modules
+
+    def _server(self, executor: Dict) -> Tuple[WarmServer, bool]:
+        """The server for the executor's environment and whether it had to be started for this run."""
+        key, modules = self._spec(executor)
+        with self._lock:
+            key_lock = self._key_locks.setdefault(key, threading.Lock())
+        with key_lock:
+            with self._lock:
+                server = self._servers.get(key)
+                if server is not None and server.alive():
+                    # Taken under the pool lock, so reap_idle cannot stop it in between
+                    server.active += 1
+                    return server, False
+            if server is not None:
+                server.close()
+            if (executor.get("environment") or {}).get("type") == "uv":
+                raise WarmUnavailable("uv environments run through `uv run`")
+            command, release = prepare_python_command(executor, "warm-pool")
+            try:
+                server = WarmServer(command[0], modules, release)
+            except Exception:
+                if release:
+                    release()
+                raise
+            with self._lock:
+                self._servers[key] = server
+                server.active += 1
+        return server, True
+
+    def run(
+        self,
+        executor: Dict,
+        code: str,
+        args: List[str],
+        timeout: Optional[int],
+        env: Optional[Dict[str, str]],
+        workdir: Optional[str],
+        on_stdout: Optional[Callable[[str], None]] = None,
+        on_stderr: Optional[Callable[[str], None]] = None,
+        run_info: Optional[dict] = None,
+    ) -> Tuple[int, str, str]:
+        """Run on a warm server; raises WarmUnavailable when the job should run cold instead."""
+        if not hasattr(os, "fork"):
+            raise WarmUnavailable("fork servers need os.fork")
+        self.reap_idle()
+        server, cold = self._server(executor)
+        try:
+            rc, out, err, startup_ms = server.run(code, args, timeout, env, workdir, on_stdout, on_stderr)
+        finally:
+            with self._lock:
+                server.active -= 1
+                server.last_used = time.monotonic()
+        if run_info is not None:
+            run_info.update(
+                python_start_mode="cold" if cold else "warm",
+                # A run that had to start its server also waited for it
+                python_startup_ms=round(startup_ms + (server.startup_ms if cold else 0), 3),
+                python_cold_startup_ms=round(server.startup_ms, 3),
+            )
+        return rc, out, err
+
+    def reap_idle(self, now: Optional[float] = None) -> int:
+        now = time.monotonic() if now is None else now
+        idle_limit = get_python_warm_idle_seconds()
+        with self._lock:
+            idle = [
+                key
+                for key, server in self._servers.items()
+                if server.active == 0 and now - server.last_used > idle_limit
+            ]
+            stopped = [self._servers.pop(key) for key in idle]
+        for server in stopped:
+            server.close()
+        return len(stopped)
+
+    def close(self):
+        with self._lock:
+            servers, self._servers = list(self._servers.values()), {}
+        for server in servers:
+            server.close()
+
+
+_pool: Optional[WarmPythonPool] = None
+_pool_lock = threading.Lock()
+
+
+def get_warm_pool() -> WarmPythonPool:
+    global _pool
+    with _pool_lock:
+        if _pool is None:
+            _pool = WarmPythonPool()
+            atexit.register(_pool.close)
+        return _pool
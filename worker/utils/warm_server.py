@@ -0,0 +1,228 @@
+"""
+Fork server for warm python jobs; runs under the job's environment interpreter, stdlib only.
+
+    <python> warm_server.py <socket_path> [module ...]
+
+Imports the given modules once, prints "ready" and then serves one connection per run on
+the unix socket: a 4-byte length and a JSON header ({code, args, env, cwd}) with the run's
+stdout/stderr pipe ends attached as SCM_RIGHTS. Each request forks a child that behaves
+like `python -c code args...` on those pipes; the server answers "pid <n>" once the child
+exists and "exit <wait status>" once it has been reaped. Closing the connection early
+kills the child; EOF on stdin (the worker went away) stops the server and its children.
+"""
+import array
+import json
+import os
+import selectors
+import signal
+import socket
+import struct
+import sys
+import threading
+import types
+
+FD_COUNT = 2
+
+
+def _recv_request(conn: socket.socket):
+    fds = array.array("i")
+    data, ancdata, _flags, _addr = conn.recvmsg(65536, socket.CMSG_SPACE(FD_COUNT * fds.itemsize))
+    for level, kind, payload in ancdata:
+        if level == socket.SOL_SOCKET and kind == socket.SCM_RIGHTS:
+            fds.frombytes(payload[: len(payload) - (len(payload) % fds.itemsize)])
+    while len(data) < 4:
+        more = conn.recv(65536)
+        if not more:
+            raise EOFError("connection closed during request")
+        data += more
+    (length,) = struct.unpack("!I", data[:4])
+    body = data[4:]
+    while len(body) < length:
+        more = conn.recv(max(length - len(body), 65536))
+        if not more:
+            raise EOFError("connection closed during request")
+        body += more
+    return json.loads(body[:length].decode("utf-8")), list(fds)
+
+
+def _exit_code(exc: SystemExit) -> int:
+    code = exc.code
+    if code is None:
+        return 0
+    if isinstance(code, int):
+        return code
+    sys.stderr.write(f"{code}\n")
+    return 1
+
+
+def _run_child(request: dict, out_fd: int, err_fd: int) -> int:
+    devnull = os.open(os.devnull, os.O_RDONLY)
+    os.dup2(devnull, 0)
+    os.dup2(out_fd, 1)
+    os.dup2(err_fd, 2)
+    for fd in (devnull, out_fd, err_fd):
+        os.close(fd)
+    os.environ.clear()
+    os.environ.update(request.get("env") or {})
+    try:
+        if request.get("cwd"):
+            os.chdir(request["cwd"])
+    except OSError as exc:
+        sys.stderr.write(f"{exc}\n")
+        return 1
+    sys.argv = ["-c", *(request.get("args") or [])]
+    main = types.ModuleType("__main__")
+    main.__dict__["__builtins__"] = __builtins__
+    sys.modules["__main__"] = main
+    code = 0
+    try:
+        exec(compile(request["code"], "<string>", "exec"), main.__dict__)
+    except SystemExit as exc:
+        code = _exit_code(exc)
+    except BaseException:
+        # Report it as `python -c` would, starting at the job's own frames
+        etype, value, tb = sys.exc_info()
+        sys.excepthook(etype, value.with_traceback(tb.tb_next), tb.tb_next)
+        code = 1
+    # Like interpreter shutdown: wait for non-daemon threads, then run atexit handlers
+    for thread in threading.enumerate():
+        if thread is not threading.current_thread() and not thread.daemon:
+            thread.join()
+    try:
+        import atexit
+
+        atexit._run_exitfuncs()
+    except Exception:
+        pass
+    for stream in (sys.stdout, sys.stderr):
+        try:
+            stream.flush()
+        except Exception:
+            pass
+    return code
+
+
+def serve(sock_path: str, modules):
+    # `python -c` puts the working directory first on sys.path, not this script's directory
+    sys.path[0] = ""
+    for name in modules:
+        try:
+            __import__(name)
+        except Exception as exc:
+            sys.stderr.write(f"warm_server: preload of {name} failed: {exc}\n")
+
+    listener = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+    listener.bind(sock_path)
+    listener.listen(128)
+    wake_r, wake_w = socket.socketpair()
+    wake_r.setblocking(False)
+    wake_w.setblocking(False)
+    signal.signal(signal.SIGCHLD, lambda *_: None)
+    signal.set_wakeup_fd(wake_w.fileno())
+
+    selector = selectors.DefaultSelector()
+    selector.register(listener, selectors.EVENT_READ, "accept")
+    selector.register(wake_r, selectors.EVENT_READ, "reap")
+    selector.register(sys.stdin, selectors.EVENT_READ, "stdin")
+    children = {}  # pid -> connection
+
+    sys.stdout.write("ready\n")
+    sys.stdout.flush()
+    while True:
+        for key, _events in selector.select():
+            what = key.data
+            if what == "stdin":
+                if not os.read(sys.stdin.fileno(), 4096):
+                    for pid in children:
+                        _kill(pid)
+                    return
+            elif what == "accept":
+                conn, _ = listener.accept()
+                conn.settimeout(5)
+                try:
+                    request, fds = _recv_request(conn)
+                except Exception as exc:
+                    sys.stderr.write(f"warm_server: bad request: {exc}\n")
+                    conn.close()
+                    continue
+                if len(fds) != FD_COUNT:
+                    for fd in fds:
+                        os.close(fd)
+                    conn.close()
+                    continue
+                sys.stdout.flush()
+                sys.stderr.flush()
+                pid = os.fork()
+                if pid == 0:
+                    code = 1
+                    try:
+                        signal.set_wakeup_fd(-1)
+                        signal.signal(signal.SIGCHLD, signal.SIG_DFL)
+                        selector.close()
+                        for s in (listener, wake_r, wake_w, conn, *children.values()):
+                            s.close()
+                        code = _run_child(request, *fds)
+                    finally:
+                        os._exit(code)
+                for fd in fds:
+                    os.close(fd)
+                children[pid] = conn
+                conn.sendall(f"pid {pid}\n".encode())
+                conn.setblocking(False)
+                selector.register(conn, selectors.EVENT_READ, ("conn", pid))
+            elif what == "reap":
+                try:
+                    while wake_r.recv(4096):
+                        pass
+                except BlockingIOError:
+                    pass
+                _reap(children, selector)
+            else:
+                # The worker closed a connection before its child finished
+                _kind, pid = what
+                try:
+                    data = key.fileobj.recv(1)
+                except BlockingIOError:
+                    continue
+                except OSError:
+                    data = b""
+                if not data:
+                    selector.unregister(key.fileobj)
+                    if pid in children:
+                        _kill(pid)
+        # A SIGCHLD can be coalesced with an earlier one; reaping is cheap
+        _reap(children, selector)
+
+
+def _kill(pid: int):
+    try:
+        os.kill(pid, signal.SIGKILL)
+    except ProcessLookupError:
+        pass
+
+
+def _reap(children: dict, selector: selectors.BaseSelector):
+    while children:
+        try:
+            pid, status = os.waitpid(-1, os.WNOHANG)
+        except ChildProcessError:
+            return
+        if pid == 0:
+            return
+        conn = children.pop(pid, None)
+        if conn is None:
+            continue
+        try:
+            selector.unregister(conn)
+        except (KeyError, ValueError):
+            pass  # already dropped when the worker hung up
+        try:
+            conn.setblocking(True)
+            conn.sendall(f"exit {status}\n".encode())
+        except OSError:
+            pass
+        conn.close()
+
+
+if __name__ == "__main__":
+    serve(sys.argv[1], sys.argv[2:])
@@ -1,10 +1,11 @@
+import asyncio
 import os
 import threading
 import time
 from concurrent.futures import ThreadPoolExecutor
 
 from .mongo_client import get_db
-from .redis_client import get_redis
+from .redis_client import get_redis, get_async_redis
 from .config import (
     get_worker_id,
     get_tags,
@@ -13,11 +14,75 @@ from .config import (
     get_initial_state,
     get_domain,
     get_domain_token,
+    get_prefetch,
+    get_venv_warmup,
+    get_engine,
+    get_async_blocking_threads,
 )
 from .utils.heartbeat import start_heartbeat
-from .utils.concurrency import incr_running, add_active_job, remove_active_job
+from .utils.events import publish_worker_event
+from .utils.concurrency import (
+    incr_running,
+    claim_reserved_slot,
+    release_reserved_slot,
+    add_active_job,
+    remove_active_job,
+)
 from .utils.completion import evaluate_completion
-from .executor import execute_job, record_run_start, record_run_end
+from .utils.leases import acquire_run_lease, attach_run, release_run_lease
+from .utils.stealing import steal_job
+from .utils.envelope import parse_queue_item
+from .utils.log_shipper import AsyncLogShipper, LogShipper
+from .utils.output_store import OutputStore
+from .utils.python_env import warm_up_environments
+from .utils.os_exec import install_child_watcher
+from .executor import execute_job, execute_job_async, record_run_start, record_run_end
+
+
+# Put an item this worker failed to claim back at the head of its queue, but only if it is
+# still in the processing list (not already taken by a committed lease or a reclaim)
+RETURN_ITEM_LUA = """
+if redis.call('LREM', KEYS[1], 1, ARGV[1]) == 0 then
+    return 0
+end
+redis.call('LPUSH', KEYS[2], ARGV[1])
+return 1
+"""
+
+_return_script = None
+
+# Drop the running record only while it is still this run's: a run that took over the job
+# (higher fence) owns it now. Records without a fence fall back to the worker ID.
+END_RUNNING_LUA = """
+local fence = redis.call('HGET', KEYS[1], 'fence')
+if fence then
+    if fence ~= ARGV[1] then
+        return 0
+    end
+elseif redis.call('HGET', KEYS[1], 'worker_id') ~= ARGV[2] then
+    return 0
+end
+return redis.call('DEL', KEYS[1])
+"""
+
+_end_running_script = None
+
+
+def processing_key(domain: str, worker_id: str) -> str:
+    """Reliable-queue list holding jobs this worker popped but has not started yet."""
+    return f"job_processing:{domain}:{worker_id}"
+
+
+def recover_in_flight(worker_id: str) -> int:
+    """Put jobs a previous process popped but never started back at the head of the queue, oldest first."""
+    r = get_redis()
+    domain = get_domain()
+    recovered = 0
+    while r.lmove(processing_key(domain, worker_id), f"job_queue:{domain}:{worker_id}", "RIGHT", "LEFT"):
+        recovered += 1
+    if recovered:
+        print(f"Recovered {recovered} job(s) popped by a previous run of {worker_id}")
+    return recovered
 
 
 def register_worker(worker_id: str, max_concurrency: int):
@@ -54,8 +119,219 @@ def register_worker(worker_id: str, max_concurrency: int):
         "run_user": getpass.getuser(),
         "domain_token_hash": __import__("hashlib").sha256(domain_token.encode()).hexdigest(),
     }
+    # Jobs already queued for this worker were reserved by the scheduler; keep the count honest on restart
+    recover_in_flight(worker_id)
+    meta["reserved"] = r.llen(f"job_queue:{get_domain()}:{worker_id}")
     r.sadd("hydra:domains", get_domain())
     r.hset(f"workers:{get_domain()}:{worker_id}", mapping=meta)
+    publish_worker_event(worker_id, "register", meta)
+    return meta
+
+
+def claim_job(r, db, worker_id: str, item: str, in_flight_key: str):
+    """
+    Turn a popped queue item into (dispatch, job, fence) by taking its run lease, or None when
+    there is nothing to run (definition deleted, or the scheduler reclaimed the item first).
+    """
+    dispatch = parse_queue_item(item)
+    job_id = dispatch["job_id"]
+    try:
+        # Envelopes carry the definition as dispatched; only bare IDs need a read
+        job = dispatch["job"] or db.job_definitions.find_one({"_id": job_id})
+        fence = acquire_run_lease(job, worker_id, claim_from=in_flight_key, item=item) if job else None
+    except Exception as e:
+        print(f"Failed to claim job {job_id}: {e}")
+        return_item(r, worker_id, item, in_flight_key)
+        return None
+    if not job:
+        r.lrem(in_flight_key, 1, item)
+        release_reserved_slot(worker_id)
+        return None
+    if fence is None:
+        # Reclaimed by the scheduler (worker looked offline) before it started; it owns the job now
+        print(f"Job {job_id} was reclaimed before it started; skipping")
+        return None
+    return dispatch, job, fence
+
+
+def return_item(r, worker_id: str, item: str, in_flight_key: str):
+    """
+    Undo a pop that could not be claimed: the item goes back to the head of the worker's queue
+    and keeps its reservation, so a later pop retries it. If it already left the processing
+    list, or Redis is unreachable, the reservation is released instead (in the latter case
+    recover_in_flight requeues the item when the worker restarts).
+    """
+    global _return_script
+    try:
+        if _return_script is None:
+            _return_script = r.register_script(RETURN_ITEM_LUA)
+        if _return_script(keys=[in_flight_key, f"job_queue:{get_domain()}:{worker_id}"], args=[item]):
+            return
+    except Exception as e:
+        print(f"Could not return queue item {item[:80]!r} to the queue: {e}")
+    release_reserved_slot(worker_id)
+
+
+def begin_run(r, worker_id: str, job: dict, fence: int, dispatch: dict) -> str:
+    """Claim the reserved slot, mark the job running and insert its run document; returns the run ID."""
+    domain = get_domain()
+    job_id = dispatch["job_id"]
+    slot_position = claim_reserved_slot(worker_id) - 1
+    add_active_job(worker_id, job_id)
+    r.hset(
+        f"job_running:{domain}:{job_id}",
+        mapping={
+            "worker_id": worker_id,
+            "fence": fence,
+            "heartbeat": time.time(),
+            "user": job.get("user", ""),
+            "domain": domain,
+        },
+    )
+
+    # Create/mark run start
+    retries_remaining = int(job.get("retries", 0))
+    run_id = record_run_start(job, worker_id, slot_position, retries_remaining, fence, dispatch)
+    attach_run(job_id, fence, run_id)
+    return run_id
+
+
+def finish_run(
+    r, job_id: str, run_id: str, fence: int, success: bool, rc: int, attempts_used: int, last_reason: str, output: dict
+):
+    status = "success" if success else "failed"
+    committed = record_run_end(
+        run_id,
+        status,
+        rc,
+        output["stdout"],
+        output["stderr"],
+        attempts_used,
+        last_reason or "criteria not met",
+        fence,
+        output,
+    )
+    if committed:
+        r.hdel(f"job_attempts:{get_domain()}", job_id)
+    else:
+        print(f"Discarded result of job {job_id} run {run_id}: lease (fence {fence}) was superseded")
+
+
+def end_run(r, worker_id: str, job_id: str, fence: int):
+    """Release the run lease and the worker's counters, whatever happened to the run."""
+    global _end_running_script
+    release_run_lease(job_id, fence)
+    if _end_running_script is None:
+        _end_running_script = r.register_script(END_RUNNING_LUA)
+    _end_running_script(keys=[f"job_running:{get_domain()}:{job_id}"], args=[fence, worker_id])
+    remove_active_job(worker_id, job_id)
+    incr_running(worker_id, -1)
+
+
+async def run_asyncio_engine(r, db, worker_id: str, max_concurrency: int, meta: dict, active_jobs: dict, active_jobs_lock):
+    """
+    WORKER_ENGINE=asyncio: every run is a task on one event loop instead of a pool thread.
+    Processes, pipes, timeouts, log shipping and the queue pop are all awaited on the loop;
+    output is buffered on it and stored by the OutputStore writer thread; other Mongo writes,
+    lease scripts and source/env preparation go to a fixed pool of WORKER_ASYNC_THREADS
+    threads. Queue semantics (credits, processing list, run leases, stealing) are the same
+    as the thread engine's.
+    """
+    loop = asyncio.get_running_loop()
+    install_child_watcher(loop)
+    loop.set_default_executor(ThreadPoolExecutor(max_workers=get_async_blocking_threads()))
+    ar = get_async_redis()
+    domain = get_domain()
+    queue_key = f"job_queue:{domain}:{worker_id}"
+    in_flight_key = processing_key(domain, worker_id)
+    credits = asyncio.BoundedSemaphore(max_concurrency + get_prefetch())
+    # Credits bound what is popped; prefetched items wait here for one of max_concurrency slots
+    slots = asyncio.Semaphore(max_concurrency)
+    tasks = set()
+
+    async def run_job(item: str):
+        claimed = await asyncio.to_thread(claim_job, r, db, worker_id, item, in_flight_key)
+        if claimed is None:
+            return
+        dispatch, job, fence = claimed
+        job_id = dispatch["job_id"]
+        shipper = None
+        try:
+            with active_jobs_lock:
+                active_jobs[job_id] = fence
+            run_id = await asyncio.to_thread(begin_run, r, worker_id, job, fence, dispatch)
+
+            shipper = AsyncLogShipper(ar, domain, run_id)
+            store = OutputStore(db, run_id)
+            streamed = {"stdout": 0, "stderr": 0}
+
+            async def on_output(kind: str, text: str):
+                streamed[kind] = streamed.get(kind, 0) + 1
+                # Only buffers; finished chunks are inserted by the output store's writer thread
+                store.write(kind, text)
+                await shipper.write(kind, text)
+
+            attempts = int(job.get("retries", 0)) + 1
+            rc, stdout, stderr = 1, "", ""
+            attempts_used = 0
+            last_reason = ""
+            success = False
+            run_info = {}
+            for _ in range(max(1, attempts)):
+                streamed.update(stdout=0, stderr=0)
+                rc, stdout, stderr = await execute_job_async(
+                    job,
+                    log_callback_out=lambda text: on_output("stdout", text),
+                    log_callback_err=lambda text: on_output("stderr", text),
+                    run_info=run_info,
+                )
+                attempts_used += 1
+                for kind, text in (("stdout", stdout), ("stderr", stderr)):
+                    if text and not streamed[kind]:
+                        await on_output(kind, text)
+                success, last_reason = evaluate_completion(job, rc, stdout, stderr)
+                if success:
+                    break
+
+            if await shipper.close():
+                print(f"Dropped {shipper.dropped} log line(s) of run {run_id} while Redis lagged")
+            output = {**await asyncio.to_thread(store.close), **run_info}
+            await asyncio.to_thread(finish_run, r, job_id, run_id, fence, success, rc, attempts_used, last_reason, output)
+        finally:
+            if shipper is not None:
+                await shipper.close()
+            await asyncio.to_thread(end_run, r, worker_id, job_id, fence)
+            with active_jobs_lock:
+                if active_jobs.get(job_id) == fence:
+                    active_jobs.pop(job_id, None)
+
+    async def run_with_credit(item: str):
+        try:
+            async with slots:
+                await run_job(item)
+        except Exception as exc:
+            print(f"Run of queue item {item[:80]!r} failed: {exc}")
+        finally:
+            credits.release()
+
+    print(f"Worker {worker_id} starting asyncio engine with max_concurrency={max_concurrency}")
+    while True:
+        try:
+            await asyncio.wait_for(credits.acquire(), 2)
+        except asyncio.TimeoutError:
+            continue
+        item = await ar.blmove(queue_key, in_flight_key, 2, "LEFT", "RIGHT")
+        if not item:
+            credits.release()
+            with active_jobs_lock:
+                idle = len(active_jobs) < max_concurrency
+            if idle:
+                await asyncio.to_thread(steal_job, db, worker_id, meta)
+            continue
+        task = asyncio.create_task(run_with_credit(item))
+        # The loop only keeps weak references to tasks
+        tasks.add(task)
+        task.add_done_callback(tasks.discard)
 
 
 def worker_main():
@@ -64,59 +340,52 @@ def worker_main():
     worker_id = get_worker_id()
     max_concurrency = get_max_concurrency()
     domain = get_domain()
-    register_worker(worker_id, max_concurrency)
+    meta = register_worker(worker_id, max_concurrency)
 
-    active_jobs = set()
+    # job_id -> fencing token of the run lease this worker holds
+    active_jobs = {}
     active_jobs_lock = threading.Lock()
 
     def get_active_jobs():
         with active_jobs_lock:
-            return list(active_jobs)
+            return dict(active_jobs)
 
     start_heartbeat(worker_id, get_active_jobs)
+    warmup = get_venv_warmup()
+    if warmup:
+        threading.Thread(target=warm_up_environments, args=(warmup,), daemon=True).start()
+
+    if get_engine() == "asyncio":
+        asyncio.run(run_asyncio_engine(r, db, worker_id, max_concurrency, meta, active_jobs, active_jobs_lock))
+        return
 
     executor = ThreadPoolExecutor(max_workers=max_concurrency)
+    queue_key = f"job_queue:{domain}:{worker_id}"
+    in_flight_key = processing_key(domain, worker_id)
+    # One credit per free slot plus the prefetch allowance; a job is only popped with a credit in hand
+    credits = threading.BoundedSemaphore(max_concurrency + get_prefetch())
 
-    def run_job(job_id: str):
+    def run_job(item: str):
+        claimed = claim_job(r, db, worker_id, item, in_flight_key)
+        if claimed is None:
+            return
+        dispatch, job, fence = claimed
+        job_id = dispatch["job_id"]
+        shipper = None
         try:
-            job = db.job_definitions.find_one({"_id": job_id})
-            if not job:
-                return
             with active_jobs_lock:
-                active_jobs.add(job_id)
-            slot_position = incr_running(worker_id, +1) - 1
-            add_active_job(worker_id, job_id)
-            r.hset(
-                f"job_running:{domain}:{job_id}",
-                mapping={"worker_id": worker_id, "heartbeat": time.time(), "user": job.get("user", ""), "domain": domain},
-            )
-
-            # Create/mark run start
-            retries_remaining = int(job.get("retries", 0))
-            run_id = record_run_start(job, worker_id, slot_position, retries_remaining)
-
-            def stream_log(kind: str, chunk: str):
-                if not chunk:
-                    return
-                payload = {
-                    "run_id": run_id,
-                    "job_id": job_id,
-                    "worker_id": worker_id,
-                    "domain": domain,
-                    "ts": time.time(),
-                    "text": chunk,
-                    "stream": kind,
-                }
-                import json
-
-                data = json.dumps(payload)
-                channel = f"log_stream:{domain}:{run_id}"
-                history_key = f"log_stream:{domain}:{run_id}:history"
-                r.rpush(history_key, data)
-                r.ltrim(history_key, -400, -1)
-                r.publish(channel, data)
-                r.expire(history_key, 3600)
-                r.expire(channel, 3600)
+                active_jobs[job_id] = fence
+            run_id = begin_run(r, worker_id, job, fence, dispatch)
+
+            shipper = LogShipper(r, domain, run_id)
+            store = OutputStore(db, run_id)
+
+            streamed = {"stdout": 0, "stderr": 0}
+
+            def on_output(kind: str, text: str):
+                streamed[kind] = streamed.get(kind, 0) + 1
+                store.write(kind, text)
+                shipper.write(kind, text)
 
             # Execute with retries
             attempts = int(job.get("retries", 0)) + 1
@@ -126,33 +395,57 @@ def worker_main():
             attempts_used = 0
             last_reason = ""
             success = False
+            run_info = {}
             for _ in range(max(1, attempts)):
+                streamed.update(stdout=0, stderr=0)
                 rc, stdout, stderr = execute_job(
                     job,
-                    log_callback_out=lambda text: stream_log("stdout", text),
-                    log_callback_err=lambda text: stream_log("stderr", text),
+                    log_callback_out=lambda text: on_output("stdout", text),
+                    log_callback_err=lambda text: on_output("stderr", text),
+                    run_info=run_info,
                 )
                 attempts_used += 1
+                # Failures before the process starts (source fetch, env prep) come back without streaming
+                for kind, text in (("stdout", stdout), ("stderr", stderr)):
+                    if text and not streamed[kind]:
+                        on_output(kind, text)
                 success, last_reason = evaluate_completion(job, rc, stdout, stderr)
                 if success:
                     break
 
-            status = "success" if success else "failed"
-            record_run_end(run_id, status, rc, stdout, stderr, attempts_used, last_reason or "criteria not met")
+            # Ship the tail and the end marker before the run turns terminal, so log readers see everything
+            if shipper.close():
+                print(f"Dropped {shipper.dropped} log line(s) of run {run_id} while Redis lagged")
+            # Full output lives in job_run_chunks; the run document keeps head/tail summaries
+            output = {**store.close(), **run_info}
+            finish_run(r, job_id, run_id, fence, success, rc, attempts_used, last_reason, output)
         finally:
-            r.delete(f"job_running:{domain}:{job_id}")
-            remove_active_job(worker_id, job_id)
-            incr_running(worker_id, -1)
+            if shipper is not None:
+                shipper.close()
+            end_run(r, worker_id, job_id, fence)
             with active_jobs_lock:
-                active_jobs.discard(job_id)
+                if active_jobs.get(job_id) == fence:
+                    active_jobs.pop(job_id, None)
+
+    def run_with_credit(item: str):
+        try:
+            run_job(item)
+        finally:
+            credits.release()
 
     print(f"Worker {worker_id} starting with max_concurrency={max_concurrency}")
     while True:
-        item = r.blpop([f"job_queue:{domain}:{worker_id}"], timeout=2)
+        if not credits.acquire(timeout=2):
+            continue
+        # Reliable handoff: the job stays in the processing list until its run lease takes over
+        item = r.blmove(queue_key, in_flight_key, 2, "LEFT", "RIGHT")
         if not item:
+            credits.release()
+            # Idle: pull a job from a backlogged peer; the next pop picks it up
+            if len(get_active_jobs()) < max_concurrency:
+                steal_job(db, worker_id, meta)
             continue
-        _, job_id = item
-        executor.submit(run_job, job_id)
+        executor.submit(run_with_credit, item)
 
 
 if __name__ == "__main__":